@@ -0,0 +1,55 @@
+"""
+Comparison of two benchmark result files.
+"""
+import json
+
+
+def metric(value, unit, better, exact=False):
+    """
+    One benchmark measurement.
+
+    :param better: ``"lower"`` or ``"higher"``.
+    :param exact: Deterministic metric (e.g. a query count): any change for the
+        worse is a regression, whatever the tolerance.
+    """
+    return {"value": value, "unit": unit, "better": better, "exact": exact}
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def relative_change(current, previous):
+    if previous == 0:
+        return 0.0 if current == 0 else float("inf")
+    return (current - previous) / abs(previous)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare the metrics of two runs.
+
+    :param tolerance: Allowed relative worsening of timing metrics (0.25 = 25%).
+    :return: ``(rows, regressions)``: one ``(name, previous, current, change,
+        regressed)`` row per metric present in both runs, and the regressed rows.
+    """
+    rows = []
+    for name, current in results["metrics"].items():
+        previous = baseline.get("metrics", {}).get(name)
+        if previous is None:
+            continue
+        change = relative_change(current["value"], previous["value"])
+        worse = change if current["better"] == "lower" else -change
+        allowed = 0.0 if current.get("exact") else tolerance
+        rows.append((name, previous["value"], current["value"], change, worse > allowed))
+    return rows, [row for row in rows if row[4]]
+
+
+def format_comparison(rows):
+    width = max((len(row[0]) for row in rows), default=0)
+    lines = []
+    for name, previous, current, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        lines.append(f"{name:<{width}}  {previous:>12.4g} -> {current:<12.4g} {change:+8.1%}{flag}")
+    return "\n".join(lines)
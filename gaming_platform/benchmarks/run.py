@@ -0,0 +1,303 @@
+"""
+Offline benchmark suite.
+
+Starts a local API stub serving recorded payloads, runs the app against a
+throwaway SQLite database and measures:
+
+- latency percentiles of ``player_stats_view`` (first visit, cached proofs and
+  uncached proofs) and the queries each request runs,
+- ingest throughput of ``fetch_clashroyale_data`` and the queries per player,
+- proof generation rate, uncached and from the proof cache,
+- battle analytics rows/s, vectorized and per ORM object.
+
+Run from the directory holding ``manage.py``::
+
+    python -m benchmarks.run --output baseline.json
+    python -m benchmarks.run --baseline baseline.json
+
+With ``--baseline`` the run exits with status 1 if any metric regressed.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+from pathlib import Path
+
+from .compare import compare, format_comparison, load_results, metric
+from .stub import StubAPI
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite.")
+    parser.add_argument("--output", default="benchmark-results.json", help="Where to write the results (JSON)")
+    parser.add_argument("--baseline", help="Results of an earlier run; regressions fail this run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown of timing metrics")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Latency of every stub API response")
+    parser.add_argument("--jitter-ms", type=float, default=5.0, help="Extra random stub latency, up to this much")
+    parser.add_argument("--players", type=int, default=100, help="Players ingested by fetch_clashroyale_data")
+    parser.add_argument("--workers", type=int, default=4, help="fetch_clashroyale_data worker threads")
+    parser.add_argument("--requests", type=int, default=200, help="player_stats_view requests per scenario")
+    parser.add_argument("--first-visits", type=int, default=20, help="player_stats_view requests for unknown players")
+    parser.add_argument("--proof-rounds", type=int, default=5, help="Proof generation passes over every player")
+    parser.add_argument("--analytics-rounds", type=int, default=3, help="Battle analytics passes over every battle")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the stub latency jitter")
+    return parser.parse_args(argv)
+
+
+def setup_django(stub_url, workdir):
+    """
+    Point the app at the stub and create a throwaway database in ``workdir``.
+    """
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gaming_platform.settings")
+    os.environ.setdefault("CLASH_ROYALE_API_TOKEN", "benchmark")
+    os.environ["CLASH_ROYALE_API_BASE_URL"] = stub_url
+    # The stub does not rate limit, and nothing may be shared with a real deployment
+    os.environ["CLASH_ROYALE_RATE_LIMIT"] = "0"
+    os.environ["CLASH_ROYALE_RATE_LIMIT_DB"] = str(workdir / "ratelimit.sqlite3")
+    os.environ["CLASH_ROYALE_CACHE_BACKEND"] = "django.core.cache.backends.locmem.LocMemCache"
+    os.environ["CLASH_ROYALE_SINGLEFLIGHT_LOCK_DIR"] = ""
+    os.environ["CLASH_ROYALE_PROOF_CACHE_PERSIST"] = "False"
+
+    import django
+
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment(debug=False)
+    connection.settings_dict["TEST"]["NAME"] = str(workdir / "benchmark.sqlite3")
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    # Per-request logging would dominate the timings
+    logging.getLogger("clashroyale").setLevel(logging.ERROR)
+
+
+def percentiles(prefix, samples, unit="ms"):
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        f"{prefix}.p50_{unit}": metric(round(cuts[49], 3), unit, "lower"),
+        f"{prefix}.p95_{unit}": metric(round(cuts[94], 3), unit, "lower"),
+        f"{prefix}.p99_{unit}": metric(round(cuts[98], 3), unit, "lower"),
+    }
+
+
+def timed_requests(client, urls, before_each=None):
+    """
+    GET each url; return the latencies (ms) and the most queries any request ran.
+    """
+    from clashroyale.services.query_budget import QueryBudget
+
+    latencies, max_queries = [], 0
+    for url in urls:
+        if before_each is not None:
+            before_each()
+        with QueryBudget() as budget:
+            started = time.perf_counter()
+            response = client.get(url)
+            latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200 or "error" in (response.context or {}):
+            raise RuntimeError(f"{url} failed: {response.status_code} {(response.context or {}).get('error')}")
+        max_queries = max(max_queries, budget.count)
+    return latencies, max_queries
+
+
+def player_url(tag):
+    from urllib.parse import urlencode
+
+    return "/player-stats/?" + urlencode({"player_tag": tag})
+
+
+def bench_ingest(tags, workers, workdir):
+    """
+    ``fetch_clashroyale_data`` over ``tags``; then the queries of storing one
+    new player and of refreshing it unchanged.
+    """
+    from django.core.management import call_command
+
+    from clashroyale.models import BattleLog
+    from clashroyale.services.query_budget import QueryBudget
+    from clashroyale.services.sync import fetch_player_bundle, store_player_bundle
+
+    tag_file = workdir / "tags.txt"
+    tag_file.write_text("\n".join(tags) + "\n")
+    battles_before = BattleLog.objects.count()
+    started = time.perf_counter()
+    call_command("fetch_clashroyale_data", tag_file=str(tag_file), workers=workers, stdout=StringIO())
+    elapsed = time.perf_counter() - started
+    battles = BattleLog.objects.count() - battles_before
+
+    bundle = fetch_player_bundle("#BENCHNEW")[:3]
+    with QueryBudget() as new_player:
+        store_player_bundle(*bundle)
+    with QueryBudget() as unchanged:
+        store_player_bundle(*bundle)
+
+    return {
+        "ingest.players_per_second": metric(round(len(tags) / elapsed, 2), "players/s", "higher"),
+        "ingest.battles_per_second": metric(round(battles / elapsed, 2), "battles/s", "higher"),
+        "ingest.queries_per_new_player": metric(new_player.count, "queries", "lower", exact=True),
+        "ingest.queries_per_unchanged_refresh": metric(unchanged.count, "queries", "lower", exact=True),
+    }
+
+
+def bench_player_stats_view(tag, first_visit_tags, requests):
+    from django.test import Client
+
+    from clashroyale.services.proof_cache import get_proof_cache
+
+    client = Client()
+    results = {}
+
+    # Unknown players: fetched from the stub inline
+    latencies, queries = timed_requests(client, [player_url(tag) for tag in first_visit_tags])
+    results.update(percentiles("player_stats_view.first_visit", latencies))
+    results["player_stats_view.first_visit.queries"] = metric(queries, "queries", "lower", exact=True)
+
+    # Stored player, proofs recomputed for every request
+    cache = get_proof_cache()
+    latencies, queries = timed_requests(client, [player_url(tag)] * requests, before_each=cache.clear)
+    results.update(percentiles("player_stats_view.uncached_proofs", latencies))
+    results["player_stats_view.uncached_proofs.queries"] = metric(queries, "queries", "lower", exact=True)
+
+    # Stored player, proofs from the proof cache
+    client.get(player_url(tag))
+    latencies, queries = timed_requests(client, [player_url(tag)] * requests)
+    results.update(percentiles("player_stats_view.cached_proofs", latencies))
+    results["player_stats_view.cached_proofs.queries"] = metric(queries, "queries", "lower", exact=True)
+    return results
+
+
+def bench_proofs(tags, rounds):
+    from clashroyale.models import Player
+    from clashroyale.services.proof_cache import challenge_proofs, get_proof_cache, trophy_proof, win_loss_proof
+    from clashroyale.services.sync import current_challenges
+    from clashroyale.services.verification import ChallengeVerification, TrophyVerification, WinLossVerification
+
+    rounds = max(1, rounds)
+    challenge_ids = [challenge.id for challenge in current_challenges()]
+    players = list(Player.objects.filter(tag__in=tags))
+    per_player = 2 + len(challenge_ids)
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for player in players:
+            TrophyVerification.generate_trophy_proof(player.tag, 8000)
+            WinLossVerification.generate_win_loss_proof(player.tag, 60.0)
+            ChallengeVerification.generate_challenge_proofs(player.tag, challenge_ids)
+    uncached = rounds * len(players) * per_player / (time.perf_counter() - started)
+
+    get_proof_cache().clear()
+    for pass_number in range(rounds + 1):
+        if pass_number == 1:
+            # The first pass only fills the cache
+            started = time.perf_counter()
+        for player in players:
+            trophy_proof(player, 8000)
+            win_loss_proof(player, 60.0)
+            challenge_proofs(player, challenge_ids)
+    cached = rounds * len(players) * per_player / (time.perf_counter() - started)
+
+    return {
+        "proofs.per_second": metric(round(uncached, 1), "proofs/s", "higher"),
+        "proofs.cached_per_second": metric(round(cached, 1), "proofs/s", "higher"),
+    }
+
+
+def bench_analytics(rounds):
+    """
+    Battle analytics over every stored battle: NumPy (``services/analytics.py``)
+    and the row-by-row computation over ORM objects it replaces.
+    """
+    from clashroyale.management.commands.battle_analytics import per_object_reports
+    from clashroyale.services.analytics import battle_report, load_battles
+
+    rounds = max(1, rounds)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        frame = load_battles()
+        battle_report(frame)
+    vectorized = rounds * len(frame) / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        per_object_reports(None, 10)
+    per_object = rounds * len(frame) / (time.perf_counter() - started)
+
+    return {
+        "analytics.rows_per_second": metric(round(vectorized), "rows/s", "higher"),
+        "analytics.per_object_rows_per_second": metric(round(per_object), "rows/s", "higher"),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    tags = [f"#BENCH{i:05d}" for i in range(args.players)]
+    first_visit_tags = [f"#VISIT{i:05d}" for i in range(args.first_visits)]
+
+    with tempfile.TemporaryDirectory() as workdir, StubAPI(args.latency_ms, args.jitter_ms, args.seed) as stub:
+        workdir = Path(workdir)
+        setup_django(stub.url, workdir)
+
+        import django
+
+        metrics = {}
+        metrics.update(bench_ingest(tags, args.workers, workdir))
+        metrics.update(bench_player_stats_view(tags[0], first_visit_tags, args.requests))
+        metrics.update(bench_proofs(tags, args.proof_rounds))
+        metrics.update(bench_analytics(args.analytics_rounds))
+        stub_requests = stub.requests
+
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "created_at": datetime.now(dt_timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "stub_requests": stub_requests,
+        },
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "metrics": metrics,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+        f.write("\n")
+
+    width = max(len(name) for name in metrics)
+    for name, value in metrics.items():
+        print(f"{name:<{width}}  {value['value']:>12.4g} {value['unit']}")
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        baseline = load_results(args.baseline)
+        if baseline.get("config") != results["config"]:
+            print("Warning: the baseline was run with different options; timings may not be comparable.", file=sys.stderr)
+        rows, regressions = compare(results, baseline, args.tolerance)
+        print(f"\nCompared with {args.baseline} (tolerance {args.tolerance:.0%} on timings):")
+        print(format_comparison(rows))
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed.", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Local stand-in for the Clash Royale API, serving recorded payloads.
+
+Every player tag gets the recorded player and battle log with the tag
+rewritten, so any number of distinct players can be ingested. Responses carry
+an ETag and honour ``If-None-Match`` like the real API.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+# Tags used in the recorded payloads
+RECORDED_PLAYER_TAG = "#9CQ2U8QJ"
+RECORDED_CLAN_TAG = "#LQ8Y2PGV"
+
+
+def load_fixture(name):
+    return (FIXTURES_DIR / f"{name}.json").read_text()
+
+
+class StubAPI:
+    """
+    Threaded HTTP server answering ``/players/{tag}``, ``/players/{tag}/battlelog``,
+    ``/clans/{tag}`` and ``/challenges``.
+
+    :param latency_ms: Delay added to every response.
+    :param jitter_ms: Extra uniformly random delay (seeded, so runs are repeatable).
+    """
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, seed=0):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.random = random.Random(seed)
+        self.fixtures = {name: load_fixture(name) for name in ("player", "clan", "battlelog", "challenges")}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def delay(self):
+        with self._lock:
+            self.requests += 1
+            jitter = self.random.uniform(0, self.jitter) if self.jitter else 0.0
+        return self.latency + jitter
+
+    def payload(self, path):
+        """
+        Return the JSON body for ``path``, or None if the path is unknown.
+        """
+        parts = [urllib.parse.unquote(part) for part in path.strip("/").split("/")]
+        if parts == ["challenges"]:
+            return self.fixtures["challenges"]
+        if len(parts) == 2 and parts[0] == "clans":
+            return self.fixtures["clan"]
+        if parts[0] == "players" and len(parts) == 2:
+            return self.fixtures["player"].replace(RECORDED_PLAYER_TAG, parts[1].upper())
+        if parts[0] == "players" and parts[2:] == ["battlelog"]:
+            return self.fixtures["battlelog"].replace(RECORDED_PLAYER_TAG, parts[1].upper())
+        return None
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                time.sleep(stub.delay())
+                body = stub.payload(urllib.parse.urlsplit(self.path).path)
+                if body is None:
+                    self.respond(404, json.dumps({"reason": "notFound"}).encode())
+                    return
+                body = body.encode()
+                etag = f'"{hashlib.md5(body).hexdigest()}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.respond(304, b"", etag)
+                else:
+                    self.respond(200, body, etag)
+
+            def respond(self, status, body, etag=None):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                if etag:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
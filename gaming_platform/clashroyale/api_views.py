@@ -0,0 +1,322 @@
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework import generics
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .models import BattleLog, Challenge, Clan, Player, PlayerSyncState
+from .serializers import BattleLogSerializer, ChallengeSerializer, ClanSerializer, PlayerSerializer
+from .services.archive import archive_updated_at, archived_until
+from .services.attestation import attest_proofs
+from .services.leaderboard import get_leaderboard
+from .services.proof_cache import CHALLENGE, TROPHY, WIN_LOSS, challenge_proofs, trophy_proof, win_loss_proof
+from .services.sync import current_challenges, latest_challenge_sync
+from .services.trophy_history import trophy_history
+
+logger = logging.getLogger(__name__)
+
+# Everything here is served from the database; nothing calls the upstream API.
+
+
+def normalize_tag(tag):
+    """
+    Accept tags with or without the leading '#' (which clients would have to escape in URLs).
+    """
+    tag = tag.upper()
+    return tag if tag.startswith("#") else f"#{tag}"
+
+
+def make_etag(request, *version):
+    """
+    Strong ETag over a resource's version, the full request path and the
+    Accept header, so each cursor page, sparse field selection and renderer
+    gets its own validator.
+    """
+    key = (version, request.get_full_path(), request.META.get("HTTP_ACCEPT", ""))
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+def player_version(request, tag):
+    """
+    ``(data_version, last_synced_at)`` of a stored player, or None.
+
+    One indexed lookup, remembered on the request so the ETag and
+    Last-Modified checks share it.
+    """
+    if not hasattr(request, "_player_version"):
+        request._player_version = (
+            Player.objects.filter(tag=normalize_tag(tag)).values_list("data_version", "last_synced_at").first()
+        )
+    return request._player_version
+
+
+def player_etag(request, tag):
+    version = player_version(request, tag)
+    return make_etag(request, "player", *version) if version else None
+
+
+def player_last_modified(request, tag):
+    version = player_version(request, tag)
+    return version[1] if version else None
+
+
+def battles_etag(request, tag):
+    # data_version is bumped whenever new battles are ingested or archived
+    version = player_version(request, tag)
+    return make_etag(request, "battles", version[0]) if version else None
+
+
+def battles_last_modified(request, tag):
+    # Archiving removes battles from the list, so it counts as a modification
+    moments = [
+        PlayerSyncState.objects.filter(player_tag=normalize_tag(tag))
+        .values_list("last_battle_time", flat=True)
+        .first(),
+        archive_updated_at(),
+    ]
+    return max((moment for moment in moments if moment), default=None)
+
+
+def proofs_etag(request, tag):
+    version = player_version(request, tag)
+    return make_etag(request, "proofs", version[0], latest_challenge_sync()) if version else None
+
+
+def clan_etag(request, tag):
+    row = Clan.objects.filter(tag=normalize_tag(tag)).values_list(
+        "name", "description", "badge_id", "clan_score", "members_count"
+    ).first()
+    return make_etag(request, "clan", *row) if row else None
+
+
+def challenges_version(request, challenge_id=None):
+    if not hasattr(request, "_challenges_version"):
+        challenges = Challenge.objects.all() if challenge_id is None else Challenge.objects.filter(id=challenge_id)
+        request._challenges_version = challenges.aggregate(latest=Max("synced_at"), count=Count("id"))
+    return request._challenges_version
+
+
+def challenges_etag(request, challenge_id=None):
+    version = challenges_version(request, challenge_id)
+    return make_etag(request, "challenges", version["latest"], version["count"]) if version["count"] else None
+
+
+def challenges_last_modified(request, challenge_id=None):
+    return challenges_version(request, challenge_id)["latest"]
+
+
+class BattleCursorPagination(CursorPagination):
+    """
+    Keyset pagination over ``BattleLog(player_tag, timestamp)``: each page is
+    an index range scan from the cursor instead of an OFFSET.
+    """
+
+    ordering = "-timestamp"
+    page_size = 25
+    page_size_query_param = "limit"
+    max_page_size = 100
+
+
+class TagCursorPagination(CursorPagination):
+    ordering = "tag"
+    page_size = 50
+    page_size_query_param = "limit"
+    max_page_size = 200
+
+
+@method_decorator(condition(etag_func=player_etag, last_modified_func=player_last_modified), name="dispatch")
+class PlayerDetailAPIView(generics.RetrieveAPIView):
+    serializer_class = PlayerSerializer
+
+    def get_object(self):
+        player = Player.objects.filter(tag=normalize_tag(self.kwargs["tag"])).first()
+        if player is None:
+            raise NotFound("Player not found.")
+        return player
+
+
+class PlayerListAPIView(generics.ListAPIView):
+    queryset = Player.objects.all()
+    serializer_class = PlayerSerializer
+    pagination_class = TagCursorPagination
+
+
+@method_decorator(condition(etag_func=battles_etag, last_modified_func=battles_last_modified), name="dispatch")
+class PlayerBattleListAPIView(generics.ListAPIView):
+    serializer_class = BattleLogSerializer
+    pagination_class = BattleCursorPagination
+
+    def get_queryset(self):
+        return BattleLog.objects.filter(player_tag=normalize_tag(self.kwargs["tag"]))
+
+    def list(self, request, *args, **kwargs):
+        # The list reads BattleLog only; tell clients where archived battles begin to be missing
+        response = super().list(request, *args, **kwargs)
+        until = archived_until()
+        if until:
+            response["X-Archived-Until"] = until.isoformat()
+        return response
+
+
+@method_decorator(condition(etag_func=proofs_etag), name="dispatch")
+class PlayerProofsAPIView(APIView):
+    """
+    Trophy, win/loss and current-challenge proofs for a stored player, from
+    the proof cache. ``?attest=1`` adds signed attestations of every proof.
+    """
+
+    def get(self, request, tag):
+        player = Player.objects.filter(tag=normalize_tag(tag)).first()
+        if player is None:
+            raise NotFound("Player not found.")
+        try:
+            trophy_threshold = int(request.query_params.get("trophy_threshold", 8000))
+            win_loss_threshold = float(request.query_params.get("win_loss_threshold", 60.0))
+        except ValueError:
+            raise ValidationError("Thresholds must be numbers.")
+
+        proofs = {
+            "trophy_proof": trophy_proof(player, threshold=trophy_threshold),
+            "win_loss_proof": win_loss_proof(player, threshold=win_loss_threshold),
+        }
+        challenge_ids = [challenge.id for challenge in current_challenges()]
+        player_challenge_proofs = challenge_proofs(player, challenge_ids)
+        data = {
+            "player_tag": player.tag,
+            "data_version": player.data_version,
+            **proofs,
+            "challenges": [
+                {"challenge_id": challenge_id, "proof": proof} for challenge_id, proof in player_challenge_proofs.items()
+            ],
+        }
+
+        if request.query_params.get("attest"):
+            items = [
+                (TROPHY, player.tag, trophy_threshold, proofs["trophy_proof"]),
+                (WIN_LOSS, player.tag, win_loss_threshold, proofs["win_loss_proof"]),
+            ] + [(CHALLENGE, player.tag, challenge_id, proof) for challenge_id, proof in player_challenge_proofs.items()]
+            try:
+                data["attestations"] = attest_proofs(items)
+            except ImproperlyConfigured as e:
+                raise ValidationError(str(e))
+        return Response(data)
+
+
+@method_decorator(condition(etag_func=clan_etag), name="dispatch")
+class ClanDetailAPIView(generics.RetrieveAPIView):
+    serializer_class = ClanSerializer
+
+    def get_object(self):
+        clan = Clan.objects.filter(tag=normalize_tag(self.kwargs["tag"])).first()
+        if clan is None:
+            raise NotFound("Clan not found.")
+        return clan
+
+
+@method_decorator(condition(etag_func=challenges_etag, last_modified_func=challenges_last_modified), name="dispatch")
+class ChallengeListAPIView(generics.ListAPIView):
+    """
+    Challenges from the latest ``/challenges`` sync (``?all=1`` for every stored challenge).
+    """
+
+    serializer_class = ChallengeSerializer
+
+    def get_queryset(self):
+        challenges = Challenge.objects.select_related("game_mode").prefetch_related("prizes")
+        if self.request.query_params.get("all"):
+            return challenges.order_by("id")
+        latest = latest_challenge_sync()
+        return challenges.filter(synced_at=latest).order_by("id") if latest else challenges.none()
+
+
+@method_decorator(condition(etag_func=challenges_etag, last_modified_func=challenges_last_modified), name="dispatch")
+class ChallengeDetailAPIView(generics.RetrieveAPIView):
+    serializer_class = ChallengeSerializer
+    queryset = Challenge.objects.select_related("game_mode").prefetch_related("prizes")
+    lookup_url_kwarg = "challenge_id"
+
+
+def int_param(request, name, default, maximum):
+    try:
+        value = int(request.query_params.get(name, default))
+    except ValueError:
+        raise ValidationError(f"{name} must be an integer.")
+    if not 0 < value <= maximum:
+        raise ValidationError(f"{name} must be between 1 and {maximum}.")
+    return value
+
+
+class LeaderboardAPIView(APIView):
+    """
+    Top players by trophies (``?limit=``, default 50), from the in-process leaderboard.
+    """
+
+    def get(self, request):
+        board = get_leaderboard()
+        return Response({"count": len(board), "results": board.top(int_param(request, "limit", 50, 1000))})
+
+
+class ClanLeaderboardAPIView(APIView):
+    """
+    Top stored members of a clan by trophies (``?limit=``, default 50).
+    """
+
+    def get(self, request, tag):
+        results = get_leaderboard().top(int_param(request, "limit", 50, 1000), clan_tag=normalize_tag(tag))
+        if not results:
+            raise NotFound("No ranked players in this clan.")
+        return Response({"clan_tag": normalize_tag(tag), "results": results})
+
+
+class PlayerRankAPIView(APIView):
+    """
+    A player's global and clan rank with the players ranked around them (``?radius=``, default 5).
+    """
+
+    def get(self, request, tag):
+        board = get_leaderboard()
+        player_tag = normalize_tag(tag)
+        if player_tag not in board:
+            raise NotFound("Player not ranked.")
+        radius = int_param(request, "radius", 5, 100)
+        return Response({
+            "player_tag": player_tag,
+            "rank": board.rank(player_tag),
+            "clan_rank": board.rank(player_tag, in_clan=True),
+            "players": len(board),
+            "around": board.around(player_tag, radius),
+            "clan_around": board.around(player_tag, radius, in_clan=True),
+        })
+
+
+class PlayerTrophyHistoryAPIView(APIView):
+    """
+    A stored player's trophy series over the last ``?days=`` (default 90) at
+    ``?resolution=`` raw, hour, day or auto (the default: the finest that
+    keeps the series to a few hundred points).
+    """
+
+    def get(self, request, tag):
+        player_tag = normalize_tag(tag)
+        if not Player.objects.filter(tag=player_tag).exists():
+            raise NotFound("Player not found.")
+        end = timezone.now()
+        start = end - timedelta(days=int_param(request, "days", 90, 3650))
+        try:
+            resolution, points = trophy_history(
+                player_tag, start, end, request.query_params.get("resolution", "auto")
+            )
+        except ValueError as e:
+            raise ValidationError(str(e))
+        return Response(
+            {"player_tag": player_tag, "resolution": resolution, "start": start, "end": end, "points": points}
+        )
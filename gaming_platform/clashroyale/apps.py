@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class ClashroyaleConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "clashroyale"
+
+    def ready(self):
+        from .models import Player
+        from .services.leaderboard import player_deleted, player_saved
+        from .services.query_budget import install_query_recorder
+
+        connection_created.connect(install_query_recorder, dispatch_uid="clashroyale_query_recorder")
+        post_save.connect(player_saved, sender=Player, dispatch_uid="clashroyale_leaderboard_save")
+        post_delete.connect(player_deleted, sender=Player, dispatch_uid="clashroyale_leaderboard_delete")
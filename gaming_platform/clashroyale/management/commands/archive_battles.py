@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from clashroyale.services.archive import archivable_months, archive_cutoff, archive_month, archived_battle_stats
+from .export_battles import parse_time
+
+
+class Command(BaseCommand):
+    help = "Move whole months of old battles out of BattleLog into per-month columnar archive files, or query the archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, help="Archive months older than this (default: CLASH_ROYALE_ARCHIVE_AFTER_DAYS)")
+        parser.add_argument('--dry-run', action='store_true', help="Only list the months that would be archived")
+        parser.add_argument('--stats', action='store_true', help="Print archived battle totals instead of archiving")
+        parser.add_argument('--player', help="With --stats: only this player's battles")
+        parser.add_argument('--since', help="With --stats: only battles at or after this time (ISO 8601)")
+        parser.add_argument('--until', help="With --stats: only battles before this time (ISO 8601)")
+
+    def handle(self, *args, **kwargs):
+        if kwargs['stats']:
+            totals = archived_battle_stats(
+                kwargs['player'], parse_time(kwargs['since'], "--since"), parse_time(kwargs['until'], "--until")
+            )
+            self.stdout.write(
+                f"{totals['battle_count']} archived battles: {totals['wins']}W/{totals['losses']}L "
+                f"(win rate {totals['win_rate']:.1%}), {totals['crowns']} crowns, {totals['trophy_delta']:+} trophies."
+            )
+            return
+
+        cutoff = archive_cutoff(kwargs['older_than_days'])
+        if cutoff is None:
+            self.stdout.write("Archiving is disabled (CLASH_ROYALE_ARCHIVE_AFTER_DAYS is 0).")
+            return
+        months = archivable_months(cutoff)
+        if not months:
+            self.stdout.write(f"No battles before {cutoff:%Y-%m-%d} to archive.")
+            return
+        for start, battles in months:
+            if kwargs['dry_run']:
+                self.stdout.write(f"{start:%Y-%m}: {battles} battles would be archived.")
+            else:
+                self.stdout.write(f"{start:%Y-%m}: archived {archive_month(start)} battles.")
@@ -0,0 +1,125 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clashroyale.models import BattleArchive, BattleLog
+from clashroyale.services.analytics import DEFAULT_WINDOW, MAX_CROWNS, battle_report, load_battles
+
+
+def per_object_reports(player_tags, window):
+    """
+    The per-player part of the report computed row by row over ``BattleLog``
+    instances, the way statistics were computed before ``services/analytics.py``.
+    Only used as the benchmark baseline and to cross-check the vectorized results.
+    """
+    battles = BattleLog.objects.order_by("-player_tag", "timestamp")
+    if player_tags is not None:
+        battles = battles.filter(player_tag__in=player_tags)
+    players = {}
+    for battle in battles.iterator(chunk_size=10000):
+        report = players.get(battle.player_tag)
+        if report is None:
+            report = players[battle.player_tag] = {
+                "battles": 0, "wins": 0, "crowns": [0] * (MAX_CROWNS + 1), "changes": [],
+                "longest_win_streak": 0, "longest_loss_streak": 0, "current_streak": 0,
+            }
+        won = battle.crowns > 0
+        report["battles"] += 1
+        report["wins"] += won
+        report["crowns"][min(max(battle.crowns, 0), MAX_CROWNS)] += 1
+        report["changes"].append(battle.trophy_change)
+        streak = report["current_streak"]
+        streak = (streak + 1 if streak > 0 else 1) if won else (streak - 1 if streak < 0 else -1)
+        report["current_streak"] = streak
+        report["longest_win_streak"] = max(report["longest_win_streak"], streak)
+        report["longest_loss_streak"] = max(report["longest_loss_streak"], -streak)
+
+    reports = []
+    for player_tag in sorted(players):
+        report = players[player_tag]
+        changes = report.pop("changes")
+        recent = changes[-window:]
+        reports.append(
+            {
+                "player_tag": player_tag,
+                "battles": report["battles"],
+                "wins": report["wins"],
+                "losses": report["battles"] - report["wins"],
+                "win_rate": round(report["wins"] / report["battles"], 4),
+                "crowns": dict(enumerate(report["crowns"])),
+                "trophy_delta": sum(changes),
+                "trophy_trend": round(sum(recent) / len(recent), 2),
+                "longest_win_streak": report["longest_win_streak"],
+                "longest_loss_streak": report["longest_loss_streak"],
+                "current_streak": report["current_streak"],
+            }
+        )
+    return reports
+
+
+class Command(BaseCommand):
+    help = "Battle analytics (win rates, crowns, trophy trends, streaks, arena and game mode breakdowns) over stored and archived battles, computed with NumPy"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--player', action='append', help="Only this player (repeatable; default: every stored battle)")
+        parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, help="Battles in the trophy change moving average")
+        parser.add_argument('--per-player-breakdowns', action='store_true', help="Break arenas and game modes down per player")
+        parser.add_argument('--output', help="Write the full report to this file (JSON)")
+        parser.add_argument('--benchmark', action='store_true', help="Also compute the per-player report row by row over ORM objects and compare rows/s")
+
+    def handle(self, *args, **kwargs):
+        if kwargs['window'] < 1:
+            raise CommandError("--window must be at least 1.")
+        player_tags = kwargs['player']
+
+        started = time.perf_counter()
+        frame = load_battles(player_tags)
+        loaded = time.perf_counter()
+        report = battle_report(frame, kwargs['window'], kwargs['per_player_breakdowns'])
+        finished = time.perf_counter()
+
+        self.stdout.write(f"{len(frame)} battles of {len(frame.players)} players.")
+        if not kwargs['per_player_breakdowns']:
+            for by, rows in (("Arenas", report["arenas"]), ("Game modes", report["game_modes"])):
+                self.stdout.write(f"{by} by battles:")
+                key = "arena" if by == "Arenas" else "game_mode"
+                for row in rows[:10]:
+                    self.stdout.write(
+                        f"  {row[key]:<32} {row['battles']:>8}  win rate {row['win_rate']:.1%}  "
+                        f"{row['avg_trophy_change']:+.1f} trophies/battle"
+                    )
+        if kwargs['output']:
+            with open(kwargs['output'], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {kwargs['output']}.")
+
+        if kwargs['benchmark'] and len(frame):
+            self.benchmark(report, player_tags, kwargs['window'], len(frame), loaded - started, finished - loaded)
+
+    def benchmark(self, report, player_tags, window, rows, load_elapsed, compute_elapsed):
+        if BattleArchive.objects.exists():
+            # The per-object baseline only reads BattleLog, so compare over the same rows
+            started = time.perf_counter()
+            frame = load_battles(player_tags, archived=False)
+            loaded = time.perf_counter()
+            report = battle_report(frame, window)
+            rows, load_elapsed, compute_elapsed = len(frame), loaded - started, time.perf_counter() - loaded
+            self.stdout.write(f"Benchmarking over the {rows} battles still in BattleLog.")
+            if not rows:
+                return
+        started = time.perf_counter()
+        baseline = per_object_reports(player_tags, window)
+        baseline_elapsed = time.perf_counter() - started
+        vectorized_elapsed = load_elapsed + compute_elapsed
+        self.stdout.write(
+            f"Vectorized: {rows / vectorized_elapsed:,.0f} rows/s "
+            f"(load {load_elapsed:.3f}s, compute {compute_elapsed:.3f}s, {rows / compute_elapsed:,.0f} rows/s computing)."
+        )
+        self.stdout.write(
+            f"Per object: {rows / baseline_elapsed:,.0f} rows/s ({baseline_elapsed:.3f}s), "
+            f"{baseline_elapsed / vectorized_elapsed:.1f}x slower."
+        )
+        if baseline != report["players"]:
+            raise CommandError("The per-object and vectorized player reports differ.")
+        self.stdout.write(self.style.SUCCESS("Both approaches produced the same player reports."))
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from eth_account import Account
+
+from clashroyale.services.attestation import Attestor, SignerCache, recover_attestation_signer
+from clashroyale.services.config import ATTESTATION_KEY
+
+
+class Command(BaseCommand):
+    help = "Measure attestation signs/s and verifies/s on a single core (uses a throwaway key if none is configured)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000, help="Number of statements to attest")
+        parser.add_argument('--batch-size', type=int, default=500, help="Statements per signed Merkle root")
+
+    def handle(self, *args, **kwargs):
+        count, batch_size = kwargs['count'], max(1, kwargs['batch_size'])
+        attestor = Attestor(ATTESTATION_KEY or Account.create().key.hex())
+        statements = [
+            {"type": "trophy", "player_tag": f"#BENCH{i}", "param": "4000", "proof": True, "commitment": f"{i:064x}"}
+            for i in range(count)
+        ]
+
+        started = time.perf_counter()
+        attestations = []
+        for start in range(0, count, batch_size):
+            attestations.extend(attestor.attest_batch(statements[start:start + batch_size]))
+        sign_elapsed = time.perf_counter() - started
+
+        cache = SignerCache()
+        started = time.perf_counter()
+        valid = sum(recover_attestation_signer(attestation, cache) == attestor.address for attestation in attestations)
+        verify_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for attestation in attestations:
+            recover_attestation_signer(attestation, cache)
+        warm_elapsed = time.perf_counter() - started
+
+        batches = -(-count // batch_size)
+        self.stdout.write(
+            f"Signed {count} statements in {batches} batches in {sign_elapsed:.2f}s: "
+            f"{count / sign_elapsed:.0f} signs/s ({batches / sign_elapsed:.1f} ECDSA signatures/s)."
+        )
+        self.stdout.write(
+            f"Verified {valid}/{count} attestations in {verify_elapsed:.2f}s: {count / verify_elapsed:.0f} verifies/s; "
+            f"with every signer cached: {count / warm_elapsed:.0f} verifies/s."
+        )
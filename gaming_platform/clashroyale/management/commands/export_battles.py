@@ -0,0 +1,74 @@
+import os
+import sys
+from datetime import timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from clashroyale.services.export import FORMATS, archived_before, export_battles, export_queryset, resume_point
+
+
+def parse_time(value, option):
+    moment = parse_datetime(value) if value else None
+    if value and moment is None:
+        raise CommandError(f"{option} must be an ISO 8601 date and time.")
+    return moment.replace(tzinfo=dt_timezone.utc) if moment and not moment.tzinfo else moment
+
+
+class Command(BaseCommand):
+    help = "Stream stored battles as NDJSON or CSV (optionally gzipped) in constant memory, resumable by cursor"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default="ndjson", help="Output format")
+        parser.add_argument('--output', help="File to write (default: stdout)")
+        parser.add_argument('--gzip', action='store_true', help="Compress the output with gzip")
+        parser.add_argument('--player', help="Only this player's battles")
+        parser.add_argument('--since', help="Only battles at or after this time (ISO 8601)")
+        parser.add_argument('--until', help="Only battles before this time (ISO 8601)")
+        parser.add_argument('--game-mode', help="Only battles in this game mode")
+        parser.add_argument('--after', help="Cursor of the last row already exported")
+        parser.add_argument('--resume', action='store_true', help="Continue an interrupted uncompressed --output file")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Rows per database round trip")
+
+    def handle(self, *args, **kwargs):
+        after, header, mode = kwargs['after'], True, "wb"
+        if kwargs['resume']:
+            if not kwargs['output'] or kwargs['gzip']:
+                raise CommandError("--resume needs an uncompressed --output file.")
+            if os.path.exists(kwargs['output']):
+                cursor, empty = resume_point(kwargs['output'])
+                after, header, mode = cursor or after, empty, "ab"
+                self.stderr.write(f"Resuming {kwargs['output']} after {cursor or 'the start'}.")
+
+        since = parse_time(kwargs['since'], "--since")
+        try:
+            rows = export_queryset(
+                player_tag=kwargs['player'],
+                since=since,
+                until=parse_time(kwargs['until'], "--until"),
+                game_mode=kwargs['game_mode'],
+                after=after,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        until = archived_before(since)
+        if until:
+            self.stderr.write(
+                f"Battles before {until.isoformat()} may be archived and are not exported "
+                f"(see archive_battles --stats)."
+            )
+
+        output = open(kwargs['output'], mode) if kwargs['output'] else sys.stdout.buffer
+        written = 0
+        try:
+            for piece in export_battles(rows, kwargs['format'], kwargs['gzip'], header, max(1, kwargs['chunk_size'])):
+                output.write(piece)
+                written += len(piece)
+        finally:
+            if kwargs['output']:
+                output.close()
+            else:
+                output.flush()
+        if kwargs['output']:
+            self.stderr.write(f"Wrote {written} bytes to {kwargs['output']}.")
@@ -1,178 +1,181 @@
-from django.core.management.base import BaseCommand
-from clashroyale.services.api_client import make_request
-from clashroyale.models import Player, Clan, Challenge, BattleLog, GameMode, Prize
-from clashroyale.services.verification import TrophyVerification, ChallengeVerification, WinLossVerification
-import urllib.parse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from clashroyale.models import Player
+from clashroyale.services.api_client import get_client
+from clashroyale.services.proof_cache import challenge_proofs, trophy_proof, win_loss_proof
+from clashroyale.services.sync import fetch_player_bundle, store_player_bundle, sync_all_challenges
+
+
+class WriteCounter:
+    """
+    ``connection.execute_wrapper`` hook counting INSERT/UPDATE/DELETE statements across threads.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE"):
+            with self._lock:
+                self.count += 1
+        return execute(sql, params, many, context)
 
 
 class Command(BaseCommand):
-    help = "Fetch and store Clash Royale data for player stats, challenges, and real-time wagering"
+    help = (
+        "Fetch and store Clash Royale data for player stats, challenges, and real-time wagering. "
+        "Accepts one tag, a file or stdin stream of tags, or every known player, processed concurrently."
+    )
+    # Player tags read from the database per query with --from-db
+    DB_BATCH_SIZE = 2000
 
     def add_arguments(self, parser):
         # Add player_tag argument to accept player tag as input
-        parser.add_argument('player_tag', type=str, help="The player tag for which you want to fetch Clash Royale data")
-
-    def handle(self, *args, **kwargs):
-        # Retrieve the player_tag argument from the command
-        player_tag = kwargs['player_tag']
-
-        # URL-encode the player tag to ensure compatibility with API requirements
-        encoded_player_tag = urllib.parse.quote(player_tag)
-        
-        # Helper function to process API responses
-        def process_response(data, data_type):
-            if isinstance(data, dict) and "items" in data:
-                return data["items"]
-            elif isinstance(data, dict):
-                return [data]  # For endpoints that return a single object
-            else:
-                self.stdout.write(self.style.WARNING(f"No valid data found for {data_type}."))
-                return []
-
+        parser.add_argument('player_tag', type=str, nargs='?', help="The player tag for which you want to fetch Clash Royale data")
+        parser.add_argument('--file', dest='tag_file', help="File with one player tag per line ('-' reads stdin)")
+        parser.add_argument('--from-db', action='store_true', help="Refresh every player already stored in the database")
+        parser.add_argument('--workers', type=int, default=8, help="Number of players processed concurrently")
+        parser.add_argument('--checkpoint', help="File recording processed tags; an interrupted run resumes from it")
+
+    def iter_tags(self, options):
+        if options['player_tag']:
+            yield options['player_tag'].strip().upper()
+        if options['tag_file']:
+            stream = sys.stdin if options['tag_file'] == '-' else open(options['tag_file'])
+            try:
+                for line in stream:
+                    if line.strip():
+                        yield line.strip().upper()
+            finally:
+                if stream is not sys.stdin:
+                    stream.close()
+        if options['from_db']:
+            # Keyset batches, each read in full: an open cursor would hold a
+            # SQLite read lock that makes every write of the worker threads fail
+            last_tag = ''
+            while True:
+                tags = Player.objects.filter(tag__gt=last_tag).order_by('tag').values_list('tag', flat=True)
+                batch = list(tags[:self.DB_BATCH_SIZE])
+                yield from batch
+                if len(batch) < self.DB_BATCH_SIZE:
+                    break
+                last_tag = batch[-1]
+
+    def process_tag(self, player_tag, challenges, write_counter, show_proofs):
+        """
+        Fetch and store one player; return the proofs to display (if requested).
+        """
         try:
-            # 1. Fetch and store data for Players
-            players_data = make_request(f"/players/{encoded_player_tag}")
-            self.stdout.write(f"Players Data: {players_data}")
-            if "tag" in players_data:
-                player, created = Player.objects.update_or_create(
-                    tag=players_data["tag"],
-                    defaults={
-                        "name": players_data["name"],
-                        "level": players_data["expLevel"],
-                        "trophies": players_data["trophies"],
-                    },
-                )
-
-                # Generate and log Trophy Proof
-                trophy_proof = TrophyVerification.generate_trophy_proof(player_tag, threshold=4000)
-                self.stdout.write(self.style.SUCCESS(f"Trophy proof for {player_tag}: {trophy_proof}"))
-                
-                # Generate and log Win-Loss Proof
-                win_loss_proof = WinLossVerification.generate_win_loss_proof(player_tag, threshold=60.0)
-                self.stdout.write(self.style.SUCCESS(f"Win/Loss proof for {player_tag}: {win_loss_proof}"))
-            else:
-                self.stdout.write(self.style.WARNING("No player data found."))
-
-            # 2. Fetch and store data for Clans (if player is in a clan)
-            clan_tag = players_data.get("clan", {}).get("tag")
-            if clan_tag:
-                encoded_clan_tag = urllib.parse.quote(clan_tag)
-                clans_data = make_request(f"/clans/{encoded_clan_tag}")
-                self.stdout.write(f"Clans Data: {clans_data}")
-                Clan.objects.update_or_create(
-                    tag=clans_data["tag"],
-                    defaults={
-                        "name": clans_data["name"],
-                        "description": clans_data.get("description", ""),
-                        "badge_id": clans_data["badgeId"],
-                        "clan_score": clans_data["clanScore"],
-                        "members_count": clans_data["members"],
-                    },
-                )
-            else:
-                self.stdout.write(self.style.WARNING("Player is not part of a clan."))
-
-
-            # 4. Fetch and store data for Challenges
-            challenges_data = make_request("/challenges")
-            self.stdout.write(f"Challenges Data: {challenges_data}")
-
-            if not isinstance(challenges_data, list):
-                self.stdout.write(self.style.WARNING("Challenges data is not in the expected format."))
-                challenges_data = []
-
-            for challenge_set in challenges_data:
-                challenges = challenge_set.get("challenges", [])
+            with connection.execute_wrapper(write_counter):
+                player_data, clan_data, battle_log_data, _ = fetch_player_bundle(player_tag)
+                player = store_player_bundle(player_data, clan_data, battle_log_data)
+                if player is None:
+                    raise ValueError(f"No player data found: {player_data}")
+                if not show_proofs:
+                    return []
+                proofs = [
+                    ("Trophy proof", trophy_proof(player, threshold=4000)),
+                    ("Win/Loss proof", win_loss_proof(player, threshold=60.0)),
+                ]
+                player_challenge_proofs = challenge_proofs(player, [challenge.id for challenge in challenges])
                 for challenge in challenges:
-                    try:
-                        # Process game mode
-                        game_mode_data = challenge.get("gameMode", {})
-                        game_mode, _ = GameMode.objects.get_or_create(
-                            id=game_mode_data.get("id"),
-                            defaults={"name": game_mode_data.get("name", "Unknown")},
-                        )
-
-                        # Process challenge
-                        challenge_obj, created = Challenge.objects.update_or_create(
-                            id=challenge["id"],  # Use 'id' instead of 'challenge_id'
-                            defaults={
-                                "name": challenge["name"],
-                                "description": challenge.get("description", ""),
-                                "win_mode": challenge.get("winMode", ""),
-                                "casual": challenge.get("casual", False),
-                                "max_losses": challenge.get("maxLosses", 0),
-                                "max_wins": challenge.get("maxWins", 0),
-                                "icon_url": challenge.get("iconUrl", ""),
-                                "game_mode": game_mode,
-                            },
-                        )
-
-                        # Process prizes
-                        challenge_obj.prizes.all().delete()  # Clear old prizes to avoid duplicates
-                        for prize in challenge.get("prizes", []):
-                            Prize.objects.create(
-                                challenge=challenge_obj,
-                                type=prize.get("type"),
-                                amount=prize.get("amount"),
-                                consumable_name=prize.get("consumableName"),
-                            )
-
-                        action = "Created" if created else "Updated"
-                        self.stdout.write(self.style.SUCCESS(f"{action} challenge: {challenge['name']}"))
-
-                        # Generate and log Challenge Proof
-                        challenge_proof = ChallengeVerification.generate_challenge_proof(player_tag, challenge["id"])
-                        self.stdout.write(self.style.SUCCESS(f"Challenge proof for {player_tag} in challenge {challenge['name']}: {challenge_proof}"))
-
-                    except Exception as e:
-                        self.stdout.write(self.style.ERROR(f"Error processing challenge: {str(e)}"))
-
-            # 5. Fetch and store data for Battle Logs
-            battle_log_data = make_request(f"/players/{encoded_player_tag}/battlelog")
-            self.stdout.write(f"Battle Log Data: {battle_log_data}")
-
-            if isinstance(battle_log_data, list) and battle_log_data:
-                for battle in battle_log_data[:50]:  # Limiting to the top 50 battles
-                    # Extract necessary fields from the battle data
-                    battle_type = battle.get("type", "Unknown")
-                    battle_time = battle.get("battleTime", "")
-                    arena_name = battle.get("arena", {}).get("name", "Unknown Arena")
-                    game_mode_name = battle.get("gameMode", {}).get("name", "Unknown Mode")
-                    team = battle.get("team", [])
-                    
-                    # Process the team data (assuming the team has only one player, the current player)
-                    if team:
-                        player_data = team[0]  # The first team member (your player)
-                        player_tag = player_data.get("tag", "")
-                        player_name = player_data.get("name", "Unknown")
-                        trophy_change = player_data.get("trophyChange", 0)
-                        crowns = player_data.get("crowns", 0)
-                        king_tower_hp = player_data.get("kingTowerHitPoints", 0)
-                        princess_tower_hp = player_data.get("princessTowersHitPoints", [0, 0])
-
-                        # Create or update the BattleLog entry in the database
-                        BattleLog.objects.update_or_create(
-                            battle_id=battle_time,  # Use the battle time as a unique identifier
-                            defaults={
-                                "type": battle_type,
-                                "timestamp": battle_time,
-                                "arena": arena_name,
-                                "game_mode": game_mode_name,
-                                "player_tag": player_tag,
-                                "player_name": player_name,
-                                "starting_trophies": player_data.get("startingTrophies", 0),
-                                "trophy_change": trophy_change,
-                                "crowns": crowns,
-                                "king_tower_hp": king_tower_hp,
-                                "princess_tower_hp": princess_tower_hp,
-                            },
-                        )
-                    else:
-                        self.stdout.write(self.style.WARNING(f"No team data for battle: {battle_time}"))
-            else:
-                self.stdout.write(self.style.WARNING("No valid battle log data found."))
+                    proofs.append((f"Challenge proof in challenge {challenge.name}", player_challenge_proofs[challenge.id]))
+                return proofs
+        finally:
+            # Worker threads hold their own DB connection
+            connection.close()
 
+    def handle(self, *args, **kwargs):
+        if not (kwargs['player_tag'] or kwargs['tag_file'] or kwargs['from_db']):
+            raise CommandError("Give a player tag, --file or --from-db.")
+        show_proofs = bool(kwargs['player_tag']) and not (kwargs['tag_file'] or kwargs['from_db'])
+        show_proofs = show_proofs or kwargs['verbosity'] >= 2
+
+        # Resume: skip tags recorded by a previous, interrupted run
+        done = set()
+        checkpoint = None
+        if kwargs['checkpoint']:
+            if os.path.exists(kwargs['checkpoint']):
+                with open(kwargs['checkpoint']) as f:
+                    done = {line.strip() for line in f if line.strip()}
+                self.stdout.write(f"Resuming: {len(done)} tags already processed.")
+            checkpoint = open(kwargs['checkpoint'], 'a')
+
+        client = get_client()
+        write_counter = WriteCounter()
+        requests_before = client.requests_sent
+        started = time.monotonic()
+
+        # 1. Fetch and store challenges once for the whole run
+        challenges = []
+        try:
+            with connection.execute_wrapper(write_counter):
+                challenges, counts = sync_all_challenges()
+            self.stdout.write(self.style.SUCCESS(
+                f"Challenges: {counts['created']} created, {counts['updated']} updated, "
+                f"{counts['unchanged']} unchanged, prizes replaced for {counts['prizes_replaced']}."
+            ))
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f"An error occurred: {str(e)}"))
-
+            self.stdout.write(self.style.WARNING(f"Challenges not refreshed: {str(e)}"))
+
+        # 2. Process players with a bounded pool, reading tags lazily
+        processed = failed = skipped = 0
+        running = {}
+        max_in_flight = max(1, kwargs['workers']) * 2
+        tags = self.iter_tags(kwargs)
+        with ThreadPoolExecutor(max_workers=max(1, kwargs['workers'])) as pool:
+            try:
+                exhausted = False
+                while running or not exhausted:
+                    while not exhausted and len(running) < max_in_flight:
+                        player_tag = next(tags, None)
+                        if player_tag is None:
+                            exhausted = True
+                        elif player_tag in done:
+                            skipped += 1
+                        else:
+                            future = pool.submit(self.process_tag, player_tag, challenges, write_counter, show_proofs)
+                            running[future] = player_tag
+                    if not running:
+                        break
+
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        player_tag = running.pop(future)
+                        try:
+                            proofs = future.result()
+                        except Exception as e:
+                            failed += 1
+                            self.stdout.write(self.style.ERROR(f"{player_tag}: {str(e)}"))
+                            continue
+                        processed += 1
+                        for label, proof in proofs:
+                            self.stdout.write(self.style.SUCCESS(f"{label} for {player_tag}: {proof}"))
+                        if checkpoint:
+                            checkpoint.write(f"{player_tag}\n")
+                            checkpoint.flush()
+            except KeyboardInterrupt:
+                self.stdout.write(self.style.WARNING("Interrupted; re-run with the same --checkpoint to resume."))
+                for future in running:
+                    future.cancel()
+            finally:
+                if checkpoint:
+                    checkpoint.close()
+
+        # 3. Throughput report
+        elapsed = max(time.monotonic() - started, 1e-9)
+        upstream_calls = client.requests_sent - requests_before
+        self.stdout.write(
+            f"Processed {processed} players ({failed} failed, {skipped} skipped) in {elapsed:.1f}s: "
+            f"{processed / elapsed:.1f} tags/s, {upstream_calls / elapsed:.1f} upstream calls/s "
+            f"({upstream_calls} total), {write_counter.count / elapsed:.1f} DB writes/s ({write_counter.count} total)."
+        )
         self.stdout.write(self.style.SUCCESS("Data fetching and storage completed successfully."))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clashroyale.services.config import LEADERBOARD_SNAPSHOT
+from clashroyale.services.leaderboard import build_leaderboard, load_leaderboard, save_snapshot
+
+
+class Command(BaseCommand):
+    help = "Print the trophy leaderboard (globally, for a clan or around a player) and write its snapshot"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Rebuild from the Player table, ignoring the snapshot")
+        parser.add_argument('--top', type=int, default=10, help="Number of players to print")
+        parser.add_argument('--clan', help="Print the leaderboard of this clan")
+        parser.add_argument('--player', help="Print the players ranked around this player")
+
+    def handle(self, *args, **kwargs):
+        started = time.perf_counter()
+        board = build_leaderboard() if kwargs['rebuild'] else load_leaderboard()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{len(board)} players in {len(board.clan_tags())} clans, loaded in {elapsed:.2f}s.")
+
+        if kwargs['player']:
+            if kwargs['player'] not in board:
+                raise CommandError(f"{kwargs['player']} is not ranked.")
+            rows = board.around(kwargs['player'], radius=kwargs['top'] // 2, in_clan=bool(kwargs['clan']))
+        else:
+            rows = board.top(kwargs['top'], clan_tag=kwargs['clan'])
+        for row in rows:
+            self.stdout.write(f"{row['rank']:>8}  {row['tag']:<12} {row['trophies']:>6}  {row['clan_tag']}".rstrip())
+
+        if kwargs['rebuild'] and LEADERBOARD_SNAPSHOT:
+            save_snapshot(board, LEADERBOARD_SNAPSHOT)
+            self.stdout.write(f"Snapshot written to {LEADERBOARD_SNAPSHOT}.")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from clashroyale.services.trophy_history import apply_trophy_retention, rollup_trophy_history
+
+
+class Command(BaseCommand):
+    help = "Roll trophy samples up into hourly and daily buckets and apply the retention policies (run_sync_worker does this on its own)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-retention', action='store_true', help="Only roll up; delete nothing")
+
+    def handle(self, *args, **kwargs):
+        hourly, daily = rollup_trophy_history()
+        self.stdout.write(f"Rolled up {hourly} hourly and {daily} daily buckets.")
+        if not kwargs['no_retention']:
+            deleted = apply_trophy_retention()
+            self.stdout.write(
+                f"Deleted {deleted['samples']} samples, {deleted['hour']} hourly and {deleted['day']} daily buckets."
+            )
@@ -0,0 +1,109 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from clashroyale.services.config import LEADERBOARD_SNAPSHOT_INTERVAL, TROPHY_ROLLUP_INTERVAL
+from clashroyale.services.leaderboard import maintain_leaderboard, warm_leaderboard
+from clashroyale.services.sync_queue import claim_jobs, purge_finished_jobs, requeue_stale_jobs, run_job
+from clashroyale.services.trophy_history import maintain_trophy_history
+
+
+logger = logging.getLogger(__name__)
+
+
+def _run_in_thread(job):
+    try:
+        return run_job(job)
+    except Exception as e:
+        # Could not even record the outcome; the job is re-queued once its lock times out
+        logger.error(f"Sync job {job} crashed: {e}")
+        return False
+    finally:
+        # Each pool thread has its own DB connection; release it between jobs
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Process queued Clash Royale sync jobs (player and challenge refreshes) with a thread pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help="Number of jobs to run concurrently")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to wait for new jobs when idle")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is drained instead of polling")
+        parser.add_argument('--max-jobs', type=int, default=0, help="Exit after claiming this many jobs (0 = no limit)")
+
+    def handle(self, *args, **kwargs):
+        threads = max(1, kwargs['threads'])
+        max_jobs = kwargs['max_jobs']
+        claimed = processed = succeeded = 0
+
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"Re-queued {requeued} jobs abandoned by a previous worker."))
+        # Synced players are applied to this process's leaderboard as they are
+        # stored, which keeps the snapshot it writes current
+        warm_leaderboard()
+
+        running = {}
+        last_rollup = 0.0
+        last_snapshot = time.monotonic()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            try:
+                while True:
+                    # Keep every thread busy: claim only as many jobs as there are free slots
+                    free = threads - len(running)
+                    if max_jobs:
+                        free = min(free, max_jobs - claimed)
+                    if free > 0:
+                        close_old_connections()
+                        for job in claim_jobs(free):
+                            running[pool.submit(_run_in_thread, job)] = job
+                            claimed += 1
+
+                    # Roll trophy samples up on schedule, busy or not (jobs keep running meanwhile)
+                    if TROPHY_ROLLUP_INTERVAL and time.monotonic() - last_rollup >= TROPHY_ROLLUP_INTERVAL:
+                        last_rollup = time.monotonic()
+                        self.rollup_trophy_history()
+                    if LEADERBOARD_SNAPSHOT_INTERVAL and time.monotonic() - last_snapshot >= LEADERBOARD_SNAPSHOT_INTERVAL:
+                        last_snapshot = time.monotonic()
+                        self.snapshot_leaderboard()
+
+                    if not running:
+                        if kwargs['once'] or (max_jobs and claimed >= max_jobs):
+                            break
+                        purge_finished_jobs()
+                        time.sleep(kwargs['poll_interval'])
+                        continue
+
+                    done, _ = wait(running, timeout=kwargs['poll_interval'], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job = running.pop(future)
+                        ok = future.result()
+                        processed += 1
+                        succeeded += ok
+                        style = self.style.SUCCESS if ok else self.style.ERROR
+                        self.stdout.write(style(f"{'Done' if ok else 'Failed'}: {job.job_type} {job.target_tag}"))
+            except KeyboardInterrupt:
+                self.stdout.write(self.style.WARNING("Interrupted; finishing running jobs."))
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} jobs ({succeeded} succeeded)."))
+
+    def snapshot_leaderboard(self):
+        try:
+            maintain_leaderboard()
+        except Exception as e:
+            # The snapshot only speeds up process starts; never let it stop the worker
+            logger.error(f"Leaderboard snapshot failed: {e}")
+
+    def rollup_trophy_history(self):
+        try:
+            (hourly, daily), deleted = maintain_trophy_history()
+        except Exception as e:
+            # History is best effort; never let it stop the worker
+            logger.error(f"Trophy history rollup failed: {e}")
+            return
+        if hourly or any(deleted.values()):
+            self.stdout.write(f"Trophy history: {hourly} hourly and {daily} daily buckets rolled up, deleted {deleted}.")
@@ -0,0 +1,42 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from clashroyale.services.bulk_verify import BulkVerifier, summarize
+from clashroyale.services.config import VERIFY_CHUNK_SIZE, VERIFY_WORKERS
+
+
+class Command(BaseCommand):
+    help = (
+        "Verify a JSON-lines batch of trophy, win/loss, challenge and Merkle proofs. "
+        "Results are written to stdout as JSON lines; the throughput summary goes to stderr."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', nargs='?', default='-', help="JSON-lines file of proofs ('-' reads stdin)")
+        parser.add_argument('--workers', type=int, default=VERIFY_WORKERS, help="Hashing processes (1 verifies inline)")
+        parser.add_argument('--chunk-size', type=int, default=VERIFY_CHUNK_SIZE, help="Lines verified per chunk")
+        parser.add_argument('--summary-only', action='store_true', help="Do not print per-item results")
+
+    def handle(self, *args, **kwargs):
+        verifier = BulkVerifier(workers=kwargs['workers'], chunk_size=kwargs['chunk_size'])
+        # Binary, so a line that is not UTF-8 fails on its own instead of ending the run
+        stream = sys.stdin.buffer if kwargs['input'] == '-' else open(kwargs['input'], 'rb')
+        stats = {}
+        try:
+            for result in verifier.verify_stream(stream, stats):
+                if not kwargs['summary_only']:
+                    self.stdout.write(json.dumps(result))
+        finally:
+            verifier.close()
+            if stream is not sys.stdin.buffer:
+                stream.close()
+
+        summary = summarize(stats)
+        style = self.style.SUCCESS if not summary['invalid'] else self.style.WARNING
+        self.stderr.write(style(
+            f"Verified {summary['count']} proofs ({summary['valid']} valid, {summary['invalid']} invalid, "
+            f"{summary['cached']} from cache) in {summary['elapsed']:.2f}s: "
+            f"{summary['verifications_per_second']:.0f} verifications/s."
+        ))
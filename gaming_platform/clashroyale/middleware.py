@@ -0,0 +1,103 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .services.config import METRICS_ENABLED, QUERY_WARN_THRESHOLD
+from .services.metrics import REQUEST_DB_SECONDS, REQUEST_QUERIES, REQUEST_SECONDS, SpanCollector, server_timing
+from .services.query_budget import QueryBudget
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetMiddleware:
+    """
+    Records the number of database queries each request runs and their total
+    time, logs them and, with DEBUG on, returns them in an ``X-DB-Queries``
+    response header.
+
+    Queries a streaming response runs while it is consumed are not included.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with QueryBudget() as budget:
+            request.query_budget = budget
+            response = self.get_response(request)
+        return self.report(request, response, budget)
+
+    async def __acall__(self, request):
+        with QueryBudget() as budget:
+            request.query_budget = budget
+            response = await self.get_response(request)
+        return self.report(request, response, budget)
+
+    def report(self, request, response, budget):
+        message = f"{request.method} {request.path} ({response.status_code}): {budget}"
+        if QUERY_WARN_THRESHOLD and budget.count > QUERY_WARN_THRESHOLD:
+            logger.warning(f"{message}, over the budget of {QUERY_WARN_THRESHOLD}")
+        else:
+            logger.info(message)
+        if settings.DEBUG:
+            response["X-DB-Queries"] = f"count={budget.count}; time={budget.elapsed_ms:.2f}ms"
+        return response
+
+
+class ServerTimingMiddleware:
+    """
+    Reports the time spent in each instrumented stage of a request (see
+    ``services/metrics.py``) in a ``Server-Timing`` response header, together
+    with its database time, and records the request in the ``/metrics``
+    histograms.
+
+    Install it after ``QueryBudgetMiddleware``; it is skipped entirely when
+    ``CLASH_ROYALE_METRICS_ENABLED`` is off.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with SpanCollector() as spans:
+            response = self.get_response(request)
+        return self.report(request, response, spans, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with SpanCollector() as spans:
+            response = await self.get_response(request)
+        return self.report(request, response, spans, time.perf_counter() - started)
+
+    def report(self, request, response, spans, elapsed):
+        match = request.resolver_match
+        view = match.view_name if match is not None else "unmatched"
+        budget = getattr(request, "query_budget", None)
+        REQUEST_SECONDS.observe(elapsed, view=view, status=response.status_code)
+        if budget is not None:
+            REQUEST_DB_SECONDS.observe(budget.elapsed, view=view)
+            REQUEST_QUERIES.observe(budget.count, view=view)
+        response["Server-Timing"] = server_timing(spans, budget, elapsed)
+        return response
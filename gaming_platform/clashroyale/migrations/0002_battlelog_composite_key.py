@@ -0,0 +1,61 @@
+# Generated by Django 5.1.5 on 2026-10-17 14:55
+
+from datetime import timezone
+
+from django.db import migrations, models
+
+
+def rekey_battle_logs(apps, schema_editor):
+    """
+    Rewrite legacy battle ids (the bare battle time) into the composite
+    "player tag|battle time|opponent tag" key. The opponent of legacy rows is
+    unknown, so it stays empty.
+    """
+    BattleLog = apps.get_model("clashroyale", "BattleLog")
+    battles = list(
+        BattleLog.objects.only("id", "player_tag", "timestamp", "opponent_tag")
+    )
+    for battle in battles:
+        battle_time = battle.timestamp.astimezone(timezone.utc).strftime(
+            "%Y%m%dT%H%M%S.000Z"
+        )
+        battle.battle_id = f"{battle.player_tag}|{battle_time}|{battle.opponent_tag}"
+    BattleLog.objects.bulk_update(battles, ["battle_id"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clashroyale", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="battlelog",
+            name="opponent_tag",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="Tag of the (first) opponent in the battle",
+                max_length=255,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="battlelog",
+            name="battle_id",
+            field=models.CharField(
+                db_index=True,
+                help_text="Unique identifier for the battle (player tag, battle time and opponent tag)",
+                max_length=255,
+                unique=True,
+            ),
+        ),
+        migrations.RunPython(rekey_battle_logs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="battlelog",
+            constraint=models.UniqueConstraint(
+                fields=("player_tag", "timestamp", "opponent_tag"),
+                name="unique_battle_per_player",
+            ),
+        ),
+    ]
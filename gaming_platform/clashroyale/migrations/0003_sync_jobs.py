@@ -0,0 +1,155 @@
+# Generated by Django 5.1.5 on 2026-10-17 14:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clashroyale", "0002_battlelog_composite_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="challenge",
+            name="synced_at",
+            field=models.DateTimeField(
+                blank=True,
+                db_index=True,
+                help_text="When the challenge was last seen in /challenges",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="player",
+            name="clan_tag",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="Tag of the player's clan, if any",
+                max_length=50,
+            ),
+        ),
+        migrations.AddField(
+            model_name="player",
+            name="last_synced_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="When the player's data was last fetched from the API",
+                null=True,
+            ),
+        ),
+        migrations.CreateModel(
+            name="SyncJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "job_type",
+                    models.CharField(
+                        choices=[("player", "Player"), ("challenges", "Challenges")],
+                        help_text="Kind of data to refresh",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "target_tag",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        help_text="Player tag to refresh (empty for global jobs)",
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "priority",
+                    models.IntegerField(
+                        default=0, help_text="Jobs with a higher priority run first"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        help_text="Current state of the job",
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Number of times the job has been started"
+                    ),
+                ),
+                (
+                    "next_run_at",
+                    models.DateTimeField(help_text="Earliest time the job may run"),
+                ),
+                (
+                    "locked_by",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        help_text="Claim token of the worker running the job",
+                        max_length=64,
+                    ),
+                ),
+                (
+                    "locked_at",
+                    models.DateTimeField(
+                        blank=True, help_text="When a worker claimed the job", null=True
+                    ),
+                ),
+                (
+                    "last_error",
+                    models.TextField(
+                        blank=True,
+                        default="",
+                        help_text="Error of the last failed attempt",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, help_text="When the job was enqueued"
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        auto_now=True, help_text="When the job last changed"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Sync Job",
+                "verbose_name_plural": "Sync Jobs",
+                "indexes": [
+                    models.Index(
+                        fields=["status", "-priority", "next_run_at"],
+                        name="syncjob_claim_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("status__in", ["pending", "running"])),
+                        fields=("job_type", "target_tag"),
+                        name="unique_active_sync_job",
+                    )
+                ],
+            },
+        ),
+    ]
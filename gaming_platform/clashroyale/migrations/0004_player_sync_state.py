@@ -0,0 +1,62 @@
+# Generated by Django 5.1.5 on 2026-10-17 15:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clashroyale", "0003_sync_jobs"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlayerSyncState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "player_tag",
+                    models.CharField(
+                        help_text="Tag of the player whose battle log is tracked",
+                        max_length=50,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "last_battle_time",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="Newest battle time ingested (high-water mark)",
+                        null=True,
+                    ),
+                ),
+                (
+                    "battle_log_hash",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        help_text="SHA-256 of the last ingested battle log payload",
+                        max_length=64,
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        auto_now=True, help_text="When the battle log was last ingested"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Player Sync State",
+                "verbose_name_plural": "Player Sync States",
+            },
+        ),
+    ]
@@ -0,0 +1,116 @@
+# Generated by Django 5.1.5 on 2026-10-17 15:02
+
+from django.db import migrations, models
+from django.db.models import Case, Count, IntegerField, Sum, Value, When
+
+
+def backfill_player_stats(apps, schema_editor):
+    """
+    Compute totals for battles stored before the stats table existed.
+    """
+    BattleLog = apps.get_model("clashroyale", "BattleLog")
+    PlayerStats = apps.get_model("clashroyale", "PlayerStats")
+    rows = (
+        BattleLog.objects.order_by()
+        .values("player_tag")
+        .annotate(
+            battle_count=Count("id"),
+            wins=Sum(
+                Case(
+                    When(crowns__gt=0, then=Value(1)),
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+            ),
+            crowns_total=Sum("crowns"),
+            trophy_delta=Sum("trophy_change"),
+        )
+    )
+    PlayerStats.objects.bulk_create(
+        (
+            PlayerStats(
+                player_tag=row["player_tag"],
+                battle_count=row["battle_count"],
+                wins=row["wins"],
+                losses=row["battle_count"] - row["wins"],
+                crowns=row["crowns_total"],
+                trophy_delta=row["trophy_delta"],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clashroyale", "0004_player_sync_state"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlayerStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "player_tag",
+                    models.CharField(
+                        help_text="Tag of the player the totals belong to",
+                        max_length=50,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "battle_count",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Number of stored battles"
+                    ),
+                ),
+                (
+                    "wins",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Battles in which the player earned crowns"
+                    ),
+                ),
+                (
+                    "losses",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="Battles in which the player earned no crowns",
+                    ),
+                ),
+                (
+                    "crowns",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Total crowns earned"
+                    ),
+                ),
+                (
+                    "trophy_delta",
+                    models.IntegerField(
+                        default=0, help_text="Net trophy change over all stored battles"
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        auto_now=True, help_text="When the totals last changed"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Player Stats",
+                "verbose_name_plural": "Player Stats",
+            },
+        ),
+        migrations.RunPython(backfill_player_stats, migrations.RunPython.noop),
+    ]
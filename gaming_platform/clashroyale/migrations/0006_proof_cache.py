@@ -0,0 +1,78 @@
+# Generated by Django 5.1.5 on 2026-10-17 15:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clashroyale", "0005_player_stats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="player",
+            name="data_version",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Bumped whenever ingestion changes data the player's proofs depend on",
+            ),
+        ),
+        migrations.CreateModel(
+            name="ProofRecord",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "proof_type",
+                    models.CharField(
+                        help_text="Kind of proof (trophy, win_loss, challenge)",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "player_tag",
+                    models.CharField(
+                        help_text="Tag of the player the proof is about", max_length=50
+                    ),
+                ),
+                (
+                    "param",
+                    models.CharField(
+                        help_text="Threshold or challenge id the proof was generated for",
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "data_version",
+                    models.PositiveIntegerField(
+                        help_text="Player data version the proof was generated from"
+                    ),
+                ),
+                ("proof", models.JSONField(help_text="The generated proof")),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now=True, help_text="When the proof was generated"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Proof Record",
+                "verbose_name_plural": "Proof Records",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("proof_type", "player_tag", "param"),
+                        name="unique_proof_record",
+                    )
+                ],
+            },
+        ),
+    ]
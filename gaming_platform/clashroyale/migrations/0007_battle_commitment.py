@@ -0,0 +1,67 @@
+# Generated by Django 5.1.5 on 2026-10-17 15:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clashroyale", "0006_proof_cache"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BattleCommitment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "player_tag",
+                    models.CharField(
+                        help_text="Tag of the player whose battles are committed",
+                        max_length=50,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "leaf_count",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Number of battles in the tree"
+                    ),
+                ),
+                (
+                    "peaks",
+                    models.JSONField(
+                        default=list,
+                        help_text="Hex roots of the perfect subtrees, largest first",
+                    ),
+                ),
+                (
+                    "root",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        help_text="Hex Merkle root over the battles",
+                        max_length=64,
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        auto_now=True, help_text="When the root last changed"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Battle Commitment",
+                "verbose_name_plural": "Battle Commitments",
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.5 on 2026-10-17 15:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clashroyale", "0007_battle_commitment"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="battlelog",
+            name="player_tag",
+            field=models.CharField(
+                help_text="Player's unique identifier (tag)", max_length=255
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="battlelog",
+            index=models.Index(
+                fields=["player_tag", "-timestamp"], name="battlelog_player_recent_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="battlelog",
+            index=models.Index(
+                fields=["player_tag", "trophy_change"],
+                name="battlelog_player_trophy_idx",
+            ),
+        ),
+    ]
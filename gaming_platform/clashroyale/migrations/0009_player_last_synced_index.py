@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-17 15:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clashroyale", "0008_battlelog_composite_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="player",
+            name="last_synced_at",
+            field=models.DateTimeField(
+                blank=True,
+                db_index=True,
+                help_text="When the player's data was last fetched from the API",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,148 @@
+# Generated by Django 5.1.5 on 2026-10-17 15:27
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Now
+
+
+def backfill_trophy_samples(apps, schema_editor):
+    """
+    Start every stored player's history at their current trophy count.
+    """
+    Player = apps.get_model("clashroyale", "Player")
+    TrophySample = apps.get_model("clashroyale", "TrophySample")
+    rows = Player.objects.values_list("tag", "trophies", Coalesce("last_synced_at", Now()))
+    TrophySample.objects.bulk_create(
+        (
+            TrophySample(player_tag=tag, trophies=trophies, recorded_at=recorded_at)
+            for tag, trophies, recorded_at in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clashroyale", "0009_player_last_synced_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrophyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "player_tag",
+                    models.CharField(
+                        help_text="Tag of the player the bucket belongs to",
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "resolution",
+                    models.CharField(
+                        choices=[("hour", "Hour"), ("day", "Day")],
+                        help_text="Width of the bucket",
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "bucket_start",
+                    models.DateTimeField(help_text="Start of the bucket (UTC)"),
+                ),
+                (
+                    "min_trophies",
+                    models.PositiveIntegerField(
+                        help_text="Lowest trophy count sampled in the bucket"
+                    ),
+                ),
+                (
+                    "max_trophies",
+                    models.PositiveIntegerField(
+                        help_text="Highest trophy count sampled in the bucket"
+                    ),
+                ),
+                (
+                    "last_trophies",
+                    models.PositiveIntegerField(
+                        help_text="Latest trophy count sampled in the bucket"
+                    ),
+                ),
+                (
+                    "sample_count",
+                    models.PositiveIntegerField(
+                        help_text="Number of raw samples in the bucket"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Trophy Rollup",
+                "verbose_name_plural": "Trophy Rollups",
+                "indexes": [
+                    models.Index(
+                        fields=["resolution", "bucket_start"],
+                        name="trophyrollup_time_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("player_tag", "resolution", "bucket_start"),
+                        name="unique_trophy_rollup_bucket",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="TrophySample",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "player_tag",
+                    models.CharField(
+                        help_text="Tag of the player the sample belongs to",
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "trophies",
+                    models.PositiveIntegerField(
+                        help_text="Trophy count at the time of the sync"
+                    ),
+                ),
+                (
+                    "recorded_at",
+                    models.DateTimeField(
+                        help_text="When the sync observed the trophy count"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Trophy Sample",
+                "verbose_name_plural": "Trophy Samples",
+                "indexes": [
+                    models.Index(
+                        fields=["player_tag", "recorded_at"],
+                        name="trophysample_player_time_idx",
+                    ),
+                    models.Index(fields=["recorded_at"], name="trophysample_time_idx"),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_trophy_samples, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.5 on 2026-10-17 15:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clashroyale", "0010_trophy_history"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="battlelog",
+            index=models.Index(fields=["timestamp", "id"], name="battlelog_export_idx"),
+        ),
+    ]
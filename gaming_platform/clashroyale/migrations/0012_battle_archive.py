@@ -0,0 +1,65 @@
+# Generated by Django 5.1.5 on 2026-10-17 15:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clashroyale", "0011_battlelog_export_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BattleArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "month",
+                    models.DateField(
+                        help_text="First day of the (UTC) month the archived battles were played in",
+                        unique=True,
+                    ),
+                ),
+                (
+                    "directory",
+                    models.CharField(
+                        help_text="Directory of the month's column files, relative to CLASH_ROYALE_ARCHIVE_DIR",
+                        max_length=100,
+                    ),
+                ),
+                (
+                    "battle_count",
+                    models.PositiveIntegerField(
+                        help_text="Number of battles in the archive"
+                    ),
+                ),
+                (
+                    "size_bytes",
+                    models.PositiveBigIntegerField(
+                        help_text="Total size of the archive's files"
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        auto_now=True,
+                        help_text="When battles were last moved into the archive",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Battle Archive",
+                "verbose_name_plural": "Battle Archives",
+                "ordering": ["month"],
+            },
+        ),
+    ]
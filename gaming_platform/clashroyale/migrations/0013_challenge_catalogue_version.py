@@ -0,0 +1,31 @@
+# Generated by Django 5.1.5 on 2026-10-17 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clashroyale", "0012_battle_archive"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="challenge",
+            name="updated_at",
+            field=models.DateTimeField(
+                blank=True,
+                db_index=True,
+                help_text="When a sync last created or changed the challenge",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="proofrecord",
+            name="catalogue_version",
+            field=models.PositiveBigIntegerField(
+                default=0,
+                help_text="Challenge catalogue version the proof was generated from (challenge proofs only)",
+            ),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:12
+
+from django.db import migrations
+from django.db.models import Max
+
+
+def backfill_sync_states(apps, schema_editor):
+    """
+    Start the high-water mark of every player with stored battles but no
+    sync state at their newest battle. Without it the first sync re-ingests
+    the whole battle log, and battles rekeyed by 0002 (with no opponent tag)
+    are inserted a second time under their full key.
+    """
+    BattleLog = apps.get_model("clashroyale", "BattleLog")
+    PlayerSyncState = apps.get_model("clashroyale", "PlayerSyncState")
+    tracked = set(PlayerSyncState.objects.values_list("player_tag", flat=True))
+    rows = BattleLog.objects.order_by().values("player_tag").annotate(newest=Max("timestamp"))
+    PlayerSyncState.objects.bulk_create(
+        (
+            PlayerSyncState(player_tag=row["player_tag"], last_battle_time=row["newest"])
+            for row in rows.iterator()
+            if row["player_tag"] not in tracked
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clashroyale", "0013_challenge_catalogue_version"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_sync_states, migrations.RunPython.noop),
+    ]
@@ -70,6 +70,12 @@ class Challenge(models.Model):
         help_text="Parent challenge if nested",
     )
     icon_url = models.URLField(blank=True, null=True, help_text="URL of the challenge icon")
+    synced_at = models.DateTimeField(
+        null=True, blank=True, db_index=True, help_text="When the challenge was last seen in /challenges"
+    )
+    updated_at = models.DateTimeField(
+        null=True, blank=True, db_index=True, help_text="When a sync last created or changed the challenge"
+    )
 
     def __str__(self):
         return self.name
@@ -88,6 +94,15 @@ class Player(models.Model):
     name = models.CharField(max_length=100, help_text="Player's in-game name")
     level = models.PositiveIntegerField(help_text="Player's experience level")
     trophies = models.PositiveIntegerField(help_text="Number of trophies the player has")
+    clan_tag = models.CharField(
+        max_length=50, blank=True, default="", help_text="Tag of the player's clan, if any"
+    )
+    last_synced_at = models.DateTimeField(
+        null=True, blank=True, db_index=True, help_text="When the player's data was last fetched from the API"
+    )
+    data_version = models.PositiveIntegerField(
+        default=0, help_text="Bumped whenever ingestion changes data the player's proofs depend on"
+    )
 
     def __str__(self):
         return f"{self.name} ({self.tag})"
@@ -121,7 +136,10 @@ class Clan(models.Model):
 # The BattleLog model stores details of a player's battle history.
 class BattleLog(models.Model):
     battle_id = models.CharField(
-        max_length=255, unique=True, db_index=True, help_text="Unique identifier for the battle"
+        max_length=255,
+        unique=True,
+        db_index=True,
+        help_text="Unique identifier for the battle (player tag, battle time and opponent tag)",
     )
     type = models.CharField(max_length=50, help_text="Type of the battle")
     timestamp = models.DateTimeField(help_text="Timestamp of the battle")
@@ -131,10 +149,11 @@ class BattleLog(models.Model):
     game_mode = models.CharField(
         max_length=100, default="Unknown Mode", help_text="Game mode used in the battle"
     )
-    player_tag = models.CharField(
-        max_length=255, db_index=True, help_text="Player's unique identifier (tag)"
-    )
+    player_tag = models.CharField(max_length=255, help_text="Player's unique identifier (tag)")
     player_name = models.CharField(max_length=255, help_text="Player's name in the battle")
+    opponent_tag = models.CharField(
+        max_length=255, blank=True, default="", help_text="Tag of the (first) opponent in the battle"
+    )
     starting_trophies = models.IntegerField(default=0, help_text="Starting trophies before the battle")
     trophy_change = models.IntegerField(default=0, help_text="Change in trophies after the battle")
     crowns = models.IntegerField(default=0, help_text="Number of crowns earned")
@@ -150,3 +169,221 @@ class BattleLog(models.Model):
         verbose_name = "Battle Log"
         verbose_name_plural = "Battle Logs"
         ordering = ["-timestamp"]
+        # Every battle query is scoped to one player, so player_tag leads each
+        # index (and replaces a single-column one). See the EXPLAIN tests.
+        indexes = [
+            # A player's most recent battles and keyset pages of them
+            models.Index(fields=["player_tag", "-timestamp"], name="battlelog_player_recent_idx"),
+            # Challenge evidence: has the player any battle with trophy_change >= 0
+            models.Index(fields=["player_tag", "trophy_change"], name="battlelog_player_trophy_idx"),
+            # Keyset order of exports across all players (services/export.py)
+            models.Index(fields=["timestamp", "id"], name="battlelog_export_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["player_tag", "timestamp", "opponent_tag"], name="unique_battle_per_player"
+            ),
+        ]
+
+
+# The PlayerSyncState model records how far a player's battle log has been ingested.
+class PlayerSyncState(models.Model):
+    player_tag = models.CharField(
+        max_length=50, unique=True, help_text="Tag of the player whose battle log is tracked"
+    )
+    last_battle_time = models.DateTimeField(
+        null=True, blank=True, help_text="Newest battle time ingested (high-water mark)"
+    )
+    battle_log_hash = models.CharField(
+        max_length=64, blank=True, default="", help_text="SHA-256 of the last ingested battle log payload"
+    )
+    updated_at = models.DateTimeField(auto_now=True, help_text="When the battle log was last ingested")
+
+    def __str__(self):
+        return f"{self.player_tag} up to {self.last_battle_time}"
+
+    class Meta:
+        verbose_name = "Player Sync State"
+        verbose_name_plural = "Player Sync States"
+
+
+# The PlayerStats model holds per-player battle totals, maintained as battles are ingested.
+class PlayerStats(models.Model):
+    player_tag = models.CharField(
+        max_length=50, unique=True, help_text="Tag of the player the totals belong to"
+    )
+    battle_count = models.PositiveIntegerField(default=0, help_text="Number of stored battles")
+    wins = models.PositiveIntegerField(default=0, help_text="Battles in which the player earned crowns")
+    losses = models.PositiveIntegerField(default=0, help_text="Battles in which the player earned no crowns")
+    crowns = models.PositiveIntegerField(default=0, help_text="Total crowns earned")
+    trophy_delta = models.IntegerField(default=0, help_text="Net trophy change over all stored battles")
+    updated_at = models.DateTimeField(auto_now=True, help_text="When the totals last changed")
+
+    def __str__(self):
+        return f"{self.player_tag}: {self.wins}W/{self.losses}L"
+
+    class Meta:
+        verbose_name = "Player Stats"
+        verbose_name_plural = "Player Stats"
+
+
+# The ProofRecord model persists generated proofs for a given version of a player's data.
+class ProofRecord(models.Model):
+    proof_type = models.CharField(max_length=20, help_text="Kind of proof (trophy, win_loss, challenge)")
+    player_tag = models.CharField(max_length=50, help_text="Tag of the player the proof is about")
+    param = models.CharField(max_length=50, help_text="Threshold or challenge id the proof was generated for")
+    data_version = models.PositiveIntegerField(help_text="Player data version the proof was generated from")
+    catalogue_version = models.PositiveBigIntegerField(
+        default=0, help_text="Challenge catalogue version the proof was generated from (challenge proofs only)"
+    )
+    proof = models.JSONField(help_text="The generated proof")
+    created_at = models.DateTimeField(auto_now=True, help_text="When the proof was generated")
+
+    def __str__(self):
+        return f"{self.proof_type} proof for {self.player_tag} ({self.param}, v{self.data_version})"
+
+    class Meta:
+        verbose_name = "Proof Record"
+        verbose_name_plural = "Proof Records"
+        constraints = [
+            # Only the latest version is kept; regenerating a proof overwrites it
+            models.UniqueConstraint(fields=["proof_type", "player_tag", "param"], name="unique_proof_record"),
+        ]
+
+
+# The BattleCommitment model holds the Merkle root over a player's battles, advanced as battles are ingested.
+class BattleCommitment(models.Model):
+    player_tag = models.CharField(
+        max_length=50, unique=True, help_text="Tag of the player whose battles are committed"
+    )
+    leaf_count = models.PositiveIntegerField(default=0, help_text="Number of battles in the tree")
+    peaks = models.JSONField(default=list, help_text="Hex roots of the perfect subtrees, largest first")
+    root = models.CharField(max_length=64, blank=True, default="", help_text="Hex Merkle root over the battles")
+    updated_at = models.DateTimeField(auto_now=True, help_text="When the root last changed")
+
+    def __str__(self):
+        return f"{self.player_tag}: {self.root} ({self.leaf_count} battles)"
+
+    class Meta:
+        verbose_name = "Battle Commitment"
+        verbose_name_plural = "Battle Commitments"
+
+
+# The SyncJob model is a database-backed queue of upstream refreshes processed by run_sync_worker.
+class SyncJob(models.Model):
+    class JobType(models.TextChoices):
+        PLAYER = "player", "Player"
+        CHALLENGES = "challenges", "Challenges"
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    job_type = models.CharField(max_length=20, choices=JobType.choices, help_text="Kind of data to refresh")
+    target_tag = models.CharField(
+        max_length=50, blank=True, default="", help_text="Player tag to refresh (empty for global jobs)"
+    )
+    priority = models.IntegerField(default=0, help_text="Jobs with a higher priority run first")
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.PENDING, help_text="Current state of the job"
+    )
+    attempts = models.PositiveIntegerField(default=0, help_text="Number of times the job has been started")
+    next_run_at = models.DateTimeField(help_text="Earliest time the job may run")
+    locked_by = models.CharField(
+        max_length=64, blank=True, default="", help_text="Claim token of the worker running the job"
+    )
+    locked_at = models.DateTimeField(null=True, blank=True, help_text="When a worker claimed the job")
+    last_error = models.TextField(blank=True, default="", help_text="Error of the last failed attempt")
+    created_at = models.DateTimeField(auto_now_add=True, help_text="When the job was enqueued")
+    updated_at = models.DateTimeField(auto_now=True, help_text="When the job last changed")
+
+    def __str__(self):
+        return f"{self.job_type} {self.target_tag or '-'} ({self.status})"
+
+    class Meta:
+        verbose_name = "Sync Job"
+        verbose_name_plural = "Sync Jobs"
+        indexes = [
+            models.Index(fields=["status", "-priority", "next_run_at"], name="syncjob_claim_idx"),
+        ]
+        constraints = [
+            # At most one queued or running job per target, so repeated enqueues are no-ops
+            models.UniqueConstraint(
+                fields=["job_type", "target_tag"],
+                condition=models.Q(status__in=["pending", "running"]),
+                name="unique_active_sync_job",
+            ),
+        ]
+
+
+# The TrophySample model records a player's trophy count each time a sync finds it changed.
+class TrophySample(models.Model):
+    player_tag = models.CharField(max_length=50, help_text="Tag of the player the sample belongs to")
+    trophies = models.PositiveIntegerField(help_text="Trophy count at the time of the sync")
+    recorded_at = models.DateTimeField(help_text="When the sync observed the trophy count")
+
+    def __str__(self):
+        return f"{self.player_tag}: {self.trophies} at {self.recorded_at}"
+
+    class Meta:
+        verbose_name = "Trophy Sample"
+        verbose_name_plural = "Trophy Samples"
+        indexes = [
+            # A player's history over a time range
+            models.Index(fields=["player_tag", "recorded_at"], name="trophysample_player_time_idx"),
+            # Rollups read every recent sample; retention deletes the oldest
+            models.Index(fields=["recorded_at"], name="trophysample_time_idx"),
+        ]
+
+
+# The TrophyRollup model holds a player's trophy samples downsampled into hourly and daily buckets.
+class TrophyRollup(models.Model):
+    class Resolution(models.TextChoices):
+        HOUR = "hour", "Hour"
+        DAY = "day", "Day"
+
+    player_tag = models.CharField(max_length=50, help_text="Tag of the player the bucket belongs to")
+    resolution = models.CharField(max_length=10, choices=Resolution.choices, help_text="Width of the bucket")
+    bucket_start = models.DateTimeField(help_text="Start of the bucket (UTC)")
+    min_trophies = models.PositiveIntegerField(help_text="Lowest trophy count sampled in the bucket")
+    max_trophies = models.PositiveIntegerField(help_text="Highest trophy count sampled in the bucket")
+    last_trophies = models.PositiveIntegerField(help_text="Latest trophy count sampled in the bucket")
+    sample_count = models.PositiveIntegerField(help_text="Number of raw samples in the bucket")
+
+    def __str__(self):
+        return f"{self.player_tag} {self.resolution} {self.bucket_start}: {self.min_trophies}-{self.max_trophies}"
+
+    class Meta:
+        verbose_name = "Trophy Rollup"
+        verbose_name_plural = "Trophy Rollups"
+        indexes = [
+            # Finding the rollup watermark and applying retention
+            models.Index(fields=["resolution", "bucket_start"], name="trophyrollup_time_idx"),
+        ]
+        constraints = [
+            # Also the index of a player's series at one resolution
+            models.UniqueConstraint(
+                fields=["player_tag", "resolution", "bucket_start"], name="unique_trophy_rollup_bucket"
+            ),
+        ]
+
+
+# The BattleArchive model catalogues the per-month columnar files that cold battles are moved to.
+class BattleArchive(models.Model):
+    month = models.DateField(unique=True, help_text="First day of the (UTC) month the archived battles were played in")
+    directory = models.CharField(
+        max_length=100, help_text="Directory of the month's column files, relative to CLASH_ROYALE_ARCHIVE_DIR"
+    )
+    battle_count = models.PositiveIntegerField(help_text="Number of battles in the archive")
+    size_bytes = models.PositiveBigIntegerField(help_text="Total size of the archive's files")
+    updated_at = models.DateTimeField(auto_now=True, help_text="When battles were last moved into the archive")
+
+    def __str__(self):
+        return f"{self.month:%Y-%m}: {self.battle_count} battles in {self.directory}"
+
+    class Meta:
+        verbose_name = "Battle Archive"
+        verbose_name_plural = "Battle Archives"
+        ordering = ["month"]
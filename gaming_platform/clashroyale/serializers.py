@@ -2,41 +2,86 @@
 
 from rest_framework import serializers
 
-from .models import Card,Clan, Player, Tournament, Location, Challenge, Leaderboard
+from .models import BattleLog, Challenge, Clan, GameMode, Player, Prize
 
-class CardSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Card
-        fields = "__all__"
 
+class SparseFieldsMixin:
+    """
+    Limits the serialized fields to the comma-separated ``?fields=`` query parameter.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        requested = request.query_params.get("fields") if request is not None else None
+        if requested:
+            allowed = {field.strip() for field in requested.split(",")}
+            for name in set(self.fields) - allowed:
+                self.fields.pop(name)
 
 
-class ClanSerializer(serializers.ModelSerializer):
+class ClanSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Clan
-        fields = "__all__"
+        fields = ["tag", "name", "description", "badge_id", "clan_score", "members_count"]
 
-class PlayerSerializer(serializers.ModelSerializer):
+
+class PlayerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Player
-        fields = "__all__"
+        fields = ["tag", "name", "level", "trophies", "clan_tag", "last_synced_at", "data_version"]
+
 
-class TournamentSerializer(serializers.ModelSerializer):
+class GameModeSerializer(serializers.ModelSerializer):
     class Meta:
-        model = Tournament
-        fields = "__all__"
+        model = GameMode
+        fields = ["id", "name"]
 
-class LocationSerializer(serializers.ModelSerializer):
+
+class PrizeSerializer(serializers.ModelSerializer):
     class Meta:
-        model = Location
-        fields = "__all__"
+        model = Prize
+        fields = ["type", "amount", "consumable_name"]
+
+
+class ChallengeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    game_mode = GameModeSerializer(read_only=True)
+    prizes = PrizeSerializer(many=True, read_only=True)
 
-class ChallengeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Challenge
-        fields = "__all__"
+        fields = [
+            "id",
+            "name",
+            "description",
+            "start_time",
+            "end_time",
+            "win_mode",
+            "casual",
+            "max_losses",
+            "max_wins",
+            "game_mode",
+            "icon_url",
+            "prizes",
+            "synced_at",
+        ]
+
 
-class LeaderboardSerializer(serializers.ModelSerializer):
+class BattleLogSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
-        model = Leaderboard
-        fields = "__all__"
\ No newline at end of file
+        model = BattleLog
+        fields = [
+            "battle_id",
+            "type",
+            "timestamp",
+            "arena",
+            "game_mode",
+            "player_tag",
+            "player_name",
+            "opponent_tag",
+            "starting_trophies",
+            "trophy_change",
+            "crowns",
+            "king_tower_hp",
+            "princess_tower_hp",
+        ]
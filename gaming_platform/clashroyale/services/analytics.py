@@ -0,0 +1,297 @@
+import logging
+from itertools import islice
+
+import numpy as np
+
+from clashroyale.models import BattleLog
+from .archive import archived_months
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched (and converted to arrays) per round trip
+CHUNK_SIZE = 10000
+# Player tags per ``IN`` clause, well below SQLite's variable limit
+TAG_BATCH_SIZE = 500
+MAX_CROWNS = 3
+DEFAULT_WINDOW = 10
+
+
+class BattleFrame:
+    """
+    Battles of one or more players as NumPy columns, grouped by player and in
+    battle order within each player.
+
+    String columns are dictionary encoded: ``player``, ``arena`` and
+    ``game_mode`` hold indexes into ``players``, ``arenas`` and ``game_modes``.
+    A battle is a win when the player earned crowns, as in ``PlayerStats``.
+    """
+
+    def __init__(self, players, player, arenas, arena, game_modes, game_mode, crowns, trophy_change):
+        self.players = players
+        self.player = player
+        self.arenas = arenas
+        self.arena = arena
+        self.game_modes = game_modes
+        self.game_mode = game_mode
+        self.crowns = crowns
+        self.trophy_change = trophy_change
+        self.win = crowns > 0
+        # Player codes are assigned in row order, so player i's rows start at starts[i]
+        self.starts = np.flatnonzero(np.diff(player, prepend=-1)) if len(player) else np.empty(0, dtype=np.intp)
+        self.ends = np.append(self.starts[1:], len(player))
+
+    def __len__(self):
+        return len(self.player)
+
+
+class _Encoder:
+    def __init__(self):
+        self.codes = {}
+
+    def encode(self, values):
+        codes = self.codes
+        return np.fromiter((codes.setdefault(value, len(codes)) for value in values), dtype=np.int32, count=len(values))
+
+    def labels(self):
+        return list(self.codes)
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _archived_columns(archive, player_tags, encoders, columns):
+    """
+    Append the analysed columns of an archived month's battles of
+    ``player_tags`` (None: every player), in the month's row order.
+    """
+    if player_tags is None:
+        rows = slice(0, len(archive))
+    else:
+        ranges = [archive.player_rows(player_tag) for player_tag in player_tags]
+        rows = np.concatenate([np.arange(r.start, r.stop) for r in ranges if r.stop > r.start] or [np.empty(0, int)])
+    for name, encoder, parts in zip(("player_tag", "arena", "game_mode"), encoders, columns):
+        codes = archive.column(name)[rows]
+        # Only encode the labels that occur, so every player code has battles
+        present = np.unique(codes)
+        labels = archive.labels(name)
+        translate = np.zeros(len(labels), dtype=np.int32)
+        translate[present] = encoder.encode([labels[code] for code in present.tolist()])
+        parts.append(translate[codes])
+    columns[3].append(np.asarray(archive.column("crowns")[rows], dtype=np.int16))
+    columns[4].append(np.asarray(archive.column("trophy_change")[rows], dtype=np.int32))
+
+
+def load_battles(player_tags=None, chunk_size=CHUNK_SIZE, archived=True):
+    """
+    Load the battles of ``player_tags`` (default: every stored battle) into a ``BattleFrame``.
+
+    Only the analysed columns are fetched, as tuples; timestamps are not
+    (parsing them is the costliest part of a row), the database orders the
+    rows instead.
+
+    :param archived: Include battles moved to the archive; each player's
+        archived battles are older than those still in ``BattleLog``.
+    """
+    battles = BattleLog.objects.all()
+    if player_tags is None:
+        querysets = [battles]
+    else:
+        player_tags = sorted(set(player_tags))
+        querysets = [
+            battles.filter(player_tag__in=player_tags[offset:offset + TAG_BATCH_SIZE])
+            for offset in range(0, len(player_tags), TAG_BATCH_SIZE)
+        ]
+
+    players, arenas, game_modes = _Encoder(), _Encoder(), _Encoder()
+    columns = ([], [], [], [], [])
+    # Oldest month first; within a month a player's rows are in battle order
+    months = archived_months() if archived else []
+    for archive in months:
+        _archived_columns(archive, player_tags, (players, arenas, game_modes), columns)
+    for queryset in querysets:
+        # The exact reverse of battlelog_player_recent_idx, so the database walks
+        # that index rather than sorting (players come out in descending tag order)
+        rows = queryset.order_by("-player_tag", "timestamp").values_list(
+            "player_tag", "arena", "game_mode", "crowns", "trophy_change"
+        )
+        for chunk in _chunks(rows.iterator(chunk_size=chunk_size), chunk_size):
+            tags, chunk_arenas, chunk_modes, crowns, trophy_changes = zip(*chunk)
+            columns[0].append(players.encode(tags))
+            columns[1].append(arenas.encode(chunk_arenas))
+            columns[2].append(game_modes.encode(chunk_modes))
+            columns[3].append(np.array(crowns, dtype=np.int16))
+            columns[4].append(np.array(trophy_changes, dtype=np.int32))
+
+    player, arena, game_mode, crowns, trophy_change = (
+        np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+        for parts, dtype in zip(columns, (np.int32, np.int32, np.int32, np.int16, np.int32))
+    )
+    if months:
+        # Bring each player's archived and stored battles together; the stable
+        # sort keeps them in the order they were appended, which is battle order
+        order = np.argsort(player, kind="stable")
+        player, arena, game_mode, crowns, trophy_change = (
+            column[order] for column in (player, arena, game_mode, crowns, trophy_change)
+        )
+    return BattleFrame(
+        players.labels(), player, arenas.labels(), arena, game_modes.labels(), game_mode, crowns, trophy_change
+    )
+
+
+def moving_average(frame, window=DEFAULT_WINDOW):
+    """
+    Mean trophy change over each battle and up to ``window - 1`` battles
+    before it, without crossing into another player's battles.
+    """
+    if not len(frame):
+        return np.empty(0)
+    cumulative = np.concatenate(([0], np.cumsum(frame.trophy_change, dtype=np.int64)))
+    positions = np.arange(1, len(frame) + 1)
+    lower = np.maximum(positions - window, frame.starts[frame.player])
+    return (cumulative[positions] - cumulative[lower]) / (positions - lower)
+
+
+def streaks(frame):
+    """
+    :return: ``(longest_win, longest_loss, current)`` arrays per player;
+        ``current`` is positive for a win streak and negative for a loss streak.
+    """
+    if not len(frame):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    # A run ends where the outcome or the player changes
+    boundaries = np.flatnonzero(np.diff(frame.win.astype(np.int8), prepend=-1) | np.diff(frame.player, prepend=-1))
+    lengths = np.diff(np.append(boundaries, len(frame)))
+    won = frame.win[boundaries]
+    run_player = frame.player[boundaries]
+    first_runs = np.flatnonzero(np.diff(run_player, prepend=-1))
+    longest_win = np.maximum.reduceat(np.where(won, lengths, 0), first_runs)
+    longest_loss = np.maximum.reduceat(np.where(won, 0, lengths), first_runs)
+    last_runs = np.append(first_runs[1:], len(boundaries)) - 1
+    current = np.where(won[last_runs], lengths[last_runs], -lengths[last_runs])
+    return longest_win, longest_loss, current
+
+
+def summarize_players(frame, window=DEFAULT_WINDOW):
+    """
+    Per-player statistics, as arrays aligned with ``frame.players``.
+
+    :return: Dict of battles, wins, losses, win_rate, crowns (an ``(n, 4)``
+        array counting battles with 0-3 crowns), trophy_delta, trophy_trend
+        (``moving_average`` at the latest battle), longest_win_streak,
+        longest_loss_streak and current_streak.
+    """
+    battles = frame.ends - frame.starts
+    if len(frame):
+        wins = np.add.reduceat(frame.win, frame.starts, dtype=np.int64)
+        trophy_delta = np.add.reduceat(frame.trophy_change, frame.starts, dtype=np.int64)
+        trophy_trend = moving_average(frame, window)[frame.ends - 1]
+    else:
+        wins = trophy_delta = np.empty(0, dtype=np.int64)
+        trophy_trend = np.empty(0)
+    buckets = MAX_CROWNS + 1
+    crowns = np.bincount(
+        frame.player.astype(np.int64) * buckets + np.clip(frame.crowns, 0, MAX_CROWNS),
+        minlength=len(frame.players) * buckets,
+    ).reshape(len(frame.players), buckets)
+    longest_win, longest_loss, current = streaks(frame)
+    return {
+        "battles": battles,
+        "wins": wins,
+        "losses": battles - wins,
+        "win_rate": np.divide(wins, battles, out=np.zeros(len(battles)), where=battles > 0),
+        "crowns": crowns,
+        "trophy_delta": trophy_delta,
+        "trophy_trend": trophy_trend,
+        "longest_win_streak": longest_win,
+        "longest_loss_streak": longest_loss,
+        "current_streak": current,
+    }
+
+
+def breakdown(frame, by="arena", per_player=False):
+    """
+    Battles, wins, win rate, mean crowns and mean trophy change per arena or
+    game mode, overall or per player (one group-by over all rows).
+
+    :param by: ``"arena"`` or ``"game_mode"``.
+    :return: List of dicts, by player tag (when ``per_player``) and then by most battles.
+    """
+    if by == "arena":
+        codes, labels = frame.arena, frame.arenas
+    elif by == "game_mode":
+        codes, labels = frame.game_mode, frame.game_modes
+    else:
+        raise ValueError(f"Cannot break battles down by {by!r}; expected arena or game_mode.")
+
+    keys = codes.astype(np.int64)
+    if per_player:
+        keys += frame.player.astype(np.int64) * len(labels)
+    groups, inverse = np.unique(keys, return_inverse=True)
+    battles = np.bincount(inverse, minlength=len(groups))
+    wins = np.bincount(inverse, weights=frame.win, minlength=len(groups))
+    crowns = np.bincount(inverse, weights=frame.crowns, minlength=len(groups))
+    trophy_change = np.bincount(inverse, weights=frame.trophy_change, minlength=len(groups))
+
+    player_codes, label_codes = np.divmod(groups, len(labels)) if len(labels) else (groups, groups)
+    if per_player:
+        tag_rank = np.empty(len(frame.players), dtype=np.int64)
+        tag_rank[sorted(range(len(frame.players)), key=frame.players.__getitem__)] = np.arange(len(frame.players))
+        order = np.lexsort((-battles, tag_rank[player_codes]))
+    else:
+        order = np.argsort(-battles, kind="stable")
+    rows = []
+    for index in order.tolist():
+        row = {"player_tag": frame.players[player_codes[index]]} if per_player else {}
+        row.update(
+            {
+                by: labels[label_codes[index]],
+                "battles": int(battles[index]),
+                "wins": int(wins[index]),
+                "win_rate": round(float(wins[index] / battles[index]), 4),
+                "avg_crowns": round(float(crowns[index] / battles[index]), 3),
+                "avg_trophy_change": round(float(trophy_change[index] / battles[index]), 2),
+            }
+        )
+        rows.append(row)
+    return rows
+
+
+def player_reports(frame, window=DEFAULT_WINDOW):
+    """
+    ``summarize_players`` as one JSON-serializable dict per player, by tag.
+    """
+    summary = summarize_players(frame, window)
+    columns = {name: values.tolist() for name, values in summary.items()}
+    reports = []
+    for index in sorted(range(len(frame.players)), key=frame.players.__getitem__):
+        reports.append(
+            {
+                "player_tag": frame.players[index],
+                "battles": columns["battles"][index],
+                "wins": columns["wins"][index],
+                "losses": columns["losses"][index],
+                "win_rate": round(columns["win_rate"][index], 4),
+                "crowns": dict(enumerate(columns["crowns"][index])),
+                "trophy_delta": columns["trophy_delta"][index],
+                "trophy_trend": round(columns["trophy_trend"][index], 2),
+                "longest_win_streak": columns["longest_win_streak"][index],
+                "longest_loss_streak": columns["longest_loss_streak"][index],
+                "current_streak": columns["current_streak"][index],
+            }
+        )
+    return reports
+
+
+def battle_report(frame, window=DEFAULT_WINDOW, per_player_breakdowns=False):
+    """
+    The full analytics report over a ``BattleFrame`` (see ``load_battles``).
+    """
+    return {
+        "battles": len(frame),
+        "players": player_reports(frame, window),
+        "arenas": breakdown(frame, "arena", per_player_breakdowns),
+        "game_modes": breakdown(frame, "game_mode", per_player_breakdowns),
+    }
@@ -1,33 +1,213 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
 import requests
-from .config import API_BASE_URL, HEADERS
+from requests.adapters import HTTPAdapter
+
+from .cache import get_response_cache
+from .config import (
+    API_BASE_URL,
+    HEADERS,
+    POOL_SIZE,
+    CONNECT_TIMEOUT,
+    READ_TIMEOUT,
+    MAX_RETRIES,
+    BACKOFF_FACTOR,
+    BACKOFF_MAX,
+    RETRY_STATUSES,
+)
+from .metrics import observe_upstream, span
+from .ratelimit import RateLimitExceeded, get_rate_limiter
+from .singleflight import get_single_flight
+
+logger = logging.getLogger(__name__)
+
+
+def parse_retry_after(value):
+    """
+    Parse a ``Retry-After`` header into a number of seconds.
+
+    :param value: Header value, either delta-seconds or an HTTP date.
+    :return: Seconds to wait, or None if the header is missing or malformed.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None, factor=BACKOFF_FACTOR, cap=BACKOFF_MAX):
+    """
+    Compute the delay before retry number ``attempt`` (starting at 0).
+
+    Uses "full jitter" exponential backoff, but never waits less than the
+    upstream asked for via ``Retry-After``.
+    """
+    delay = random.uniform(0, min(cap, factor * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, min(cap, retry_after))
+    return delay
+
+
+class ClashRoyaleClient:
+    """
+    Thin client over a pooled, keep-alive ``requests.Session``.
+
+    A single instance is shared per process (see ``get_client``); the session
+    is created lazily under a lock and its connection pool is safe to use from
+    several threads at once.
+    """
 
-def make_request(endpoint, params=None):
+    def __init__(
+        self,
+        base_url=API_BASE_URL,
+        headers=None,
+        pool_size=POOL_SIZE,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        max_retries=MAX_RETRIES,
+    ):
+        self.base_url = base_url
+        self.headers = dict(HEADERS if headers is None else headers)
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self._session = None
+        self._lock = threading.Lock()
+        # Number of HTTP requests actually sent upstream (retries included)
+        self.requests_sent = 0
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    session.headers.update(self.headers)
+                    # Retries are handled in ``get`` so that Retry-After and jitter apply
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+        return self._session
+
+    def get(self, endpoint, params=None, headers=None, block=True):
+        """
+        Issue a GET against the API, retrying on 429/5xx and connection errors.
+
+        Every attempt first takes budget from the host-wide rate limiter, which
+        also picks the API token to send.
+
+        :param endpoint: API endpoint (e.g., "/players/{playerTag}").
+        :param params: Query parameters for the request.
+        :param headers: Extra headers for this request only.
+        :param block: Wait for rate-limit budget instead of failing fast.
+        :return: The final ``requests.Response`` (which may still be an error response).
+        :raises requests.exceptions.RequestException: If every attempt failed at the transport level.
+        :raises RateLimitExceeded: If no rate-limit budget became available in time.
+        """
+        url = f"{self.base_url}{endpoint}"
+        limiter = get_rate_limiter()
+        attempt = 0
+        while True:
+            token, request_headers = None, headers
+            if limiter is not None:
+                token = limiter.acquire(block=block)
+                request_headers = {**(headers or {}), "Authorization": f"Bearer {token}"}
+            with self._lock:
+                self.requests_sent += 1
+            try:
+                response = self.session.get(url, params=params, headers=request_headers, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"GET {endpoint} failed ({e}); retrying in {delay:.2f}s")
+            else:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if response.status_code == 429 and token is not None:
+                    # Take this token out of rotation for every process until upstream allows it again
+                    limiter.penalize(token, retry_after or 1.0)
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                delay = backoff_delay(attempt, retry_after)
+                logger.warning(f"GET {endpoint} returned {response.status_code}; retrying in {delay:.2f}s")
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the process-wide ``ClashRoyaleClient`` (one connection pool per process).
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ClashRoyaleClient()
+    return _client
+
+
+def make_request(endpoint, params=None, block=True):
     """
     Make a request to the Clash Royale API.
 
+    Responses for cacheable endpoints are served from the upstream response
+    cache (see ``services/cache.py``) and revalidated with ``If-None-Match``;
+    concurrent identical calls are coalesced into a single upstream request.
+
     :param endpoint: API endpoint (e.g., "/players/{playerTag}").
     :param params: Query parameters for the request.
+    :param block: Wait for rate-limit budget; if False, fail fast with a "retry_after" hint.
     :return: JSON response or error message.
     """
-    url = f"{API_BASE_URL}{endpoint}"
-    try:
-        response = requests.get(url, headers=HEADERS, params=params)
-        
+    client = get_client()
+
+    def send(headers):
+        started = time.perf_counter()
+        try:
+            response = client.get(endpoint, params=params, headers=headers, block=block)
+        except requests.exceptions.RequestException:
+            observe_upstream(endpoint, "error", time.perf_counter() - started)
+            raise
+        observe_upstream(endpoint, response.status_code, time.perf_counter() - started)
         # Log the status code and response content for debugging purposes
         if not response.ok:
-            print(f"Error {response.status_code}: {response.text}")
-        
-        response.raise_for_status()  # Raises an HTTPError for bad responses (4xx, 5xx)
-        
-        # Log the response headers to ensure it's JSON
-        print(f"Response Headers: {response.headers}")
-        
-        # Attempt to parse the JSON response
-        try:
-            return response.json()
-        except ValueError:
-            print("Response is not in JSON format.")
-            return {"error": "Response is not in JSON format."}
+            logger.warning(f"Error {response.status_code} for {endpoint}: {response.text}")
+        logger.debug(f"Response headers for {endpoint}: {response.headers}")
+        return response
+
+    try:
+        cache = get_response_cache()
+        # Identical concurrent calls share one cache lookup / upstream request
+        with span("upstream"):
+            return get_single_flight().do(cache.key(endpoint, params), lambda: cache.fetch(endpoint, params, send))
+    except RateLimitExceeded as e:
+        logger.warning(f"Rate limited before requesting {endpoint}: {e}")
+        return {"error": str(e), "retry_after": e.retry_after}
+    except ValueError:
+        logger.warning(f"Response for {endpoint} is not in JSON format.")
+        return {"error": "Response is not in JSON format."}
     except requests.exceptions.RequestException as e:
-        print(f"Request failed: {e}")
+        logger.error(f"Request failed: {e}")
         return {"error": str(e)}
@@ -0,0 +1,462 @@
+import json
+import logging
+import os
+import secrets
+import shutil
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import cached_property
+from itertools import islice
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from clashroyale.models import BattleArchive, BattleLog, Player
+from .config import ARCHIVE_AFTER_DAYS, ARCHIVE_DIR
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+# Dictionary-encoded columns: <name>.npy holds int32 codes into <name>.strings.json.
+# Labels are sorted, so player_tag codes order rows the way the tags do.
+STRING_COLUMNS = ("player_tag", "player_name", "opponent_tag", "arena", "game_mode", "type")
+NUMBER_COLUMNS = {
+    "starting_trophies": np.int32,
+    "trophy_change": np.int32,
+    "crowns": np.int16,
+    "king_tower_hp": np.int32,
+}
+# princess_tower_hp.npy is an (n, 2) array, MISSING_HP where the API sent no value
+# (so an empty list reads back as None)
+PRINCESS_TOWERS = 2
+MISSING_HP = -1
+COLUMNS = ("battle_id", "timestamp", *STRING_COLUMNS, *NUMBER_COLUMNS, "princess_tower_hp")
+ARCHIVE_FIELDS = ("id", *COLUMNS)
+
+# Rows read from BattleLog per round trip, and deleted (or player tags updated) per statement
+CHUNK_SIZE = 10000
+DELETE_BATCH_SIZE = 500
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def to_micros(moment):
+    return (moment - _EPOCH) // _MICROSECOND
+
+
+def from_micros(micros):
+    return _EPOCH + int(micros) * _MICROSECOND
+
+
+def month_start(moment):
+    return moment.astimezone(dt_timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(start):
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def archive_cutoff(days=None, now=None):
+    """
+    Battles before this time are archived: the start of the month holding
+    ``now - days``, so only whole months are moved. None when ``days`` is 0.
+    """
+    days = ARCHIVE_AFTER_DAYS if days is None else days
+    if days <= 0:
+        return None
+    return month_start((now or timezone.now()) - timedelta(days=days))
+
+
+class MonthArchive:
+    """
+    One month of archived battles, read from its directory of ``.npy`` column
+    files. Columns are memory-mapped on first use, so a query only pages in
+    the rows it reads. Rows are ordered by player tag, timestamp and battle id.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._columns = {}
+        self._labels = {}
+
+    @cached_property
+    def manifest(self):
+        with open(os.path.join(self.path, "manifest.json")) as f:
+            manifest = json.load(f)
+        if manifest.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported battle archive format in {self.path}: {manifest.get('format')!r}")
+        return manifest
+
+    def __len__(self):
+        return self.manifest["battles"]
+
+    def column(self, name):
+        column = self._columns.get(name)
+        if column is None:
+            column = self._columns[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+        return column
+
+    def labels(self, name):
+        labels = self._labels.get(name)
+        if labels is None:
+            with open(os.path.join(self.path, f"{name}.strings.json")) as f:
+                labels = self._labels[name] = json.load(f)
+        return labels
+
+    @cached_property
+    def _player_codes(self):
+        return {player_tag: code for code, player_tag in enumerate(self.labels("player_tag"))}
+
+    def player_rows(self, player_tag):
+        """
+        The slice of rows holding a player's battles (empty if they have none).
+        """
+        code = self._player_codes.get(player_tag)
+        if code is None:
+            return slice(0, 0)
+        codes = self.column("player_tag")
+        return slice(int(np.searchsorted(codes, code, "left")), int(np.searchsorted(codes, code, "right")))
+
+    def select(self, player_tag=None, since=None, until=None):
+        """
+        Rows of ``player_tag`` (default: every player) played in ``[since, until)``.
+
+        :param since: Microseconds since the epoch, or None.
+        :param until: Microseconds since the epoch, or None.
+        :return: A slice, or an array of row indexes.
+        """
+        rows = slice(0, len(self)) if player_tag is None else self.player_rows(player_tag)
+        if (since is None or self.manifest["first"] >= since) and (until is None or self.manifest["last"] < until):
+            return rows
+        timestamps = self.column("timestamp")[rows]
+        if player_tag is not None:
+            # A player's timestamps are sorted
+            low = np.searchsorted(timestamps, since) if since is not None else 0
+            high = np.searchsorted(timestamps, until) if until is not None else len(timestamps)
+            return slice(rows.start + int(low), rows.start + int(high))
+        keep = np.ones(len(timestamps), dtype=bool)
+        if since is not None:
+            keep &= timestamps >= since
+        if until is not None:
+            keep &= timestamps < until
+        return np.flatnonzero(keep)
+
+    def battles(self, rows):
+        """
+        The battles at ``rows`` as dicts of ``BattleLog`` field values.
+        """
+        columns = {name: self.column(name)[rows].tolist() for name in ("timestamp", *NUMBER_COLUMNS)}
+        for name in STRING_COLUMNS:
+            labels = self.labels(name)
+            columns[name] = [labels[code] for code in self.column(name)[rows].tolist()]
+        columns["timestamp"] = [from_micros(micros) for micros in columns["timestamp"]]
+        columns["battle_id"] = [battle_id.decode() for battle_id in self.column("battle_id")[rows].tolist()]
+        columns["princess_tower_hp"] = [
+            [hp for hp in towers if hp != MISSING_HP] or None
+            for towers in self.column("princess_tower_hp")[rows].tolist()
+        ]
+        names = list(columns)
+        return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+# Opened archives by directory; a directory is never rewritten, only replaced
+_archives = {}
+
+
+def archived_months(since=None, until=None):
+    """
+    The catalogued ``MonthArchive``s overlapping ``[since, until)``, oldest first.
+    """
+    global _archives
+    catalog = list(BattleArchive.objects.order_by("month").values_list("month", "directory"))
+    _archives = archives = {
+        directory: _archives.get(directory) or MonthArchive(os.path.join(ARCHIVE_DIR, directory))
+        for _, directory in catalog
+    }
+    months = []
+    for month, directory in catalog:
+        start = datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+        if (until is None or start < until) and (since is None or next_month(start) > since):
+            months.append(archives[directory])
+    return months
+
+
+def archived_until():
+    """
+    The end of the latest archived month: battles before it may be in the
+    archive rather than in ``BattleLog``. None when nothing is archived.
+    """
+    month = BattleArchive.objects.order_by("-month").values_list("month", flat=True).first()
+    return next_month(datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)) if month else None
+
+
+def archive_updated_at():
+    """
+    When battles were last moved into the archive, or None.
+    """
+    return BattleArchive.objects.order_by("-updated_at").values_list("updated_at", flat=True).first()
+
+
+def archived_battle_stats(player_tag=None, since=None, until=None):
+    """
+    Totals of the archived battles of a player (default: every player) played
+    in ``[since, until)``, with the keys of ``aggregate_battle_stats`` plus
+    win_rate. Computed over the memory-mapped columns, without the ORM.
+    """
+    since_micros = to_micros(since) if since is not None else None
+    until_micros = to_micros(until) if until is not None else None
+    totals = {"battle_count": 0, "wins": 0, "crowns": 0, "trophy_delta": 0}
+    for archive in archived_months(since, until):
+        rows = archive.select(player_tag, since_micros, until_micros)
+        crowns = archive.column("crowns")[rows]
+        totals["battle_count"] += len(crowns)
+        totals["wins"] += int(np.count_nonzero(crowns > 0))
+        totals["crowns"] += int(crowns.sum(dtype=np.int64))
+        totals["trophy_delta"] += int(archive.column("trophy_change")[rows].sum(dtype=np.int64))
+    totals["losses"] = totals["battle_count"] - totals["wins"]
+    totals["win_rate"] = round(totals["wins"] / totals["battle_count"], 4) if totals["battle_count"] else 0.0
+    return totals
+
+
+def archived_battles(player_tag):
+    """
+    A player's archived battles as dicts of ``BattleLog`` field values, in
+    ``(timestamp, battle_id)`` order.
+    """
+    for archive in archived_months():
+        rows = archive.player_rows(player_tag)
+        if rows.stop > rows.start:
+            yield from archive.battles(rows)
+
+
+def archived_battle(player_tag, battle_id):
+    """
+    One of a player's archived battles as a dict of field values, or None.
+    """
+    key = battle_id.encode()
+    for archive in archived_months():
+        rows = archive.player_rows(player_tag)
+        matches = np.flatnonzero(archive.column("battle_id")[rows] == key)
+        if len(matches):
+            row = rows.start + int(matches[0])
+            return archive.battles(slice(row, row + 1))[0]
+    return None
+
+
+def has_archived_battle(player_tag, min_trophy_change):
+    """
+    Whether the player has an archived battle with at least ``min_trophy_change``.
+    """
+    for archive in archived_months():
+        rows = archive.player_rows(player_tag)
+        if rows.stop > rows.start and bool((archive.column("trophy_change")[rows] >= min_trophy_change).any()):
+            return True
+    return False
+
+
+def archivable_months(cutoff):
+    """
+    :return: ``[(month start, battles)]`` of the months holding BattleLog rows before ``cutoff``.
+    """
+    months = (
+        BattleLog.objects.filter(timestamp__lt=cutoff)
+        .annotate(month=TruncMonth("timestamp", tzinfo=dt_timezone.utc))
+        .values("month")
+        .annotate(battles=Count("id"))
+        .order_by("month")
+    )
+    return [(month_start(row["month"]), row["battles"]) for row in months]
+
+
+def _tower_hp(hp):
+    hp = list(hp or [])[:PRINCESS_TOWERS]
+    return hp + [MISSING_HP] * (PRINCESS_TOWERS - len(hp))
+
+
+def _encode(values, codes):
+    return np.fromiter((codes.setdefault(value, len(codes)) for value in values), dtype=np.int32, count=len(values))
+
+
+def _read_battles(start, end, chunk_size):
+    """
+    A month's BattleLog rows as ``(ids, columns, labels)``; string columns
+    are encoded in order of appearance.
+    """
+    labels = {name: {} for name in STRING_COLUMNS}
+    ids, parts = [], {name: [] for name in COLUMNS}
+    rows = iter(
+        BattleLog.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        .order_by()
+        .values_list(*ARCHIVE_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+    while chunk := list(islice(rows, chunk_size)):
+        values = dict(zip(ARCHIVE_FIELDS, zip(*chunk)))
+        ids.extend(values["id"])
+        parts["battle_id"].append(np.array([battle_id.encode() for battle_id in values["battle_id"]], dtype=np.bytes_))
+        parts["timestamp"].append(
+            np.fromiter((to_micros(moment) for moment in values["timestamp"]), dtype=np.int64, count=len(chunk))
+        )
+        for name in STRING_COLUMNS:
+            parts[name].append(_encode(values[name], labels[name]))
+        for name, dtype in NUMBER_COLUMNS.items():
+            parts[name].append(np.array(values[name], dtype=dtype))
+        parts["princess_tower_hp"].append(
+            np.array([_tower_hp(hp) for hp in values["princess_tower_hp"]], dtype=np.int32).reshape(-1, PRINCESS_TOWERS)
+        )
+    columns = {name: np.concatenate(arrays) for name, arrays in parts.items() if arrays}
+    return ids, columns, {name: list(codes) for name, codes in labels.items()}
+
+
+def _combine(parts):
+    """
+    Concatenate ``(columns, labels)`` parts into one month: string columns
+    are re-encoded against sorted labels, rows are sorted by player,
+    timestamp and battle id, and repeated battle ids are dropped.
+    """
+    columns, labels = {}, {}
+    for name in STRING_COLUMNS:
+        labels[name] = sorted(set().union(*(part_labels[name] for _, part_labels in parts)))
+        index = {label: code for code, label in enumerate(labels[name])}
+        columns[name] = np.concatenate(
+            [
+                np.array([index[label] for label in part_labels[name]], dtype=np.int32)[part_columns[name]]
+                for part_columns, part_labels in parts
+            ]
+        )
+    for name in ("battle_id", "timestamp", *NUMBER_COLUMNS, "princess_tower_hp"):
+        columns[name] = np.concatenate([part_columns[name] for part_columns, _ in parts])
+
+    order = np.lexsort((columns["battle_id"], columns["timestamp"], columns["player_tag"]))
+    battle_ids = columns["battle_id"][order]
+    unique = np.ones(len(order), dtype=bool)
+    unique[1:] = battle_ids[1:] != battle_ids[:-1]
+    if not unique.all():
+        logger.warning(f"Dropping {len(order) - int(unique.sum())} battles already in the archive")
+    order = order[unique]
+    return {name: column[order] for name, column in columns.items()}, labels
+
+
+def _write_file(path, write):
+    with open(path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
+
+
+def _fsync_directory(path):
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _write_archive(month, columns, labels):
+    """
+    Write a month's columns into a new directory, made visible by one rename
+    once every file is on disk.
+
+    :return: ``(directory, size in bytes)``
+    """
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    directory = f"{month:%Y-%m}.{secrets.token_hex(4)}"
+    staging = os.path.join(ARCHIVE_DIR, f".{directory}.tmp")
+    os.mkdir(staging)
+    try:
+        size = 0
+        for name, column in columns.items():
+            size += _write_file(os.path.join(staging, f"{name}.npy"), lambda f: np.save(f, column))
+        for name, values in labels.items():
+            encoded = json.dumps(values, separators=(",", ":")).encode()
+            size += _write_file(os.path.join(staging, f"{name}.strings.json"), lambda f: f.write(encoded))
+        manifest = {
+            "format": FORMAT_VERSION,
+            "month": f"{month:%Y-%m}",
+            "battles": len(columns["timestamp"]),
+            "first": int(columns["timestamp"].min()),
+            "last": int(columns["timestamp"].max()),
+        }
+        encoded = json.dumps(manifest).encode()
+        size += _write_file(os.path.join(staging, "manifest.json"), lambda f: f.write(encoded))
+        os.rename(staging, os.path.join(ARCHIVE_DIR, directory))
+        _fsync_directory(ARCHIVE_DIR)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return directory, size
+
+
+def _archive_parts(archive):
+    """
+    An archived month as a ``(columns, labels)`` part for ``_combine``.
+    """
+    return (
+        {name: np.array(archive.column(name)) for name in COLUMNS},
+        {name: archive.labels(name) for name in STRING_COLUMNS},
+    )
+
+
+def archive_month(start, chunk_size=CHUNK_SIZE):
+    """
+    Move a month's BattleLog rows into its archive, merging them with the
+    battles archived before (a rerun, or battles ingested late).
+
+    The new files are written first; the rows are deleted, the catalogue
+    pointed at the new directory and the moved players' ``data_version``
+    bumped in one transaction, so a failure at any point leaves every battle
+    either in BattleLog or in the archive, and cached battle pages and proofs
+    of those players are invalidated.
+
+    :return: The number of battles moved.
+    """
+    ids, columns, labels = _read_battles(start, next_month(start), chunk_size)
+    if not ids:
+        return 0
+    moved_players = labels["player_tag"]
+    parts = [(columns, labels)]
+    previous = BattleArchive.objects.filter(month=start.date()).first()
+    if previous is not None:
+        parts.insert(0, _archive_parts(MonthArchive(os.path.join(ARCHIVE_DIR, previous.directory))))
+    columns, labels = _combine(parts)
+
+    directory, size = _write_archive(start, columns, labels)
+    try:
+        with transaction.atomic():
+            for offset in range(0, len(ids), DELETE_BATCH_SIZE):
+                BattleLog.objects.filter(id__in=ids[offset:offset + DELETE_BATCH_SIZE]).delete()
+            for offset in range(0, len(moved_players), DELETE_BATCH_SIZE):
+                Player.objects.filter(tag__in=moved_players[offset:offset + DELETE_BATCH_SIZE]).update(
+                    data_version=F("data_version") + 1
+                )
+            BattleArchive.objects.update_or_create(
+                month=start.date(),
+                defaults={"directory": directory, "battle_count": len(columns["timestamp"]), "size_bytes": size},
+            )
+    except BaseException:
+        shutil.rmtree(os.path.join(ARCHIVE_DIR, directory), ignore_errors=True)
+        raise
+    if previous is not None:
+        # Processes that still map the old files keep reading them until they close
+        shutil.rmtree(os.path.join(ARCHIVE_DIR, previous.directory), ignore_errors=True)
+    logger.info(f"Archived {len(ids)} battles of {start:%Y-%m} into {directory} ({size} bytes)")
+    return len(ids)
+
+
+def archive_battles(days=None, now=None, chunk_size=CHUNK_SIZE):
+    """
+    Archive every whole month of battles older than ``days`` (default:
+    CLASH_ROYALE_ARCHIVE_AFTER_DAYS).
+
+    :return: ``{month start: battles moved}``
+    """
+    cutoff = archive_cutoff(days, now)
+    if cutoff is None:
+        return {}
+    return {start: archive_month(start, chunk_size) for start, _ in archivable_months(cutoff)}
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import weakref
+
+import aiohttp
+
+from .api_client import backoff_delay, parse_retry_after
+from .cache import get_response_cache
+from .config import (
+    API_BASE_URL,
+    HEADERS,
+    POOL_SIZE,
+    CONNECT_TIMEOUT,
+    READ_TIMEOUT,
+    MAX_RETRIES,
+    RETRY_STATUSES,
+)
+from .metrics import observe_upstream, span
+from .ratelimit import RateLimitExceeded, get_rate_limiter
+from .singleflight import get_single_flight
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncResponse:
+    """
+    Fully-read upstream response, safe to use after the connection is released.
+    """
+
+    def __init__(self, url, status, headers, text):
+        self.url = url
+        self.status_code = status
+        self.headers = headers
+        self.text = text
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise aiohttp.ClientError(f"{self.status_code} Error for url: {self.url}")
+
+    def json(self):
+        return json.loads(self.text)
+
+
+async def _close_on_loop_shutdown(session):
+    try:
+        yield
+    finally:
+        await session.close()
+
+
+class AsyncClashRoyaleClient:
+    """
+    Async counterpart of ``ClashRoyaleClient`` built on ``aiohttp``.
+
+    An ``aiohttp.ClientSession`` is bound to the event loop it was created on,
+    so one pooled session is kept per running loop. Under ASGI there is a single
+    long-lived loop per worker, which gives one connection pool per process.
+    """
+
+    def __init__(
+        self,
+        base_url=API_BASE_URL,
+        headers=None,
+        pool_size=POOL_SIZE,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        max_retries=MAX_RETRIES,
+    ):
+        self.base_url = base_url
+        self.headers = dict(HEADERS if headers is None else headers)
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.max_retries = max_retries
+        self._sessions = weakref.WeakKeyDictionary()
+
+    async def _get_session(self):
+        loop = asyncio.get_running_loop()
+        entry = self._sessions.get(loop)
+        if entry is None or entry[0].closed:
+            connector = aiohttp.TCPConnector(limit_per_host=self.pool_size)
+            session = aiohttp.ClientSession(headers=self.headers, timeout=self.timeout, connector=connector)
+            # Parking an async generator on the loop ties the session's lifetime to
+            # it: loop shutdown (``shutdown_asyncgens``) closes the session cleanly,
+            # which matters when async views run in short-lived loops under WSGI.
+            closer = _close_on_loop_shutdown(session)
+            await closer.__anext__()
+            entry = self._sessions[loop] = (session, closer)
+        return entry[0]
+
+    async def get(self, endpoint, params=None, headers=None, block=True):
+        """
+        Issue a GET against the API, retrying on 429/5xx and connection errors.
+
+        Every attempt first takes budget from the host-wide rate limiter, which
+        also picks the API token to send.
+
+        :param endpoint: API endpoint (e.g., "/players/{playerTag}").
+        :param params: Query parameters for the request.
+        :param headers: Extra headers for this request only.
+        :param block: Wait for rate-limit budget instead of failing fast.
+        :return: The final ``AsyncResponse`` (which may still be an error response).
+        :raises aiohttp.ClientError: If every attempt failed at the transport level.
+        :raises RateLimitExceeded: If no rate-limit budget became available in time.
+        """
+        url = f"{self.base_url}{endpoint}"
+        limiter = get_rate_limiter()
+        attempt = 0
+        while True:
+            token, request_headers = None, headers
+            if limiter is not None:
+                token = await limiter.aacquire(block=block)
+                request_headers = {**(headers or {}), "Authorization": f"Bearer {token}"}
+            try:
+                async with (await self._get_session()).get(url, params=params, headers=request_headers) as response:
+                    result = AsyncResponse(url, response.status, response.headers, await response.text())
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"GET {endpoint} failed ({e!r}); retrying in {delay:.2f}s")
+            else:
+                retry_after = parse_retry_after(result.headers.get("Retry-After"))
+                if result.status_code == 429 and token is not None:
+                    # Take this token out of rotation for every process until upstream allows it again
+                    await limiter.apenalize(token, retry_after or 1.0)
+                if result.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return result
+                delay = backoff_delay(attempt, retry_after)
+                logger.warning(f"GET {endpoint} returned {result.status_code}; retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def close(self):
+        entry = self._sessions.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[1].aclose()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_async_client():
+    """
+    Return the process-wide ``AsyncClashRoyaleClient``.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AsyncClashRoyaleClient()
+    return _client
+
+
+async def async_make_request(endpoint, params=None, block=True):
+    """
+    Async counterpart of ``make_request`` with the same return contract.
+
+    :param endpoint: API endpoint (e.g., "/players/{playerTag}").
+    :param params: Query parameters for the request.
+    :param block: Wait for rate-limit budget; if False, fail fast with a "retry_after" hint.
+    :return: JSON response or error message.
+    """
+    client = get_async_client()
+
+    async def send(headers):
+        started = time.perf_counter()
+        try:
+            response = await client.get(endpoint, params=params, headers=headers, block=block)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            observe_upstream(endpoint, "error", time.perf_counter() - started)
+            raise
+        observe_upstream(endpoint, response.status_code, time.perf_counter() - started)
+        if not response.ok:
+            logger.warning(f"Error {response.status_code} for {endpoint}: {response.text}")
+        logger.debug(f"Response headers for {endpoint}: {response.headers}")
+        return response
+
+    try:
+        cache = get_response_cache()
+        # Identical concurrent calls share one cache lookup / upstream request
+        with span("upstream"):
+            return await get_single_flight().ado(
+                cache.key(endpoint, params), lambda: cache.afetch(endpoint, params, send)
+            )
+    except RateLimitExceeded as e:
+        logger.warning(f"Rate limited before requesting {endpoint}: {e}")
+        return {"error": str(e), "retry_after": e.retry_after}
+    except ValueError:
+        logger.warning(f"Response for {endpoint} is not in JSON format.")
+        return {"error": "Response is not in JSON format."}
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Request failed: {e!r}")
+        return {"error": str(e) or repr(e)}
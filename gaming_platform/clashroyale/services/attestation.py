@@ -0,0 +1,172 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from eth_account import Account
+from eth_account.messages import encode_defunct
+from eth_keys.exceptions import BadSignature
+from eth_utils.exceptions import ValidationError
+
+from .config import ATTESTATION_CACHE_SIZE, ATTESTATION_KEY
+from .merkle import MerkleTree, verify_inclusion
+
+logger = logging.getLogger(__name__)
+
+
+def proof_statement(proof_type, player_tag, param, proof):
+    """
+    The signed claim for one generated proof.
+
+    :param param: Threshold or challenge id the proof was generated for.
+    """
+    return {
+        "type": proof_type,
+        "player_tag": player_tag,
+        "param": str(param),
+        "proof": proof.get("proof"),
+        "commitment": proof.get("commitment"),
+        "issued_at": timezone.now().isoformat(),
+    }
+
+
+def attest_proofs(proofs):
+    """
+    Sign generated proofs as one batch with the server key.
+
+    :param proofs: Iterable of ``(proof_type, player_tag, param, proof)``.
+    :return: One attestation per proof, in order.
+    """
+    return get_attestor().attest_batch([proof_statement(*item) for item in proofs])
+
+
+def canonical_statement(statement) -> str:
+    return json.dumps(statement, sort_keys=True, separators=(",", ":"))
+
+
+def root_message(root):
+    """
+    EIP-191 message signed for a batch: the hex Merkle root of its statements.
+    """
+    return encode_defunct(text=f"clashroyale-attestation:{root}")
+
+
+class Attestor:
+    """
+    Signs statements in batches with the server key.
+
+    A batch of statements is committed into one Merkle root and only the root
+    is signed, so a batch costs one ECDSA signature however large it is. Each
+    attestation carries its statement, the root, an inclusion proof and the
+    signature, and can be checked offline with ``recover_attestation_signer``.
+    """
+
+    def __init__(self, private_key=ATTESTATION_KEY):
+        if not private_key:
+            raise ImproperlyConfigured("CLASH_ROYALE_ATTESTATION_KEY must be set to sign attestations.")
+        self.account = Account.from_key(private_key)
+
+    @property
+    def address(self):
+        return self.account.address
+
+    def attest_batch(self, statements):
+        """
+        Sign a batch of statement dicts.
+
+        :return: One attestation dict per statement, in order.
+        """
+        leaves = [canonical_statement(statement) for statement in statements]
+        if not leaves:
+            return []
+        tree = MerkleTree(leaves)
+        signature = "0x" + self.account.sign_message(root_message(tree.root)).signature.hex().removeprefix("0x")
+        return [
+            {
+                "statement": statement,
+                "root": tree.root,
+                "proof": tree.proof(index),
+                "signature": signature,
+                "signer": self.address,
+            }
+            for index, statement in enumerate(statements)
+        ]
+
+    def attest(self, statement):
+        return self.attest_batch([statement])[0]
+
+
+class SignerCache:
+    """
+    Bounded LRU of ``(root, signature) -> recovered address``.
+
+    Every attestation of a batch shares the root signature, so recovering it
+    once makes verifying the rest of the batch a few hashes each.
+    """
+
+    def __init__(self, max_entries=ATTESTATION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def recover(self, root, signature):
+        key = (root, signature)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        address = Account.recover_message(root_message(root), signature=signature)
+        with self._lock:
+            self._entries[key] = address
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return address
+
+
+_signer_cache = SignerCache()
+
+
+def recover_attestation_signer(attestation, cache=None):
+    """
+    Return the address that signed ``attestation``, or None if it is not
+    well-formed or its statement is not part of the signed batch.
+
+    Works offline: only the attestation itself is needed.
+    """
+    cache = _signer_cache if cache is None else cache
+    try:
+        leaf = canonical_statement(attestation["statement"])
+        if not verify_inclusion(attestation["root"], leaf, attestation["proof"]):
+            return None
+        return cache.recover(attestation["root"], attestation["signature"])
+    except (KeyError, TypeError, ValueError, ValidationError, BadSignature) as e:
+        logger.debug(f"Malformed attestation: {e}")
+        return None
+
+
+def verify_attestation(attestation, expected_signer, cache=None):
+    """
+    Check that ``attestation`` was signed by ``expected_signer`` (a checksum or lowercase address).
+    """
+    signer = recover_attestation_signer(attestation, cache)
+    return signer is not None and signer.lower() == expected_signer.lower()
+
+
+_attestor = None
+_attestor_lock = threading.Lock()
+
+
+def get_attestor():
+    """
+    Return the process-wide ``Attestor`` for the configured server key.
+
+    :raises ImproperlyConfigured: If no attestation key is configured.
+    """
+    global _attestor
+    if _attestor is None:
+        with _attestor_lock:
+            if _attestor is None:
+                _attestor = Attestor()
+    return _attestor
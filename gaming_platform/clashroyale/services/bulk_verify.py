@@ -0,0 +1,301 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+
+from .config import VERIFY_CACHE_SIZE, VERIFY_CHUNK_SIZE, VERIFY_WORKERS
+from .attestation import verify_attestation
+from .merkle import verify_inclusion, verify_inclusion_many
+from .verification import ChallengeVerification, TrophyVerification, WinLossVerification
+
+logger = logging.getLogger(__name__)
+
+
+def verify_item(item):
+    """
+    Verify one decoded proof item of any supported type.
+
+    Supported items (``id`` is optional and echoed back):
+
+    - ``{"type": "trophy", "commitment", "trophies"}``
+    - ``{"type": "win_loss", "commitment", "win_loss_ratio"}``
+    - ``{"type": "challenge", "commitment", "challenge_id", "player_tag"}``
+    - ``{"type": "merkle", "root", "leaf", "proof"}``
+    - ``{"type": "attestation", "attestation", "signer"}``
+
+    :return: Result dict with ``valid`` and, for malformed items, ``error``.
+    """
+    if not isinstance(item, dict):
+        return {"valid": False, "error": "Item is not a JSON object"}
+    result = {"id": item["id"]} if "id" in item else {}
+    proof_type = item.get("type")
+    result["type"] = proof_type
+    try:
+        if proof_type == "trophy":
+            valid = TrophyVerification.verify_trophy_proof(item["commitment"], int(item["trophies"]))
+        elif proof_type == "win_loss":
+            valid = WinLossVerification.verify_win_loss_proof(item["commitment"], float(item["win_loss_ratio"]))
+        elif proof_type == "challenge":
+            valid = ChallengeVerification.verify_challenge_proof(
+                item["commitment"], item["challenge_id"], item["player_tag"]
+            )
+        elif proof_type == "merkle":
+            valid = verify_inclusion(item["root"], item["leaf"], item["proof"])
+        elif proof_type == "attestation":
+            valid = verify_attestation(item["attestation"], item["signer"])
+        else:
+            return {**result, "valid": False, "error": f"Unknown proof type: {proof_type}"}
+    except KeyError as e:
+        return {**result, "valid": False, "error": f"Missing field: {e}"}
+    except (TypeError, ValueError) as e:
+        return {**result, "valid": False, "error": f"Invalid field: {e}"}
+    result["valid"] = bool(valid)
+    return result
+
+
+def verify_line(line):
+    """
+    Verify one JSON line.
+    """
+    try:
+        item = json.loads(line)
+    except ValueError:
+        return {"valid": False, "error": "Invalid JSON"}
+    return verify_item(item)
+
+
+# Stands in for an input line that is not valid UTF-8, which has no text to verify
+INVALID_UTF8 = object()
+INVALID_UTF8_RESULT = {"valid": False, "error": "Invalid UTF-8"}
+
+
+def verify_lines(lines):
+    """
+    Verify a batch of JSON lines; the unit of work sent to pool processes.
+
+    Merkle proofs against the same root are verified together with
+    ``verify_inclusion_many``, which skips the upper path nodes they share.
+    """
+    results, by_root = [], {}
+    for line in lines:
+        try:
+            item = json.loads(line)
+        except ValueError:
+            results.append({"valid": False, "error": "Invalid JSON"})
+            continue
+        if (
+            isinstance(item, dict)
+            and item.get("type") == "merkle"
+            and isinstance(item.get("root"), str)
+            and "leaf" in item
+            and "proof" in item
+        ):
+            by_root.setdefault(item["root"], []).append(len(results))
+            results.append(item)
+        else:
+            results.append(verify_item(item))
+    for root, indexes in by_root.items():
+        items = [results[index] for index in indexes]
+        valid = verify_inclusion_many(root, [(item["leaf"], item["proof"]) for item in items])
+        for index, item, item_valid in zip(indexes, items, valid):
+            results[index] = {**({"id": item["id"]} if "id" in item else {}), "type": "merkle", "valid": item_valid}
+    return results
+
+
+def item_digest(item):
+    """
+    Cache key of a decoded proof item: a digest of its canonical JSON without ``id``.
+
+    Items that differ only in ``id``, key order or whitespace share a key.
+
+    :return: Hex digest, or None for items that are not JSON objects.
+    """
+    if not isinstance(item, dict):
+        return None
+    canonical = json.dumps({key: value for key, value in item.items() if key != "id"}, sort_keys=True)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class VerifiedDigestCache:
+    """
+    Thread-safe LRU of verdicts keyed by ``item_digest``.
+
+    Settlement batches re-submit the same commitments over and over, often
+    under new ids; a repeated item is answered without verifying it again.
+    Entries hold the verdict only, the caller adds the current item's ``id``.
+    """
+
+    def __init__(self, max_entries=VERIFY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+            return result
+
+    def put_many(self, pairs):
+        with self._lock:
+            for key, result in pairs:
+                self._entries[key] = result
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class BulkVerifier:
+    """
+    Verifies a stream of JSON-lines proofs, yielding results in input order.
+
+    Lines are read in chunks; lines already in the digest cache are answered
+    immediately and the rest are verified by a process pool (or inline with a
+    single worker). Up to ``2 * workers`` chunks are in flight at once, so
+    input is consumed and results are produced as a stream.
+    """
+
+    def __init__(self, workers=VERIFY_WORKERS, chunk_size=VERIFY_CHUNK_SIZE, cache=None):
+        self.workers = max(1, workers)
+        self.chunk_size = max(1, chunk_size)
+        self.cache = cache if cache is not None else VerifiedDigestCache()
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def pool(self):
+        if self._pool is None and self.workers > 1:
+            with self._pool_lock:
+                if self._pool is None:
+                    # Pool processes verify Merkle proofs and import models, so they need Django set up
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=django.setup)
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _submit(self, lines, stats):
+        """
+        Start verifying one chunk; return ``(lines, keys, results, misses, futures)``.
+        """
+        results = [None] * len(lines)
+        keys = [None] * len(lines)
+        misses = []
+        for index, line in enumerate(lines):
+            if line is INVALID_UTF8:
+                results[index] = dict(INVALID_UTF8_RESULT)
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                item = None
+            keys[index] = item_digest(item)
+            cached = self.cache.get(keys[index]) if keys[index] is not None else None
+            if cached is None:
+                misses.append(index)
+            else:
+                results[index] = {**({"id": item["id"]} if "id" in item else {}), **cached}
+        stats["cached"] += sum(1 for line in lines if line is not INVALID_UTF8) - len(misses)
+        miss_lines = [lines[index] for index in misses]
+        if not miss_lines:
+            futures = []
+        elif self.pool is None:
+            futures = [verify_lines(miss_lines)]
+        else:
+            # Spread the chunk over the pool so a single chunk already uses every core
+            step = -(-len(miss_lines) // self.workers)
+            futures = [
+                self.pool.submit(verify_lines, miss_lines[start:start + step])
+                for start in range(0, len(miss_lines), step)
+            ]
+        return lines, keys, results, misses, futures
+
+    def _collect(self, pending, stats):
+        lines, keys, results, misses, futures = pending
+        computed = []
+        for future in futures:
+            computed.extend(future if isinstance(future, list) else future.result())
+        for index, result in zip(misses, computed):
+            results[index] = result
+        self.cache.put_many(
+            (keys[index], {field: value for field, value in results[index].items() if field != "id"})
+            for index in misses
+            if keys[index] is not None and "error" not in results[index]
+        )
+        for result in results:
+            stats["valid" if result["valid"] else "invalid"] += 1
+        stats["count"] += len(results)
+        return results
+
+    def verify_stream(self, lines, stats=None):
+        """
+        Yield one result dict per non-blank input line, in input order.
+
+        :param stats: Optional dict filled with this run's counters (see ``summarize``).
+        """
+        stats = {} if stats is None else stats
+        stats.update(count=0, valid=0, invalid=0, cached=0, elapsed=0.0)
+        started = time.monotonic()
+        in_flight = deque()
+        chunk = []
+        try:
+            for line in lines:
+                if isinstance(line, bytes):
+                    try:
+                        line = line.decode("utf-8", errors="strict")
+                    except UnicodeDecodeError:
+                        # Answered in order like any other malformed item
+                        line = INVALID_UTF8
+                if line is not INVALID_UTF8:
+                    line = line.strip()
+                    if not line:
+                        continue
+                chunk.append(line)
+                if len(chunk) >= self.chunk_size:
+                    in_flight.append(self._submit(chunk, stats))
+                    chunk = []
+                    while len(in_flight) > 2 * self.workers:
+                        yield from self._collect(in_flight.popleft(), stats)
+            if chunk:
+                in_flight.append(self._submit(chunk, stats))
+            while in_flight:
+                yield from self._collect(in_flight.popleft(), stats)
+        finally:
+            for *_, futures in in_flight:
+                for future in futures:
+                    if not isinstance(future, list):
+                        future.cancel()
+            stats["elapsed"] = time.monotonic() - started
+
+
+def summarize(stats):
+    """
+    Counters of a ``verify_stream`` run, with verifications per second.
+    """
+    summary = dict(stats)
+    summary["verifications_per_second"] = stats["count"] / stats["elapsed"] if stats["elapsed"] else 0.0
+    return summary
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_bulk_verifier():
+    """
+    Return the process-wide ``BulkVerifier`` (its pool and digest cache are shared).
+    """
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                _verifier = BulkVerifier()
+    return _verifier
@@ -0,0 +1,277 @@
+import asyncio
+import hashlib
+import logging
+import re
+import threading
+import time
+import urllib.parse
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections
+
+from .config import CACHE_ALIAS, CACHE_TTLS, CACHE_STALE_TTL, CACHE_RETENTION
+
+logger = logging.getLogger(__name__)
+
+# Freshness states of a cache entry
+FRESH = "fresh"
+STALE = "stale"
+EXPIRED = "expired"
+
+
+class CacheStats:
+    """
+    Thread-safe, per-process counters for the upstream response cache.
+
+    - hits: served from a fresh entry
+    - stale_hits: served stale while a background revalidation runs
+    - misses: no usable entry, fetched from upstream
+    - revalidated: upstream answered 304 Not Modified to a conditional request
+    - refreshed: a conditional request returned a new body
+    - stale_errors: upstream failed and a cached entry was served instead
+    - bypassed: endpoint has no TTL and is never cached
+    """
+
+    FIELDS = ("hits", "stale_hits", "misses", "revalidated", "refreshed", "stale_errors", "bypassed")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def incr(self, field):
+        with self._lock:
+            self._counts[field] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = counts["hits"] + counts["stale_hits"] + counts["misses"]
+        counts["hit_rate"] = (counts["hits"] + counts["stale_hits"]) / lookups if lookups else 0.0
+        return counts
+
+
+class ResponseCache:
+    """
+    TTL cache of decoded upstream JSON responses in front of the API clients.
+
+    Entries are stored in a Django cache backend (``CACHES[alias]``) as dicts
+    holding the data, the upstream ``ETag`` and the time the entry stops being
+    fresh. Within ``ttl`` an entry is served as-is; for a further stale window
+    it is served while a background refresh runs (stale-while-revalidate);
+    after that it is kept until ``retention`` so the refresh can be a
+    conditional request that upstream answers with a cheap 304.
+    """
+
+    def __init__(self, alias=CACHE_ALIAS, ttls=CACHE_TTLS, stale_ttl=CACHE_STALE_TTL, retention=CACHE_RETENTION):
+        self.alias = alias
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+        self.stale_ttl = stale_ttl
+        self.retention = retention
+        self.stats = CacheStats()
+        self._revalidating = set()
+        self._revalidating_lock = threading.Lock()
+        self._tasks = set()
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def ttl_for(self, endpoint):
+        """
+        Return the fresh TTL for an endpoint, or None if it must not be cached.
+        """
+        for pattern, ttl in self.ttls:
+            if pattern.search(endpoint):
+                return ttl
+        return None
+
+    def stale_window(self, ttl):
+        # Never serve an entry stale for longer than it was fresh
+        return min(self.stale_ttl, ttl)
+
+    @staticmethod
+    def key(endpoint, params=None):
+        query = urllib.parse.urlencode(sorted((params or {}).items()))
+        return "upstream:" + hashlib.sha1(f"{endpoint}?{query}".encode()).hexdigest()
+
+    def state(self, entry, ttl, now=None):
+        now = time.time() if now is None else now
+        if now < entry["fresh_until"]:
+            return FRESH
+        if now < entry["fresh_until"] + self.stale_window(ttl):
+            return STALE
+        return EXPIRED
+
+    def make_entry(self, data, etag, ttl):
+        return {"data": data, "etag": etag, "fresh_until": time.time() + ttl}
+
+    def entry_timeout(self, ttl):
+        return max(ttl + self.stale_window(ttl), self.retention)
+
+    @staticmethod
+    def conditional_headers(entry):
+        if entry and entry.get("etag"):
+            return {"If-None-Match": entry["etag"]}
+        return None
+
+    def _claim_revalidation(self, key):
+        with self._revalidating_lock:
+            if key in self._revalidating:
+                return False
+            self._revalidating.add(key)
+            return True
+
+    def _release_revalidation(self, key):
+        with self._revalidating_lock:
+            self._revalidating.discard(key)
+
+    @staticmethod
+    def _decode(response):
+        response.raise_for_status()
+        return response.json()
+
+    def _apply(self, entry, ttl, response):
+        """
+        Turn an upstream response into ``(data, entry_to_store)``.
+        """
+        if response.status_code == 304 and entry:
+            self.stats.incr("revalidated")
+            return entry["data"], self.make_entry(entry["data"], entry.get("etag"), ttl)
+        data = self._decode(response)
+        if entry:
+            self.stats.incr("refreshed")
+        return data, self.make_entry(data, response.headers.get("ETag"), ttl)
+
+    # Synchronous path (used by make_request)
+
+    def fetch(self, endpoint, params, send):
+        """
+        Return decoded JSON for ``endpoint``, consulting the cache first.
+
+        :param endpoint: API endpoint (e.g., "/challenges").
+        :param params: Query parameters, part of the cache key.
+        :param send: Callable taking extra request headers (or None) and returning
+            a response with ``status_code``, ``headers``, ``raise_for_status()``
+            and ``json()``.
+        """
+        ttl = self.ttl_for(endpoint)
+        if ttl is None:
+            self.stats.incr("bypassed")
+            return self._decode(send(None))
+
+        key = self.key(endpoint, params)
+        entry = self.backend.get(key)
+        if entry is not None:
+            state = self.state(entry, ttl)
+            if state == FRESH:
+                self.stats.incr("hits")
+                return entry["data"]
+            if state == STALE:
+                self.stats.incr("stale_hits")
+                if self._claim_revalidation(key):
+                    threading.Thread(
+                        target=self._revalidate, args=(key, entry, ttl, send), daemon=True
+                    ).start()
+                return entry["data"]
+        self.stats.incr("misses")
+        return self._refresh(key, entry, ttl, send)
+
+    def _refresh(self, key, entry, ttl, send):
+        try:
+            data, new_entry = self._apply(entry, ttl, send(self.conditional_headers(entry)))
+        except Exception as e:
+            if entry is None:
+                raise
+            self.stats.incr("stale_errors")
+            logger.warning(f"Upstream refresh failed ({e}); serving cached response")
+            return entry["data"]
+        self.backend.set(key, new_entry, self.entry_timeout(ttl))
+        return data
+
+    def _revalidate(self, key, entry, ttl, send):
+        try:
+            self._refresh(key, entry, ttl, send)
+        finally:
+            self._release_revalidation(key)
+            # Background threads get their own DB connections (database cache backend)
+            connections.close_all()
+
+    # Asynchronous path (used by async_make_request)
+
+    async def _aget(self, key):
+        backend = self.backend
+        # locmem is an in-process dict; hopping to a worker thread would only add latency
+        if isinstance(backend, LocMemCache):
+            return backend.get(key)
+        return await backend.aget(key)
+
+    async def _aset(self, key, value, timeout):
+        backend = self.backend
+        if isinstance(backend, LocMemCache):
+            return backend.set(key, value, timeout)
+        return await backend.aset(key, value, timeout)
+
+    async def afetch(self, endpoint, params, send):
+        """
+        Async counterpart of ``fetch``; ``send`` is a coroutine function.
+        """
+        ttl = self.ttl_for(endpoint)
+        if ttl is None:
+            self.stats.incr("bypassed")
+            return self._decode(await send(None))
+
+        key = self.key(endpoint, params)
+        entry = await self._aget(key)
+        if entry is not None:
+            state = self.state(entry, ttl)
+            if state == FRESH:
+                self.stats.incr("hits")
+                return entry["data"]
+            if state == STALE:
+                self.stats.incr("stale_hits")
+                if self._claim_revalidation(key):
+                    task = asyncio.create_task(self._arevalidate(key, entry, ttl, send))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                return entry["data"]
+        self.stats.incr("misses")
+        return await self._arefresh(key, entry, ttl, send)
+
+    async def _arefresh(self, key, entry, ttl, send):
+        try:
+            data, new_entry = self._apply(entry, ttl, await send(self.conditional_headers(entry)))
+        except Exception as e:
+            if entry is None:
+                raise
+            self.stats.incr("stale_errors")
+            logger.warning(f"Upstream refresh failed ({e!r}); serving cached response")
+            return entry["data"]
+        await self._aset(key, new_entry, self.entry_timeout(ttl))
+        return data
+
+    async def _arevalidate(self, key, entry, ttl, send):
+        try:
+            await self._arefresh(key, entry, ttl, send)
+        finally:
+            self._release_revalidation(key)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Return the process-wide ``ResponseCache``.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
@@ -1,17 +1,19 @@
-import requests
-from django.conf import settings
+from .api_client import get_client
+
 
 class ClashRoyaleAPI:
-    BASE_URL = "https://api.clashroyale.com/v1"
+    """
+    Convenience wrapper around the shared upstream client.
+
+    All calls go through ``get_client()`` so the process keeps a single
+    connection pool regardless of which API entry point is used.
+    """
 
-    def __init__(self):
-        self.headers = {
-            "Authorization": f"Bearer {settings.CLASH_ROYALE_API_TOKEN}"
-        }
+    def __init__(self, client=None):
+        self.client = client or get_client()
 
     def fetch_clan_info(self, clan_tag):
-        url = f"{self.BASE_URL}/clans/{clan_tag}"
-        response = requests.get(url, headers=self.headers)
+        response = self.client.get(f"/clans/{clan_tag}")
         if response.status_code != 200:
             raise Exception(f"Error fetching clan info: {response.text}")
         return response.json()
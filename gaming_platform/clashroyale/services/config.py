@@ -1,9 +1,90 @@
 # clashroyale/services/config.py
 from django.conf import settings
-API_BASE_URL = "https://api.clashroyale.com/v1"
+API_BASE_URL = settings.CLASH_ROYALE_API_BASE_URL
 API_TOKEN = settings.CLASH_ROYALE_API_TOKEN
 
 HEADERS = {
     "Authorization": f"Bearer {API_TOKEN}",
     "Accept": "application/json",
 }
+
+# Connection pooling, timeouts and retry policy for upstream calls
+POOL_SIZE = settings.CLASH_ROYALE_POOL_SIZE
+CONNECT_TIMEOUT = settings.CLASH_ROYALE_CONNECT_TIMEOUT
+READ_TIMEOUT = settings.CLASH_ROYALE_READ_TIMEOUT
+MAX_RETRIES = settings.CLASH_ROYALE_MAX_RETRIES
+BACKOFF_FACTOR = settings.CLASH_ROYALE_BACKOFF_FACTOR
+BACKOFF_MAX = settings.CLASH_ROYALE_BACKOFF_MAX
+
+# Status codes worth retrying: rate limiting and transient upstream failures
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Upstream response cache: Django cache alias, fresh TTL (seconds) per endpoint
+# pattern (first match wins, unmatched endpoints are not cached), the
+# stale-while-revalidate window and how long entries are kept for ETag checks.
+CACHE_ALIAS = settings.CLASH_ROYALE_CACHE_ALIAS
+CACHE_TTLS = (
+    (r"^/challenges", 3600),
+    (r"^/cards", 86400),
+    (r"^/locations", 86400),
+    (r"^/players/[^/]+/battlelog$", 30),
+    (r"^/players/[^/]+/upcomingchests$", 300),
+    (r"^/players/[^/]+$", 60),
+    (r"^/clans/", 300),
+)
+CACHE_STALE_TTL = settings.CLASH_ROYALE_CACHE_STALE_TTL
+CACHE_RETENTION = settings.CLASH_ROYALE_CACHE_RETENTION
+
+# Request coalescing: optional lock directory for cross-process single-flight
+# and how long to wait for another process's in-flight request
+SINGLEFLIGHT_LOCK_DIR = settings.CLASH_ROYALE_SINGLEFLIGHT_LOCK_DIR
+SINGLEFLIGHT_LOCK_TIMEOUT = settings.CLASH_ROYALE_SINGLEFLIGHT_LOCK_TIMEOUT
+
+# Host-wide token-bucket rate limiting and API token rotation
+API_TOKENS = settings.CLASH_ROYALE_API_TOKENS
+RATE_LIMIT = settings.CLASH_ROYALE_RATE_LIMIT
+RATE_LIMIT_BURST = settings.CLASH_ROYALE_RATE_LIMIT_BURST
+RATE_LIMIT_DB = settings.CLASH_ROYALE_RATE_LIMIT_DB
+RATE_LIMIT_MAX_WAIT = settings.CLASH_ROYALE_RATE_LIMIT_MAX_WAIT
+
+# Background sync queue
+PLAYER_STALE_AFTER = settings.CLASH_ROYALE_PLAYER_STALE_AFTER
+CHALLENGES_STALE_AFTER = settings.CLASH_ROYALE_CHALLENGES_STALE_AFTER
+SYNC_MAX_ATTEMPTS = settings.CLASH_ROYALE_SYNC_MAX_ATTEMPTS
+SYNC_RETRY_DELAY = settings.CLASH_ROYALE_SYNC_RETRY_DELAY
+SYNC_LOCK_TIMEOUT = settings.CLASH_ROYALE_SYNC_LOCK_TIMEOUT
+
+# Versioned proof memoisation
+PROOF_CACHE_SIZE = settings.CLASH_ROYALE_PROOF_CACHE_SIZE
+PROOF_CACHE_PERSIST = settings.CLASH_ROYALE_PROOF_CACHE_PERSIST
+
+# Bulk proof verification
+VERIFY_WORKERS = settings.CLASH_ROYALE_VERIFY_WORKERS
+VERIFY_CHUNK_SIZE = settings.CLASH_ROYALE_VERIFY_CHUNK_SIZE
+VERIFY_CACHE_SIZE = settings.CLASH_ROYALE_VERIFY_CACHE_SIZE
+
+# Signed attestations
+ATTESTATION_KEY = settings.CLASH_ROYALE_ATTESTATION_KEY
+ATTESTATION_CACHE_SIZE = settings.CLASH_ROYALE_ATTESTATION_CACHE_SIZE
+
+# Per-request query accounting
+QUERY_WARN_THRESHOLD = settings.CLASH_ROYALE_QUERY_WARN_THRESHOLD
+
+# Stage timing and /metrics
+METRICS_ENABLED = settings.CLASH_ROYALE_METRICS_ENABLED
+
+# Trophy leaderboard
+LEADERBOARD_SNAPSHOT = settings.CLASH_ROYALE_LEADERBOARD_SNAPSHOT
+LEADERBOARD_REFRESH_INTERVAL = settings.CLASH_ROYALE_LEADERBOARD_REFRESH_INTERVAL
+LEADERBOARD_RECONCILE_INTERVAL = settings.CLASH_ROYALE_LEADERBOARD_RECONCILE_INTERVAL
+LEADERBOARD_SNAPSHOT_INTERVAL = settings.CLASH_ROYALE_LEADERBOARD_SNAPSHOT_INTERVAL
+
+# Trophy history rollups and retention (days, 0 = forever)
+TROPHY_ROLLUP_INTERVAL = settings.CLASH_ROYALE_TROPHY_ROLLUP_INTERVAL
+TROPHY_SAMPLE_RETENTION = settings.CLASH_ROYALE_TROPHY_SAMPLE_RETENTION
+TROPHY_HOURLY_RETENTION = settings.CLASH_ROYALE_TROPHY_HOURLY_RETENTION
+TROPHY_DAILY_RETENTION = settings.CLASH_ROYALE_TROPHY_DAILY_RETENTION
+
+# Cold battle archive
+ARCHIVE_DIR = settings.CLASH_ROYALE_ARCHIVE_DIR
+ARCHIVE_AFTER_DAYS = settings.CLASH_ROYALE_ARCHIVE_AFTER_DAYS
@@ -0,0 +1,195 @@
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+
+from clashroyale.models import BattleLog
+from .archive import archived_until
+
+FORMATS = ("ndjson", "csv")
+CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+EXPORT_FIELDS = [
+    "battle_id",
+    "type",
+    "timestamp",
+    "arena",
+    "game_mode",
+    "player_tag",
+    "player_name",
+    "opponent_tag",
+    "starting_trophies",
+    "trophy_change",
+    "crowns",
+    "king_tower_hp",
+    "princess_tower_hp",
+]
+TIMESTAMP_FIELD = EXPORT_FIELDS.index("timestamp")
+JSON_FIELD = EXPORT_FIELDS.index("princess_tower_hp")
+
+# Rows per database round trip, and per encoded (and compressed) piece of output
+CHUNK_SIZE = 2000
+# Compresses NDJSON nearly 3x faster than zlib's default (6) for ~15% more bytes
+GZIP_LEVEL = 3
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_cursor(timestamp, pk):
+    """
+    Resume token of an exported row: its timestamp (microseconds since the
+    epoch) and id, which together order the export.
+    """
+    return f"{(timestamp - _EPOCH) // _MICROSECOND}-{pk}"
+
+
+def decode_cursor(cursor):
+    """
+    :raises ValueError: If ``cursor`` was not produced by ``encode_cursor``.
+    """
+    try:
+        micros, pk = (int(part) for part in cursor.split("-"))
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid export cursor {cursor!r}.")
+    return _EPOCH + micros * _MICROSECOND, pk
+
+
+def export_queryset(player_tag=None, since=None, until=None, game_mode=None, after=None):
+    """
+    Battles to export, oldest first, as ``(id, *EXPORT_FIELDS)`` tuples.
+
+    :param since: Only battles at or after this time.
+    :param until: Only battles before this time.
+    :param after: Cursor of the last row already exported; only later rows are returned.
+    """
+    battles = BattleLog.objects.all()
+    if player_tag:
+        battles = battles.filter(player_tag=player_tag)
+    if since:
+        battles = battles.filter(timestamp__gte=since)
+    if until:
+        battles = battles.filter(timestamp__lt=until)
+    if game_mode:
+        battles = battles.filter(game_mode=game_mode)
+    if after:
+        timestamp, pk = decode_cursor(after)
+        battles = battles.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk))
+    # Keyset order: battlelog_export_idx, or a player's index range
+    return battles.order_by("timestamp", "id").values_list("id", *EXPORT_FIELDS)
+
+
+def archived_before(since=None):
+    """
+    Exports read ``BattleLog`` only: the time before which battles at or
+    after ``since`` may have been archived and so are missing, or None.
+    """
+    until = archived_until()
+    return until if until and (since is None or since < until) else None
+
+
+def _batches(rows, chunk_size):
+    batch = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# json.dumps() builds a new encoder whenever it is given options
+_encode_json = json.JSONEncoder(separators=(",", ":")).encode
+NDJSON_KEYS = ["cursor", *EXPORT_FIELDS]
+
+
+def _ndjson(rows, chunk_size, header):
+    for batch in _batches(rows, chunk_size):
+        lines = []
+        for pk, *values in batch:
+            timestamp = values[TIMESTAMP_FIELD]
+            values[TIMESTAMP_FIELD] = timestamp.isoformat()
+            lines.append(_encode_json(dict(zip(NDJSON_KEYS, [encode_cursor(timestamp, pk), *values]))))
+        lines.append("")
+        yield "\n".join(lines)
+
+
+def _csv(rows, chunk_size, header):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(["cursor", *EXPORT_FIELDS])
+    for batch in _batches(rows, chunk_size):
+        for pk, *values in batch:
+            timestamp = values[TIMESTAMP_FIELD]
+            values[TIMESTAMP_FIELD] = timestamp.isoformat()
+            if values[JSON_FIELD] is not None:
+                values[JSON_FIELD] = _encode_json(values[JSON_FIELD])
+            writer.writerow([encode_cursor(timestamp, pk), *values])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_battles(rows, fmt="ndjson", compress=False, header=True, chunk_size=CHUNK_SIZE):
+    """
+    Stream ``export_queryset`` rows as NDJSON or CSV bytes, optionally gzipped.
+
+    Rows are fetched ``chunk_size`` at a time and each chunk is encoded (and
+    compressed) before the next is read, so memory does not grow with the
+    number of rows. Every row starts with its resume cursor.
+
+    :param header: Write the CSV header row (not when appending to an export).
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; expected {' or '.join(FORMATS)}.")
+    encoder = _ndjson if fmt == "ndjson" else _csv
+    if not compress:
+        for piece in encoder(rows, chunk_size, header):
+            yield piece.encode()
+        return
+    # wbits=31: a gzip stream, compressed as it is produced
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for piece in encoder(rows, chunk_size, header):
+        compressed = compressor.compress(piece.encode())
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def resume_point(path, block_size=65536):
+    """
+    Prepare an interrupted, uncompressed export file for appending: drop a
+    partially written last row and return the cursor of the last complete row.
+
+    Reads only the end of the file.
+
+    :return: ``(cursor, empty)``; cursor is None when the file holds no rows,
+        empty is True when nothing (not even a CSV header) remains.
+    """
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        tail, start = b"", end
+        # Enough of the end of the file to hold the last complete line
+        while start > 0 and tail.count(b"\n") < 2:
+            step = min(block_size, start)
+            start -= step
+            f.seek(start)
+            tail = f.read(step) + tail
+        lines = tail.split(b"\n")
+        f.truncate(end - len(lines[-1]))
+        complete = lines[:-1]
+        if not complete:
+            return None, True
+        last = complete[-1]
+    if last.startswith(b"{"):
+        return json.loads(last)["cursor"], False
+    if last.startswith(b"cursor,"):
+        return None, False
+    return last.split(b",", 1)[0].decode(), False
@@ -0,0 +1,303 @@
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from clashroyale.models import BattleLog, Challenge, GameMode, PlayerSyncState, Prize
+from .merkle import append_battles_to_commitment
+from .metrics import timed
+from .stats import add_battles_to_stats
+
+logger = logging.getLogger(__name__)
+
+# Only the most recent battles of a battle log are stored
+BATTLE_LOG_LIMIT = 50
+
+# Challenge columns compared against upstream and refreshed when they differ
+CHALLENGE_UPDATE_FIELDS = [
+    "name",
+    "description",
+    "win_mode",
+    "casual",
+    "max_losses",
+    "max_wins",
+    "icon_url",
+    "game_mode_id",
+]
+
+# Columns refreshed when an already stored battle is ingested again
+BATTLE_UPDATE_FIELDS = [
+    "type",
+    "timestamp",
+    "arena",
+    "game_mode",
+    "player_tag",
+    "player_name",
+    "opponent_tag",
+    "starting_trophies",
+    "trophy_change",
+    "crowns",
+    "king_tower_hp",
+    "princess_tower_hp",
+]
+
+
+def parse_battle_time(battle_time):
+    """
+    Parse the API's compact ``battleTime`` (e.g. "20250121T205400.000Z") into an aware datetime.
+    """
+    try:
+        return datetime.strptime(battle_time, "%Y%m%dT%H%M%S.%fZ").replace(tzinfo=dt_timezone.utc)
+    except (TypeError, ValueError):
+        return parse_datetime(battle_time or "")
+
+
+def make_battle_id(player_tag, battle_time, opponent_tag):
+    """
+    Deterministic battle key: two players who battled at the same second no
+    longer collide, and re-ingesting the same battle hits the same row.
+    """
+    return f"{player_tag}|{battle_time}|{opponent_tag}"
+
+
+def build_battle_log(battle):
+    """
+    Map one battle from ``/players/{tag}/battlelog`` to an unsaved ``BattleLog``,
+    or return None if it lacks team data or a valid battle time.
+    """
+    team = battle.get("team", [])
+    if not team:
+        return None
+    timestamp = parse_battle_time(battle.get("battleTime"))
+    if timestamp is None:
+        return None
+
+    team_member = team[0]  # First team member (the player whose log this is)
+    opponents = battle.get("opponent") or [{}]
+    player_tag = team_member.get("tag", "")
+    opponent_tag = opponents[0].get("tag", "")
+    return BattleLog(
+        battle_id=make_battle_id(player_tag, battle["battleTime"], opponent_tag),
+        type=battle.get("type", "Unknown"),
+        timestamp=timestamp,
+        arena=battle.get("arena", {}).get("name", "Unknown Arena"),
+        game_mode=battle.get("gameMode", {}).get("name", "Unknown Mode"),
+        player_tag=player_tag,
+        player_name=team_member.get("name", "Unknown"),
+        opponent_tag=opponent_tag,
+        starting_trophies=team_member.get("startingTrophies", 0),
+        trophy_change=team_member.get("trophyChange", 0),
+        crowns=team_member.get("crowns", 0),
+        king_tower_hp=team_member.get("kingTowerHitPoints", 0),
+        princess_tower_hp=team_member.get("princessTowersHitPoints", [0, 0]),
+    )
+
+
+def battle_log_hash(battle_log_data):
+    """
+    Stable digest of a battle log payload, used to detect an unchanged log.
+    """
+    payload = json.dumps(battle_log_data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+@timed("ingest.battles")
+def ingest_new_battles(player_tag, battle_log_data, limit=BATTLE_LOG_LIMIT):
+    """
+    Incrementally ingest a player's battle log against their ``PlayerSyncState``.
+
+    Nothing is written when the payload hash matches the last ingested one;
+    otherwise only battles newer than the stored high-water mark are inserted.
+    Stored battles never change upstream, so skipping them loses nothing.
+    The player's ``PlayerStats`` totals and ``BattleCommitment`` root are
+    advanced by the inserted battles.
+
+    :param player_tag: Tag of the player whose log this is.
+    :param battle_log_data: Decoded ``/players/{tag}/battlelog`` response.
+    :param limit: Number of most recent battles to consider.
+    :return: The newly inserted ``BattleLog`` instances.
+    """
+    if not isinstance(battle_log_data, list):
+        return []
+
+    digest = battle_log_hash(battle_log_data[:limit])
+    state = PlayerSyncState.objects.filter(player_tag=player_tag).first()
+    if state is not None and state.battle_log_hash == digest:
+        logger.debug(f"Battle log unchanged for {player_tag}, skipping ingest")
+        return []
+
+    battles = {}
+    for battle in battle_log_data[:limit]:
+        battle_log = build_battle_log(battle)
+        if battle_log is None:
+            logger.warning(f"Skipping battle without team data or battle time: {battle.get('battleTime')}")
+            continue
+        if state is None or state.last_battle_time is None or battle_log.timestamp > state.last_battle_time:
+            battles[battle_log.battle_id] = battle_log
+
+    high_water = state.last_battle_time if state is not None else None
+    newest = max((battle_log.timestamp for battle_log in battles.values()), default=None)
+    if newest is not None and (high_water is None or newest > high_water):
+        high_water = newest
+
+    with transaction.atomic():
+        if battles:
+            # A concurrent sync of the same player may have inserted some of these already
+            for battle_id in BattleLog.objects.filter(battle_id__in=list(battles)).values_list("battle_id", flat=True):
+                del battles[battle_id]
+        if battles:
+            BattleLog.objects.bulk_create(
+                battles.values(),
+                update_conflicts=True,
+                unique_fields=["battle_id"],
+                update_fields=BATTLE_UPDATE_FIELDS,
+            )
+            add_battles_to_stats(player_tag, list(battles.values()))
+            append_battles_to_commitment(player_tag, list(battles.values()))
+        if state is not None:
+            PlayerSyncState.objects.filter(pk=state.pk).update(
+                last_battle_time=high_water, battle_log_hash=digest, updated_at=timezone.now()
+            )
+        else:
+            PlayerSyncState.objects.update_or_create(
+                player_tag=player_tag,
+                defaults={"last_battle_time": high_water, "battle_log_hash": digest},
+            )
+    return list(battles.values())
+
+
+def iter_challenges(challenges_data):
+    """
+    Flatten the ``/challenges`` response (a list of challenge chains) into challenge dicts.
+    """
+    if not isinstance(challenges_data, list):
+        return
+    for challenge_set in challenges_data:
+        yield from challenge_set.get("challenges", [])
+
+
+def _challenge_values(challenge):
+    game_mode_id = challenge.get("gameMode", {}).get("id")
+    return {
+        "name": challenge["name"],
+        "description": challenge.get("description", ""),
+        "win_mode": challenge.get("winMode", ""),
+        "casual": challenge.get("casual", False),
+        "max_losses": challenge.get("maxLosses", 0),
+        "max_wins": challenge.get("maxWins", 0),
+        "icon_url": challenge.get("iconUrl", ""),
+        "game_mode_id": str(game_mode_id) if game_mode_id is not None else None,
+    }
+
+
+def _prize_set(prizes):
+    """
+    Order-independent representation of a challenge's prizes, for change detection.
+    """
+    return sorted(prizes, key=lambda prize: tuple("" if value is None else str(value) for value in prize))
+
+
+@timed("ingest.challenges")
+def sync_challenges(challenges_data):
+    """
+    Store the ``/challenges`` response with a constant number of queries.
+
+    Existing game modes, challenges and prizes are loaded once, diffed against
+    the payload in Python and written back with ``bulk_create``/``bulk_update``.
+    Prizes of a challenge are only replaced when its prize set changed.
+
+    :param challenges_data: Decoded ``/challenges`` response.
+    :return: ``(challenges, counts)`` - the ``Challenge`` instances in payload
+        order and a dict of created/updated/unchanged/prizes_replaced counts.
+    """
+    counts = {"created": 0, "updated": 0, "unchanged": 0, "prizes_replaced": 0}
+    payload = {str(challenge["id"]): challenge for challenge in iter_challenges(challenges_data)}
+    if not payload:
+        return [], counts
+
+    game_modes = {}
+    for challenge in payload.values():
+        game_mode_data = challenge.get("gameMode", {})
+        if game_mode_data.get("id") is not None:
+            game_modes[str(game_mode_data["id"])] = game_mode_data.get("name", "Unknown")
+
+    with transaction.atomic():
+        # 1. Game modes: create the missing ones, rename the ones that changed
+        existing_modes = GameMode.objects.in_bulk(list(game_modes))
+        new_modes = [
+            GameMode(id=mode_id, name=name) for mode_id, name in game_modes.items() if mode_id not in existing_modes
+        ]
+        renamed_modes = []
+        for mode_id, game_mode in existing_modes.items():
+            if game_mode.name != game_modes[mode_id]:
+                game_mode.name = game_modes[mode_id]
+                renamed_modes.append(game_mode)
+        if new_modes:
+            GameMode.objects.bulk_create(new_modes)
+        if renamed_modes:
+            GameMode.objects.bulk_update(renamed_modes, ["name"])
+
+        # 2. Challenges: diff every tracked column against the stored row
+        synced_at = timezone.now()
+        existing = Challenge.objects.in_bulk(list(payload))
+        challenges, to_create, to_update = [], [], []
+        for challenge_id, challenge in payload.items():
+            values = _challenge_values(challenge)
+            challenge_obj = existing.get(challenge_id)
+            if challenge_obj is None:
+                challenge_obj = Challenge(id=challenge_id, updated_at=synced_at, **values)
+                to_create.append(challenge_obj)
+            elif any(getattr(challenge_obj, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(challenge_obj, field, value)
+                # Advances the catalogue version that keys cached challenge proofs
+                challenge_obj.updated_at = synced_at
+                to_update.append(challenge_obj)
+            else:
+                counts["unchanged"] += 1
+            challenges.append(challenge_obj)
+        if to_create:
+            Challenge.objects.bulk_create(to_create)
+        if to_update:
+            Challenge.objects.bulk_update(to_update, [*CHALLENGE_UPDATE_FIELDS, "updated_at"])
+        counts["created"], counts["updated"] = len(to_create), len(to_update)
+
+        # Mark everything in this payload as current (one UPDATE for all rows)
+        Challenge.objects.filter(id__in=list(payload)).update(synced_at=synced_at)
+        for challenge_obj in challenges:
+            challenge_obj.synced_at = synced_at
+
+        # 3. Prizes: replace only the prize sets that actually changed
+        stored_prizes = {challenge_id: [] for challenge_id in payload}
+        for challenge_id, prize_type, amount, consumable_name in Prize.objects.filter(
+            challenge_id__in=list(payload)
+        ).values_list("challenge_id", "type", "amount", "consumable_name"):
+            stored_prizes[challenge_id].append((prize_type, amount, consumable_name))
+        changed = [
+            challenge_id
+            for challenge_id, challenge in payload.items()
+            if _prize_set(
+                (prize.get("type"), prize.get("amount"), prize.get("consumableName"))
+                for prize in challenge.get("prizes", [])
+            )
+            != _prize_set(stored_prizes[challenge_id])
+        ]
+        if changed:
+            Prize.objects.filter(challenge_id__in=changed).delete()
+            Prize.objects.bulk_create(
+                Prize(
+                    challenge_id=challenge_id,
+                    type=prize.get("type"),
+                    amount=prize.get("amount"),
+                    consumable_name=prize.get("consumableName"),
+                )
+                for challenge_id in changed
+                for prize in payload[challenge_id].get("prizes", [])
+            )
+        counts["prizes_replaced"] = len(changed)
+
+    return challenges, counts
@@ -0,0 +1,530 @@
+import gzip
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.db import DatabaseError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from clashroyale.models import Player
+from .config import LEADERBOARD_RECONCILE_INTERVAL, LEADERBOARD_REFRESH_INTERVAL, LEADERBOARD_SNAPSHOT
+
+logger = logging.getLogger(__name__)
+
+# Up to 2**24 (16M) entries at the expected O(log n) cost
+MAX_LEVEL = 24
+SNAPSHOT_FORMAT = 1
+# Refreshes re-read players synced shortly before the watermark, so rows
+# committed late by a concurrent transaction are not missed (upserts are idempotent)
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level, nil=None):
+        self.key = key
+        self.next = [nil] * level
+        # width[level]: how many positions next[level] is ahead of this node
+        self.width = [1] * level
+
+
+def _random_level():
+    # 1 + the number of trailing one bits: level k with probability 2**-k
+    bits = random.getrandbits(MAX_LEVEL)
+    return min(MAX_LEVEL, (~bits & (bits + 1)).bit_length())
+
+
+class RankIndex:
+    """
+    Order-statistic index of unique, comparable keys: an indexable skip list.
+
+    Insert, remove, the position of a key and the key at a position all take
+    expected O(log n); iterating k keys from a position adds O(k).
+    """
+
+    def __init__(self):
+        self._nil = _Node(None, 0)
+        self._head = _Node(None, MAX_LEVEL, self._nil)
+        # Levels in use; the head's links above them are ignored
+        self.levels = 1
+        self.size = 0
+
+    @classmethod
+    def from_sorted(cls, keys):
+        """
+        Build an index from keys in ascending order in O(n).
+        """
+        index = cls()
+        nil = index._nil
+        last = [index._head] * MAX_LEVEL
+        last_position = [0] * MAX_LEVEL
+        position = 0
+        for position, key in enumerate(keys, start=1):
+            node = _Node(key, _random_level(), nil)
+            for level in range(len(node.next)):
+                previous = last[level]
+                previous.next[level] = node
+                previous.width[level] = position - last_position[level]
+                last[level] = node
+                last_position[level] = position
+            index.levels = max(index.levels, len(node.next))
+        for level in range(index.levels):
+            last[level].width[level] = position + 1 - last_position[level]
+        index.size = position
+        return index
+
+    def __len__(self):
+        return self.size
+
+    def _predecessors(self, key):
+        """
+        The last node before ``key`` on every level in use, and its position.
+        """
+        chain = [self._head] * MAX_LEVEL
+        positions = [0] * MAX_LEVEL
+        node, position, nil = self._head, 0, self._nil
+        for level in reversed(range(self.levels)):
+            following = node.next[level]
+            while following is not nil and following.key < key:
+                position += node.width[level]
+                node = following
+                following = node.next[level]
+            chain[level] = node
+            positions[level] = position
+        return chain, positions
+
+    def insert(self, key):
+        chain, positions = self._predecessors(key)
+        following = chain[0].next[0]
+        if following is not self._nil and following.key == key:
+            raise KeyError(f"{key!r} is already indexed")
+        node = _Node(key, _random_level(), self._nil)
+        height = len(node.next)
+        for level in range(self.levels, height):
+            # Newly used level: the head links straight to the end
+            self._head.next[level] = self._nil
+            self._head.width[level] = self.size + 1
+        self.levels = max(self.levels, height)
+        position = positions[0] + 1
+        for level in range(height):
+            previous = chain[level]
+            node.next[level] = previous.next[level]
+            previous.next[level] = node
+            node.width[level] = previous.width[level] - (position - positions[level]) + 1
+            previous.width[level] = position - positions[level]
+        for level in range(height, self.levels):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, key):
+        chain, _ = self._predecessors(key)
+        node = chain[0].next[0]
+        if node is self._nil or node.key != key:
+            raise KeyError(key)
+        for level in range(len(node.next)):
+            previous = chain[level]
+            previous.width[level] += node.width[level] - 1
+            previous.next[level] = node.next[level]
+        for level in range(len(node.next), self.levels):
+            chain[level].width[level] -= 1
+        while self.levels > 1 and self._head.next[self.levels - 1] is self._nil:
+            self.levels -= 1
+        self.size -= 1
+
+    def bisect_left(self, key):
+        """
+        Number of keys less than ``key``.
+        """
+        node, position, nil = self._head, 0, self._nil
+        for level in reversed(range(self.levels)):
+            following = node.next[level]
+            while following is not nil and following.key < key:
+                position += node.width[level]
+                node = following
+                following = node.next[level]
+        return position
+
+    def index(self, key):
+        """
+        0-based position of ``key``.
+
+        :raises KeyError: If ``key`` is not indexed.
+        """
+        position = self.bisect_left(key)
+        if position >= self.size or self[position] != key:
+            raise KeyError(key)
+        return position
+
+    def _node_at(self, position):
+        remaining = position + 1
+        node, nil = self._head, self._nil
+        for level in reversed(range(self.levels)):
+            while node.next[level] is not nil and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        return node
+
+    def __getitem__(self, position):
+        if not 0 <= position < self.size:
+            raise IndexError(position)
+        return self._node_at(position).key
+
+    def slice(self, start, stop):
+        """
+        Keys at positions ``start`` to ``stop - 1``.
+        """
+        start, stop = max(0, start), min(self.size, stop)
+        if start >= stop:
+            return []
+        node = self._node_at(start)
+        keys = []
+        for _ in range(stop - start):
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+    def __iter__(self):
+        node = self._head.next[0]
+        while node is not self._nil:
+            yield node.key
+            node = node.next[0]
+
+
+def sort_key(tag, trophies):
+    # Most trophies first; ties ordered by tag so every position is stable
+    return (-trophies, tag)
+
+
+class Leaderboard:
+    """
+    Trophy leaderboard of stored players, globally and per clan.
+
+    Each board is a ``RankIndex`` of ``(-trophies, tag)``, so top-N, the rank
+    of a tag and the players around a tag are O(log n) (plus the rows
+    returned). Ranks are 1-based positions; players with equal trophies are
+    ordered by tag.
+    """
+
+    def __init__(self, players=(), synced_until=None, reconciled_at=None):
+        """
+        :param players: ``(tag, trophies, clan_tag)`` rows, in any order.
+        :param synced_until: Players synced after this time may be missing (see ``refresh_leaderboard``).
+        :param reconciled_at: When ``players`` last held exactly the ``Player`` table; None if unknown.
+        """
+        self._players = {tag: (trophies, clan_tag) for tag, trophies, clan_tag in players}
+        keys = sorted(sort_key(tag, trophies) for tag, (trophies, _) in self._players.items())
+        self._global = RankIndex.from_sorted(keys)
+        clan_keys = {}
+        for key in keys:
+            clan_tag = self._players[key[1]][1]
+            if clan_tag:
+                clan_keys.setdefault(clan_tag, []).append(key)
+        self._clans = {clan_tag: RankIndex.from_sorted(members) for clan_tag, members in clan_keys.items()}
+        self.synced_until = synced_until
+        self.reconciled_at = reconciled_at
+        self.refreshed_at = time.monotonic()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._global)
+
+    def __contains__(self, tag):
+        return tag in self._players
+
+    def _board(self, clan_tag=None):
+        if clan_tag is None:
+            return self._global
+        return self._clans.get(clan_tag)
+
+    def upsert(self, tag, trophies, clan_tag=""):
+        """
+        Add a player or move them to their new trophy count and clan.
+        """
+        with self._lock:
+            current = self._players.get(tag)
+            if current == (trophies, clan_tag):
+                return
+            if current is not None:
+                self._remove(tag, *current)
+            key = sort_key(tag, trophies)
+            self._global.insert(key)
+            if clan_tag:
+                self._clans.setdefault(clan_tag, RankIndex()).insert(key)
+            self._players[tag] = (trophies, clan_tag)
+
+    def remove(self, tag):
+        with self._lock:
+            current = self._players.get(tag)
+            if current is not None:
+                self._remove(tag, *current)
+
+    def reconcile(self, players):
+        """
+        Make the board hold exactly ``players`` (``(tag, trophies, clan_tag)`` rows).
+
+        :return: Number of players removed because they are not in ``players``.
+        """
+        seen = set()
+        for tag, trophies, clan_tag in players:
+            self.upsert(tag, trophies, clan_tag)
+            seen.add(tag)
+        with self._lock:
+            removed = [tag for tag in self._players if tag not in seen]
+            for tag in removed:
+                self._remove(tag, *self._players[tag])
+        return len(removed)
+
+    def _remove(self, tag, trophies, clan_tag):
+        key = sort_key(tag, trophies)
+        self._global.remove(key)
+        if clan_tag:
+            self._clans[clan_tag].remove(key)
+            if not self._clans[clan_tag]:
+                del self._clans[clan_tag]
+        del self._players[tag]
+
+    def _entries(self, keys, first_rank):
+        return [
+            {"rank": rank, "tag": tag, "trophies": -negative_trophies, "clan_tag": self._players[tag][1]}
+            for rank, (negative_trophies, tag) in enumerate(keys, start=first_rank)
+        ]
+
+    def top(self, limit=10, clan_tag=None):
+        """
+        The ``limit`` players with the most trophies, globally or in ``clan_tag``.
+        """
+        with self._lock:
+            board = self._board(clan_tag)
+            return self._entries(board.slice(0, limit), 1) if board is not None else []
+
+    def rank(self, tag, in_clan=False):
+        """
+        1-based rank of ``tag`` globally, or within their clan; None if not ranked.
+        """
+        with self._lock:
+            board, key = self._locate(tag, in_clan)
+            return board.index(key) + 1 if board is not None else None
+
+    def around(self, tag, radius=5, in_clan=False):
+        """
+        ``tag`` with up to ``radius`` players ranked above and below them.
+        """
+        with self._lock:
+            board, key = self._locate(tag, in_clan)
+            if board is None:
+                return []
+            position = board.index(key)
+            start = max(0, position - radius)
+            return self._entries(board.slice(start, position + radius + 1), start + 1)
+
+    def _locate(self, tag, in_clan):
+        current = self._players.get(tag)
+        if current is None:
+            return None, None
+        trophies, clan_tag = current
+        if in_clan and not clan_tag:
+            return None, None
+        return self._board(clan_tag if in_clan else None), sort_key(tag, trophies)
+
+    def clan_tags(self):
+        with self._lock:
+            return list(self._clans)
+
+    def rows(self):
+        """
+        ``(tag, trophies, clan_tag)`` of every player, in global rank order.
+        """
+        with self._lock:
+            return [(tag, -negative_trophies, self._players[tag][1]) for negative_trophies, tag in self._global]
+
+
+def save_snapshot(board, path):
+    """
+    Write ``board`` to ``path`` (gzipped JSON), replacing any previous snapshot atomically.
+    """
+    data = {
+        "format": SNAPSHOT_FORMAT,
+        "synced_until": board.synced_until.isoformat() if board.synced_until else None,
+        "reconciled_at": board.reconciled_at.isoformat() if board.reconciled_at else None,
+        "players": board.rows(),
+    }
+    # Per process, so concurrent writers never share a half-written file
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(temporary, "wt", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(temporary, path)
+    logger.info(f"Leaderboard snapshot of {len(board)} players written to {path}")
+
+
+def load_snapshot(path):
+    """
+    :return: The ``Leaderboard`` stored at ``path``, or None if there is no usable snapshot.
+    """
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable leaderboard snapshot {path}: {e}")
+        return None
+    if data.get("format") != SNAPSHOT_FORMAT or not data.get("synced_until"):
+        logger.warning(f"Ignoring leaderboard snapshot {path} in an unknown format")
+        return None
+    reconciled_at = parse_datetime(data["reconciled_at"]) if data.get("reconciled_at") else None
+    return Leaderboard(data["players"], synced_until=parse_datetime(data["synced_until"]), reconciled_at=reconciled_at)
+
+
+def build_leaderboard():
+    """
+    Build the leaderboard from a full scan of the ``Player`` table.
+    """
+    started = timezone.now()
+    rows = Player.objects.values_list("tag", "trophies", "clan_tag").iterator(chunk_size=5000)
+    board = Leaderboard(rows, synced_until=started, reconciled_at=started)
+    logger.info(f"Leaderboard built from {len(board)} players")
+    return board
+
+
+def refresh_leaderboard(board):
+    """
+    Apply players synced since ``board`` was last brought up to date (one
+    range scan of the ``last_synced_at`` index).
+
+    Deletions leave no trace in that index, and neither does a delete followed
+    by an insert, so every ``CLASH_ROYALE_LEADERBOARD_RECONCILE_INTERVAL``
+    seconds the board is instead reconciled with a full read of the table.
+    Deletions made by this process are applied at once (``player_deleted``);
+    those of other processes show up within that interval.
+
+    :return: Number of players re-read or removed.
+    """
+    started = timezone.now()
+    reconcile_due = started - timedelta(seconds=LEADERBOARD_RECONCILE_INTERVAL)
+    if board.reconciled_at is None or board.reconciled_at <= reconcile_due:
+        removed = board.reconcile(Player.objects.values_list("tag", "trophies", "clan_tag").iterator(chunk_size=5000))
+        count = len(board) + removed
+        board.reconciled_at = started
+        logger.info(f"Leaderboard reconciled with {len(board)} players ({removed} removed)")
+    else:
+        rows = Player.objects.filter(last_synced_at__gte=board.synced_until - REFRESH_OVERLAP).values_list(
+            "tag", "trophies", "clan_tag"
+        )
+        count = 0
+        for tag, trophies, clan_tag in rows.iterator(chunk_size=5000):
+            board.upsert(tag, trophies, clan_tag)
+            count += 1
+    board.synced_until = started
+    board.refreshed_at = time.monotonic()
+    return count
+
+
+def write_snapshot(board):
+    """
+    Save ``board`` to the configured snapshot, if any; failures are only logged.
+    """
+    if not LEADERBOARD_SNAPSHOT:
+        return
+    try:
+        save_snapshot(board, LEADERBOARD_SNAPSHOT)
+    except OSError as e:
+        logger.warning(f"Could not write leaderboard snapshot: {e}")
+
+
+def load_leaderboard():
+    """
+    Load the snapshot and apply what changed since; fall back to a full scan
+    when there is no usable snapshot. A new snapshot is written whenever the
+    loaded one was out of date, so the next start replays only newer changes.
+    """
+    board = load_snapshot(LEADERBOARD_SNAPSHOT) if LEADERBOARD_SNAPSHOT else None
+    if board is None:
+        board = build_leaderboard()
+        write_snapshot(board)
+        return board
+    refreshed = refresh_leaderboard(board)
+    logger.info(f"Leaderboard loaded from snapshot ({len(board)} players, {refreshed} refreshed)")
+    if refreshed:
+        write_snapshot(board)
+    return board
+
+
+_leaderboard = None
+_leaderboard_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+
+def get_leaderboard():
+    """
+    Return the process-wide ``Leaderboard``, loading it on first use.
+
+    Server processes load it on their first leaderboard request rather than
+    at import, so ``collectstatic``, migrations and a ``--preload`` master
+    never query the database for it.
+
+    Upserts made by this process are applied immediately (``record_player``);
+    those of other processes (e.g. the sync worker) are picked up at most
+    ``CLASH_ROYALE_LEADERBOARD_REFRESH_INTERVAL`` seconds later.
+    """
+    global _leaderboard
+    if _leaderboard is None:
+        with _leaderboard_lock:
+            if _leaderboard is None:
+                _leaderboard = load_leaderboard()
+    board = _leaderboard
+    if time.monotonic() - board.refreshed_at > LEADERBOARD_REFRESH_INTERVAL and _refresh_lock.acquire(blocking=False):
+        try:
+            refresh_leaderboard(board)
+        finally:
+            _refresh_lock.release()
+    return board
+
+
+def warm_leaderboard():
+    """
+    Load the process-wide leaderboard now, so the first request does not pay
+    for it. Called when the sync worker starts; a database that is not
+    migrated yet is logged and skipped.
+    """
+    try:
+        get_leaderboard()
+    except DatabaseError as e:
+        logger.warning(f"Leaderboard not loaded at startup: {e}")
+
+
+def maintain_leaderboard():
+    """
+    Bring the process-wide leaderboard up to date and rewrite the snapshot, as
+    run periodically by ``run_sync_worker``.
+    """
+    board = get_leaderboard()
+    with _refresh_lock:
+        refresh_leaderboard(board)
+    write_snapshot(board)
+    return board
+
+
+def record_player(tag, trophies, clan_tag=""):
+    """
+    Apply a ``Player`` upsert to the leaderboard, if this process has loaded one.
+    """
+    if _leaderboard is not None:
+        _leaderboard.upsert(tag, trophies, clan_tag)
+
+
+def player_saved(sender, instance, **kwargs):
+    """
+    ``post_save`` receiver for players saved outside ``store_player_bundle``.
+    """
+    record_player(instance.tag, instance.trophies, instance.clan_tag)
+
+
+def player_deleted(sender, instance, **kwargs):
+    if _leaderboard is not None:
+        _leaderboard.remove(instance.tag)
@@ -0,0 +1,321 @@
+import hashlib
+import heapq
+import json
+import logging
+
+from clashroyale.models import BattleCommitment, BattleLog
+from .archive import archived_battle, archived_battles
+
+logger = logging.getLogger(__name__)
+
+# Domain separation so a leaf can never be passed off as an inner node
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+# BattleLog columns committed to in a battle's leaf
+BATTLE_LEAF_FIELDS = (
+    "battle_id",
+    "timestamp",
+    "type",
+    "game_mode",
+    "opponent_tag",
+    "starting_trophies",
+    "trophy_change",
+    "crowns",
+)
+
+
+def hash_leaf(data) -> bytes:
+    if isinstance(data, str):
+        data = data.encode()
+    return hashlib.sha256(LEAF_PREFIX + data).digest()
+
+
+def hash_node(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+class MerkleTree:
+    """
+    Append-only Merkle tree over leaf data (bytes or str).
+
+    Levels are paired left to right; an unpaired last node is promoted to the
+    next level unchanged. Appending a leaf recomputes only the last node of
+    each level (O(log n)), and inclusion proofs are O(log n) sibling hashes.
+    """
+
+    def __init__(self, leaves=()):
+        self.levels = [[]]
+        self.extend(leaves)
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    def append(self, data):
+        """
+        Add a leaf and return its index.
+        """
+        index = len(self.levels[0])
+        self.levels[0].append(hash_leaf(data))
+        level, position = 0, index
+        while len(self.levels[level]) > 1:
+            nodes = self.levels[level]
+            left = position & ~1
+            parent = hash_node(nodes[left], nodes[left + 1]) if left + 1 < len(nodes) else nodes[left]
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+            upper = self.levels[level + 1]
+            if position >> 1 < len(upper):
+                upper[position >> 1] = parent
+            else:
+                upper.append(parent)
+            level, position = level + 1, position >> 1
+        return index
+
+    def extend(self, leaves):
+        for data in leaves:
+            self.append(data)
+
+    @property
+    def root(self) -> str:
+        """
+        Hex root digest ("" for an empty tree).
+        """
+        return self.levels[-1][0].hex() if self.levels[0] else ""
+
+    def proof(self, index):
+        """
+        Inclusion proof for the leaf at ``index``: a list of ``[side, sibling hex]``
+        steps from the leaf up, ``side`` being where the sibling sits ("L" or "R").
+        """
+        if not 0 <= index < len(self):
+            raise IndexError(f"Leaf index {index} out of range for {len(self)} leaves")
+        steps = []
+        for nodes in self.levels[:-1]:
+            sibling = index ^ 1
+            if sibling < len(nodes):
+                steps.append(["L" if sibling < index else "R", nodes[sibling].hex()])
+            index >>= 1
+        return steps
+
+    def peaks(self):
+        """
+        Roots of the perfect subtrees covering the leaves, largest first.
+
+        Together with the leaf count they are enough to keep appending and
+        recomputing the root without the leaves (see ``MerkleFrontier``).
+        """
+        peaks, offset, size = [], 0, len(self)
+        for height in range(len(self.levels) - 1, -1, -1):
+            if size & (1 << height):
+                peaks.append(self.levels[height][offset >> height])
+                offset += 1 << height
+        return peaks
+
+
+class MerkleFrontier:
+    """
+    Leaf-less state of a ``MerkleTree``: its peaks and leaf count.
+
+    Supports O(log n) appends and yields the same root as the full tree, so a
+    stored commitment can be advanced as new battles arrive without loading
+    the old ones.
+    """
+
+    def __init__(self, size=0, peaks=()):
+        self.size = size
+        self.peaks = [bytes.fromhex(peak) if isinstance(peak, str) else peak for peak in peaks]
+
+    def append(self, data):
+        node, height = hash_leaf(data), 0
+        # Merge equal-height peaks, like binary carry propagation on the leaf count
+        while self.size & (1 << height):
+            node = hash_node(self.peaks.pop(), node)
+            height += 1
+        self.peaks.append(node)
+        self.size += 1
+
+    def extend(self, leaves):
+        for data in leaves:
+            self.append(data)
+
+    @property
+    def root(self) -> str:
+        if not self.peaks:
+            return ""
+        # Promoting unpaired nodes is equivalent to folding the peaks right to left
+        node = self.peaks[-1]
+        for peak in reversed(self.peaks[:-1]):
+            node = hash_node(peak, node)
+        return node.hex()
+
+    def hex_peaks(self):
+        return [peak.hex() for peak in self.peaks]
+
+
+def _parse_proof(proof):
+    """
+    Proof steps as ``(sibling is on the left, sibling digest)`` pairs.
+    """
+    return [(side == "L", bytes.fromhex(sibling)) for side, sibling in proof]
+
+
+def _step(node, sibling_is_left, sibling):
+    return hash_node(sibling, node) if sibling_is_left else hash_node(node, sibling)
+
+
+def verify_inclusion(root: str, data, proof) -> bool:
+    """
+    Check that ``data`` is a leaf of the tree with the given hex ``root``.
+    """
+    try:
+        node = hash_leaf(data)
+        for step in _parse_proof(proof):
+            node = _step(node, *step)
+    except (TypeError, ValueError):
+        return False
+    return node.hex() == root
+
+
+def verify_inclusion_many(root: str, items):
+    """
+    Verify many ``(data, proof)`` pairs against one root, with the same result
+    as ``verify_inclusion`` for each.
+
+    Inner nodes on a path already proven to reach the root are remembered with
+    the proof steps that took them there. A later proof that reaches one of
+    them only has to end with exactly those steps, so proofs from the same tree
+    cost a couple of hashes each instead of a full path. Leaves are never
+    remembered: every proof hashes at least one step of its own.
+
+    :return: List of booleans in ``items`` order.
+    """
+    try:
+        root_node = bytes.fromhex(root)
+    except (TypeError, ValueError):
+        return [False] * len(items)
+    if root_node.hex() != root:
+        return [False] * len(items)
+    # Inner node -> (steps, position): steps[position:] fold it into the root
+    verified = {}
+    results = []
+    for data, proof in items:
+        try:
+            node, steps = hash_leaf(data), _parse_proof(proof)
+        except (TypeError, ValueError):
+            results.append(False)
+            continue
+        path = []
+        for position, step in enumerate(steps):
+            node = _step(node, *step)
+            known = verified.get(node)
+            if known is not None:
+                known_steps, known_position = known
+                ok = steps[position + 1:] == known_steps[known_position:]
+                break
+            path.append((node, position + 1))
+        else:
+            ok = node == root_node
+        if ok:
+            for inner, position in path:
+                verified[inner] = (steps, position)
+        results.append(ok)
+    return results
+
+
+def battle_leaf(battle) -> str:
+    """
+    Canonical leaf data for a battle (a ``BattleLog`` or a dict of its values).
+    """
+    get = battle.get if isinstance(battle, dict) else lambda field: getattr(battle, field)
+    values = {field: get(field) for field in BATTLE_LEAF_FIELDS}
+    values["timestamp"] = values["timestamp"].isoformat()
+    return json.dumps(values, sort_keys=True, separators=(",", ":"))
+
+
+def battle_tree(player_tag):
+    """
+    Build the Merkle tree of a player's stored battles, oldest first, archived
+    ones included, so archiving battles leaves the root unchanged.
+
+    :return: ``(tree, battle_ids)`` where ``battle_ids[i]`` is the battle at leaf ``i``.
+    """
+    tree, battle_ids = MerkleTree(), []
+    rows = (
+        BattleLog.objects.filter(player_tag=player_tag)
+        .order_by("timestamp", "battle_id")
+        .values(*BATTLE_LEAF_FIELDS)
+    )
+    for row in heapq.merge(
+        archived_battles(player_tag),
+        rows.iterator(chunk_size=2000),
+        key=lambda row: (row["timestamp"], row["battle_id"]),
+    ):
+        tree.append(battle_leaf(row))
+        battle_ids.append(row["battle_id"])
+    return tree, battle_ids
+
+
+def battle_inclusion_proof(player_tag, battle_id):
+    """
+    Root, leaf data and inclusion proof for one of a player's battles, or None.
+    """
+    tree, battle_ids = battle_tree(player_tag)
+    try:
+        index = battle_ids.index(battle_id)
+    except ValueError:
+        return None
+    battle = BattleLog.objects.values(*BATTLE_LEAF_FIELDS).filter(battle_id=battle_id).first()
+    if battle is None:
+        battle = archived_battle(player_tag, battle_id)
+    return {"root": tree.root, "index": index, "leaf": battle_leaf(battle), "proof": tree.proof(index)}
+
+
+def append_battles_to_commitment(player_tag, battle_logs):
+    """
+    Advance a player's ``BattleCommitment`` with newly ingested battles.
+
+    The battles must all be newer than the ones already committed; they are
+    appended oldest first. Must run in the transaction that inserted them.
+    """
+    if not battle_logs:
+        return None
+    commitment = BattleCommitment.objects.filter(player_tag=player_tag).first()
+    if commitment is None:
+        return rebuild_battle_commitment(player_tag)
+    frontier = MerkleFrontier(commitment.leaf_count, commitment.peaks)
+    frontier.extend(
+        battle_leaf(battle_log)
+        for battle_log in sorted(battle_logs, key=lambda battle_log: (battle_log.timestamp, battle_log.battle_id))
+    )
+    commitment.leaf_count, commitment.peaks, commitment.root = frontier.size, frontier.hex_peaks(), frontier.root
+    commitment.save(update_fields=["leaf_count", "peaks", "root", "updated_at"])
+    return commitment
+
+
+def rebuild_battle_commitment(player_tag):
+    """
+    Recompute a player's ``BattleCommitment`` from all of their stored battles.
+    """
+    tree, _ = battle_tree(player_tag)
+    commitment, _ = BattleCommitment.objects.update_or_create(
+        player_tag=player_tag,
+        defaults={"leaf_count": len(tree), "peaks": [peak.hex() for peak in tree.peaks()], "root": tree.root},
+    )
+    return commitment
+
+
+def challenge_roster_tree(player_tag, challenge_proofs):
+    """
+    Commit a player's completed challenges into one tree.
+
+    :param challenge_proofs: Dict of challenge id to proof, as returned by
+        ``ChallengeVerification.generate_challenge_proofs``.
+    :return: ``(tree, challenge_ids)``; each leaf is a challenge's completion commitment.
+    """
+    tree, challenge_ids = MerkleTree(), []
+    for challenge_id, proof in challenge_proofs.items():
+        if proof.get("proof") and proof.get("commitment"):
+            tree.append(proof["commitment"])
+            challenge_ids.append(challenge_id)
+    return tree, challenge_ids
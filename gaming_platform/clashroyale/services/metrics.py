@@ -0,0 +1,267 @@
+import functools
+import logging
+import re
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from .config import METRICS_ENABLED
+
+logger = logging.getLogger(__name__)
+
+# Prometheus' default latency buckets (seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_metrics = []
+_collectors = []
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    In-process Prometheus histogram: cumulative bucket counts, sum and count per label set.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def samples(self):
+        with self._lock:
+            series = {key: (list(buckets), total, count) for key, (buckets, total, count) in self._series.items()}
+        for key, (buckets, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, buckets):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{format_labels(self.labelnames, key, [('le', format_value(bound))])} {cumulative}"
+            yield f"{self.name}_bucket{format_labels(self.labelnames, key, [('le', '+Inf')])} {count}"
+            yield f"{self.name}_sum{format_labels(self.labelnames, key)} {format_value(total)}"
+            yield f"{self.name}_count{format_labels(self.labelnames, key)} {count}"
+
+
+def register_collector(collector):
+    """
+    Add a callable returning ``(name, kind, documentation, [(labels_dict, value)])``
+    tuples, evaluated on every scrape. Used for counters kept elsewhere.
+    """
+    _collectors.append(collector)
+    return collector
+
+
+def render_metrics():
+    """
+    All metrics of this process in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    for collector in _collectors:
+        for name, kind, documentation, samples in collector():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{format_labels(labels.keys(), labels.values())} {format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+SPAN_SECONDS = Histogram(
+    "clashroyale_span_duration_seconds", "Duration of instrumented stages (upstream, ingest, proof, render).", ["span"]
+)
+UPSTREAM_SECONDS = Histogram(
+    "clashroyale_upstream_request_duration_seconds",
+    "Clash Royale API requests that reached upstream, by endpoint and status.",
+    ["endpoint", "status"],
+)
+REQUEST_SECONDS = Histogram(
+    "clashroyale_request_duration_seconds", "Time to produce a response, by view and status.", ["view", "status"]
+)
+REQUEST_DB_SECONDS = Histogram(
+    "clashroyale_request_db_seconds", "Database time spent by one request, by view.", ["view"]
+)
+REQUEST_QUERIES = Histogram(
+    "clashroyale_request_db_queries", "Database queries run by one request, by view.", ["view"], QUERY_COUNT_BUCKETS
+)
+
+
+def endpoint_label(endpoint):
+    """
+    Collapse tags and numeric ids in an API path so each endpoint is one series,
+    e.g. ``/players/%23ABC/battlelog`` -> ``/players/{tag}/battlelog``.
+    """
+    endpoint = re.sub(r"/(?:%23|#)[^/?]+", "/{tag}", endpoint)
+    return re.sub(r"/\d+(?=/|$)", "/{id}", endpoint)
+
+
+def observe_upstream(endpoint, status, seconds):
+    if METRICS_ENABLED:
+        UPSTREAM_SECONDS.observe(seconds, endpoint=endpoint_label(endpoint), status=status)
+
+
+# Spans of the request being served, collected for its Server-Timing header
+_current_spans = ContextVar("clashroyale_spans", default=None)
+
+
+class SpanCollector:
+    """
+    Durations of the spans finished while it is active, in order.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._token = None
+
+    def totals(self):
+        """
+        :return: ``{name: (total_seconds, count)}`` in order of first occurrence.
+        """
+        totals = {}
+        for name, seconds in self.spans:
+            total, count = totals.get(name, (0.0, 0))
+            totals[name] = (total + seconds, count + 1)
+        return totals
+
+    def __enter__(self):
+        self._token = _current_spans.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current_spans.reset(self._token)
+
+
+class Span:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.started
+        SPAN_SECONDS.observe(seconds, span=self.name)
+        collector = _current_spans.get()
+        if collector is not None:
+            # list.append is atomic, so spans from sync_to_async threads are safe
+            collector.spans.append((self.name, seconds))
+
+
+_NULL_SPAN = nullcontext()
+
+
+def span(name):
+    """
+    Time a block as the span ``name``: ``with span("render"): ...``.
+    """
+    return Span(name) if METRICS_ENABLED else _NULL_SPAN
+
+
+def timed(name):
+    """
+    Decorator timing each call of a (synchronous) function as the span ``name``.
+
+    With metrics disabled the function is returned unwrapped.
+    """
+
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def server_timing(collector, budget=None, total=None):
+    """
+    ``Server-Timing`` header value for a request's spans, database time and total time.
+    """
+    entries = []
+    for name, (seconds, count) in collector.totals().items():
+        entry = f"{name};dur={seconds * 1000:.2f}"
+        entries.append(entry + (f';desc="{count} calls"' if count > 1 else ""))
+    if budget is not None:
+        entries.append(f'db;dur={budget.elapsed_ms:.2f};desc="{budget.count} queries"')
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+@register_collector
+def cache_metrics():
+    from .cache import get_response_cache
+    from .proof_cache import get_proof_cache
+
+    upstream = get_response_cache().stats.snapshot()
+    proofs = get_proof_cache().snapshot()
+    proof_lookups = proofs["hits"] + proofs["persisted_hits"] + proofs["misses"]
+    return [
+        (
+            "clashroyale_upstream_cache_events_total",
+            "counter",
+            "Upstream response cache lookups by outcome.",
+            [({"event": field}, upstream[field]) for field in upstream if field != "hit_rate"],
+        ),
+        ("clashroyale_upstream_cache_hit_ratio", "gauge", "Share of lookups served from cache.", [({}, upstream["hit_rate"])]),
+        (
+            "clashroyale_proof_cache_events_total",
+            "counter",
+            "Proof cache lookups by outcome.",
+            [({"event": field}, proofs[field]) for field in ("hits", "persisted_hits", "misses")],
+        ),
+        ("clashroyale_proof_cache_entries", "gauge", "Proofs held in the in-process cache.", [({}, proofs["entries"])]),
+        (
+            "clashroyale_proof_cache_hit_ratio",
+            "gauge",
+            "Share of proof lookups served from cache.",
+            [({}, (proofs["hits"] + proofs["persisted_hits"]) / proof_lookups if proof_lookups else 0.0)],
+        ),
+    ]
@@ -0,0 +1,200 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from django.db.models import Max
+
+from clashroyale.models import Challenge, ProofRecord
+from .config import PROOF_CACHE_PERSIST, PROOF_CACHE_SIZE
+from .verification import ChallengeVerification, TrophyVerification, WinLossVerification, is_not_found
+
+logger = logging.getLogger(__name__)
+
+TROPHY = "trophy"
+WIN_LOSS = "win_loss"
+CHALLENGE = "challenge"
+
+
+class ProofCache:
+    """
+    Memo of generated proofs keyed by (proof type, player tag, param, data
+    version, catalogue version).
+
+    ``param`` is the threshold or challenge id. Ingestion bumps
+    ``Player.data_version`` whenever data a proof depends on changes, and
+    challenge syncs advance the catalogue version (see
+    ``challenge_catalogue_version``), so entries never need explicit
+    invalidation: a new version simply misses and old versions age out of the
+    LRU. Proofs that only report missing data are never stored, since syncing
+    that data does not bump either version. With ``persist`` the latest proof
+    per (type, tag, param) is also stored in ``ProofRecord`` and shared between
+    processes.
+    """
+
+    def __init__(self, max_entries=PROOF_CACHE_SIZE, persist=PROOF_CACHE_PERSIST):
+        self.max_entries = max_entries
+        self.persist = persist
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.persisted_hits = self.misses = 0
+
+    def get_many(self, proof_type, player_tag, data_version, params, compute_many, catalogue_version=0):
+        """
+        Return proofs for several params, computing only the missing ones.
+
+        :param compute_many: Called with the list of params that are neither in
+            memory nor persisted; returns a dict of param to proof.
+        :param catalogue_version: Version of shared data the proofs also depend on.
+        :return: Dict of param to proof, in ``params`` order.
+        """
+        params = list(params)
+        version = (data_version, catalogue_version)
+        found = {}
+        with self._lock:
+            for param in params:
+                key = (proof_type, player_tag, str(param), version)
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[param] = self._entries[key]
+            self.hits += len(found)
+        missing = [param for param in params if param not in found]
+        if not missing:
+            return found
+
+        if self.persist:
+            records = ProofRecord.objects.filter(
+                proof_type=proof_type,
+                player_tag=player_tag,
+                data_version=data_version,
+                catalogue_version=catalogue_version,
+                param__in=[str(param) for param in missing],
+            ).values_list("param", "proof")
+            by_param = {str(param): param for param in missing}
+            stored = {by_param[param]: proof for param, proof in records}
+            self._store(proof_type, player_tag, version, stored)
+            found.update(stored)
+            with self._lock:
+                self.persisted_hits += len(stored)
+            missing = [param for param in missing if param not in stored]
+
+        if missing:
+            computed = compute_many(missing)
+            with self._lock:
+                self.misses += len(computed)
+            cacheable = {param: proof for param, proof in computed.items() if not is_not_found(proof)}
+            self._store(proof_type, player_tag, version, cacheable)
+            if self.persist and cacheable:
+                ProofRecord.objects.bulk_create(
+                    [
+                        ProofRecord(
+                            proof_type=proof_type,
+                            player_tag=player_tag,
+                            param=str(param),
+                            data_version=data_version,
+                            catalogue_version=catalogue_version,
+                            proof=proof,
+                        )
+                        for param, proof in cacheable.items()
+                    ],
+                    update_conflicts=True,
+                    unique_fields=["proof_type", "player_tag", "param"],
+                    update_fields=["data_version", "catalogue_version", "proof", "created_at"],
+                )
+            found.update(computed)
+        return {param: found[param] for param in params}
+
+    def get(self, proof_type, player_tag, data_version, param, compute):
+        """
+        Return one proof, calling ``compute()`` on a miss.
+        """
+        return self.get_many(proof_type, player_tag, data_version, [param], lambda missing: {param: compute()})[param]
+
+    def _store(self, proof_type, player_tag, version, proofs):
+        with self._lock:
+            for param, proof in proofs.items():
+                key = (proof_type, player_tag, str(param), version)
+                self._entries[key] = proof
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.persisted_hits = self.misses = 0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "persisted_hits": self.persisted_hits,
+                "misses": self.misses,
+            }
+
+
+_proof_cache = None
+_proof_cache_lock = threading.Lock()
+
+
+def get_proof_cache():
+    """
+    Return the process-wide ``ProofCache``.
+    """
+    global _proof_cache
+    if _proof_cache is None:
+        with _proof_cache_lock:
+            if _proof_cache is None:
+                _proof_cache = ProofCache()
+    return _proof_cache
+
+
+def trophy_proof(player, threshold):
+    """
+    Memoised ``TrophyVerification.generate_trophy_proof`` for a stored ``Player``.
+    """
+    return get_proof_cache().get(
+        TROPHY,
+        player.tag,
+        player.data_version,
+        threshold,
+        lambda: TrophyVerification.generate_trophy_proof(player.tag, threshold=threshold),
+    )
+
+
+def win_loss_proof(player, threshold):
+    """
+    Memoised ``WinLossVerification.generate_win_loss_proof`` for a stored ``Player``.
+    """
+    return get_proof_cache().get(
+        WIN_LOSS,
+        player.tag,
+        player.data_version,
+        threshold,
+        lambda: WinLossVerification.generate_win_loss_proof(player.tag, threshold=threshold),
+    )
+
+
+def challenge_catalogue_version():
+    """
+    Version of the stored challenges: the last time a sync created or changed
+    one (``Challenge.updated_at``), in microseconds; 0 before the first sync.
+    """
+    latest = Challenge.objects.aggregate(latest=Max("updated_at"))["latest"]
+    return int(latest.timestamp() * 1_000_000) if latest else 0
+
+
+def challenge_proofs(player, challenge_ids):
+    """
+    Memoised ``ChallengeVerification.generate_challenge_proofs`` for a stored ``Player``.
+
+    Only the challenges missing from the cache are generated, in one batch.
+    """
+    return get_proof_cache().get_many(
+        CHALLENGE,
+        player.tag,
+        player.data_version,
+        challenge_ids,
+        lambda missing: ChallengeVerification.generate_challenge_proofs(player.tag, missing),
+        catalogue_version=challenge_catalogue_version(),
+    )
@@ -0,0 +1,79 @@
+import logging
+import time
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# The QueryBudget collecting the current request's (or block's) queries, if any.
+# A context variable rather than a thread-local so the queries an async view
+# runs through sync_to_async are counted against the request that awaited them.
+_current_budget = ContextVar("clashroyale_query_budget", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper that times each query against the active ``QueryBudget``.
+
+    Installed on every connection by ``install_query_recorder``; costs one
+    context variable lookup per query when no budget is active.
+    """
+    budget = _current_budget.get()
+    if budget is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        budget.record(sql, time.perf_counter() - started)
+
+
+def install_query_recorder(sender=None, connection=None, **kwargs):
+    """
+    ``connection_created`` receiver adding ``record_query`` to a connection once.
+    """
+    if record_query not in connection.execute_wrappers:
+        # Outermost: a connection opened inside ``execute_wrapper()`` must not
+        # end up on top, or leaving that block pops it instead of the wrapper
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class QueryBudget:
+    """
+    Counts the queries run inside a ``with`` block and their total database time.
+
+    Budgets nest: queries are also counted against every enclosing budget.
+
+    :param capture: Also keep the SQL of each query (for test failure messages).
+    """
+
+    def __init__(self, capture=False):
+        self.capture = capture
+        self.count = 0
+        self.elapsed = 0.0
+        self.queries = []
+        self._parent = None
+        self._token = None
+
+    def record(self, sql, elapsed):
+        self.count += 1
+        self.elapsed += elapsed
+        if self.capture:
+            self.queries.append(sql)
+        if self._parent is not None:
+            self._parent.record(sql, elapsed)
+
+    @property
+    def elapsed_ms(self):
+        return self.elapsed * 1000
+
+    def __enter__(self):
+        self._parent = _current_budget.get()
+        self._token = _current_budget.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current_budget.reset(self._token)
+        self._token = None
+
+    def __str__(self):
+        return f"{self.count} queries in {self.elapsed_ms:.1f}ms"
@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+
+from .config import API_TOKENS, RATE_LIMIT, RATE_LIMIT_BURST, RATE_LIMIT_DB, RATE_LIMIT_MAX_WAIT
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when no API token has budget left and the caller chose not to wait (longer).
+    """
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"Upstream rate limit reached; retry after {retry_after:.2f}s")
+
+
+class TokenBucketLimiter:
+    """
+    Token-bucket rate limiter shared by all processes on one host.
+
+    Bucket state lives in a small SQLite database, one row per API token
+    (keyed by a hash, so tokens never touch disk). Each acquisition refills the
+    buckets lazily from the elapsed wall-clock time and spends from the token
+    with the most remaining budget inside a single ``BEGIN IMMEDIATE``
+    transaction, which serialises concurrent workers and cron jobs.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS buckets ("
+        "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+    )
+
+    def __init__(self, path=RATE_LIMIT_DB, tokens=API_TOKENS, rate=RATE_LIMIT, burst=RATE_LIMIT_BURST):
+        self.path = path
+        self.tokens = list(tokens)
+        self.names = [hashlib.sha256(token.encode()).hexdigest()[:16] for token in self.tokens]
+        self.rate = rate
+        self.burst = burst
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(self.SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _available(self, rows, name, now):
+        tokens, updated_at = rows.get(name, (self.burst, now))
+        return min(self.burst, tokens + (now - updated_at) * self.rate)
+
+    def try_acquire(self):
+        """
+        Spend one request from the API token with the most remaining budget.
+
+        :return: ``(token, 0.0)`` on success, or ``(None, seconds_until_budget)``.
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            placeholders = ",".join("?" * len(self.names))
+            rows = {
+                name: (tokens, updated_at)
+                for name, tokens, updated_at in conn.execute(
+                    f"SELECT name, tokens, updated_at FROM buckets WHERE name IN ({placeholders})", self.names
+                )
+            }
+            available, token, name = max(
+                (self._available(rows, name, now), token, name) for token, name in zip(self.tokens, self.names)
+            )
+            if available >= 1:
+                conn.execute(
+                    "INSERT INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                    (name, available - 1, now),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if available >= 1:
+            return token, 0.0
+        return None, (1 - available) / self.rate
+
+    def acquire(self, block=True, max_wait=RATE_LIMIT_MAX_WAIT):
+        """
+        Return an API token to use for the next request.
+
+        :param block: Wait for budget (up to ``max_wait`` seconds) instead of failing fast.
+        :raises RateLimitExceeded: With a ``retry_after`` hint when no budget is available in time.
+        """
+        deadline = time.monotonic() + max_wait
+        while True:
+            token, wait = self.try_acquire()
+            if token is not None:
+                return token
+            if not block or time.monotonic() + wait > deadline:
+                raise RateLimitExceeded(wait)
+            time.sleep(wait)
+
+    async def aacquire(self, block=True, max_wait=RATE_LIMIT_MAX_WAIT):
+        """
+        Async counterpart of ``acquire`` that waits with ``asyncio.sleep``.
+
+        The SQLite transaction runs in a worker thread: it can wait up to the
+        busy timeout for other processes, which must not stall the event loop.
+        """
+        deadline = time.monotonic() + max_wait
+        while True:
+            token, wait = await sync_to_async(self.try_acquire, thread_sensitive=False)()
+            if token is not None:
+                return token
+            if not block or time.monotonic() + wait > deadline:
+                raise RateLimitExceeded(wait)
+            await asyncio.sleep(wait)
+
+    def penalize(self, token, retry_after):
+        """
+        Drain a token's bucket after upstream answered 429, so no process uses
+        it again until ``retry_after`` seconds have passed.
+        """
+        name = self.names[self.tokens.index(token)]
+        conn = self._connection()
+        conn.execute(
+            "INSERT INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+            (name, -retry_after * self.rate, time.time()),
+        )
+
+    async def apenalize(self, token, retry_after):
+        """
+        Async counterpart of ``penalize``, run off the event loop.
+        """
+        await sync_to_async(self.penalize, thread_sensitive=False)(token, retry_after)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    Return the process-wide ``TokenBucketLimiter``, or None when limiting is disabled.
+    """
+    global _limiter
+    if RATE_LIMIT <= 0:
+        return None
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = TokenBucketLimiter()
+    return _limiter
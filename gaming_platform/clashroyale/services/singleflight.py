@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import weakref
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+from .config import SINGLEFLIGHT_LOCK_DIR, SINGLEFLIGHT_LOCK_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Each key gets its own lock file, removed by the holder on release, so
+# unrelated keys never wait for each other and the directory stays small.
+LOCK_POLL_INTERVAL = 0.02
+# Lock files of the earlier striped layout (singleflight-000.lock ... -255.lock)
+LEGACY_LOCK_FILE = re.compile(r"^singleflight-\d{3}\.lock$")
+
+
+class FileLock:
+    """
+    Exclusive, non-reentrant ``flock`` on a lock file, shared by every process on the host.
+
+    The holder deletes the file on release. A process that locked the file
+    just before it was deleted notices that the path no longer names the
+    file it holds and starts over on a new one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def try_acquire(self):
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            try:
+                current = os.stat(self.path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current == os.fstat(fd).st_ino:
+                self._fd = fd
+                return True
+            os.close(fd)
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        while not self.try_acquire():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(LOCK_POLL_INTERVAL)
+        return True
+
+    async def aacquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        while not self.try_acquire():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is in flight wait and receive the leader's result or
+    exception. ``do`` coalesces threads, ``ado`` coalesces tasks on the running
+    event loop. Results are shared objects and must not be mutated by callers.
+
+    With ``lock_dir`` set, leaders additionally take a host-wide file lock, so
+    a leader in another process finishes (and fills the shared response cache)
+    before this one re-checks the cache and, only if still needed, calls upstream.
+    """
+
+    def __init__(self, lock_dir=SINGLEFLIGHT_LOCK_DIR, lock_timeout=SINGLEFLIGHT_LOCK_TIMEOUT):
+        self.lock_dir = lock_dir if lock_dir and fcntl is not None else None
+        self.lock_timeout = lock_timeout
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+            self._remove_legacy_locks()
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = weakref.WeakKeyDictionary()
+        self.executed = 0
+        self.coalesced = 0
+
+    def _file_lock(self, key):
+        return FileLock(os.path.join(self.lock_dir, f"singleflight-{hashlib.sha1(key.encode()).hexdigest()}.lock"))
+
+    def _remove_legacy_locks(self):
+        for name in os.listdir(self.lock_dir):
+            if LEGACY_LOCK_FILE.match(name):
+                try:
+                    os.unlink(os.path.join(self.lock_dir, name))
+                except FileNotFoundError:
+                    pass
+
+    def _count(self, leader):
+        with self._lock:
+            if leader:
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+    def do(self, key, fn):
+        """
+        Run ``fn()`` once for all threads concurrently asking for ``key``.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        self._count(leader)
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_exclusive(key, fn)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def _run_exclusive(self, key, fn):
+        if not self.lock_dir:
+            return fn()
+        lock = self._file_lock(key)
+        if not lock.acquire(self.lock_timeout):
+            logger.warning(f"Timed out waiting for cross-process lock on {key}; proceeding without it")
+            return fn()
+        try:
+            return fn()
+        finally:
+            lock.release()
+
+    async def ado(self, key, coro_fn):
+        """
+        Await ``coro_fn()`` once for all tasks concurrently asking for ``key``.
+        """
+        loop = asyncio.get_running_loop()
+        calls = self._tasks.setdefault(loop, {})
+        task = calls.get(key)
+        leader = task is None
+        if leader:
+            task = calls[key] = loop.create_task(self._arun_exclusive(key, coro_fn))
+            task.add_done_callback(lambda _: calls.pop(key, None))
+        self._count(leader)
+        # Shield so that one cancelled caller does not cancel the shared request
+        return await asyncio.shield(task)
+
+    async def _arun_exclusive(self, key, coro_fn):
+        if not self.lock_dir:
+            return await coro_fn()
+        lock = self._file_lock(key)
+        if not await lock.aacquire(self.lock_timeout):
+            logger.warning(f"Timed out waiting for cross-process lock on {key}; proceeding without it")
+            return await coro_fn()
+        try:
+            return await coro_fn()
+        finally:
+            lock.release()
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """
+    Return the process-wide ``SingleFlight`` used for upstream requests.
+    """
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight()
+    return _single_flight
@@ -0,0 +1,89 @@
+import logging
+
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from clashroyale.models import BattleLog, PlayerStats
+from .archive import archived_battle_stats
+
+logger = logging.getLogger(__name__)
+
+STAT_FIELDS = ["battle_count", "wins", "losses", "crowns", "trophy_delta"]
+
+
+def aggregate_battle_stats(battles):
+    """
+    Compute battle totals for a ``BattleLog`` queryset with one aggregate query.
+
+    A battle counts as a win when the player earned at least one crown.
+
+    :return: Dict with battle_count, wins, losses, crowns and trophy_delta.
+    """
+    totals = battles.aggregate(
+        battle_count=Count("id"),
+        wins=Coalesce(Sum(Case(When(crowns__gt=0, then=Value(1)), default=Value(0), output_field=IntegerField())), 0),
+        crowns=Coalesce(Sum("crowns"), 0),
+        trophy_delta=Coalesce(Sum("trophy_change"), 0),
+    )
+    totals["losses"] = totals["battle_count"] - totals["wins"]
+    return totals
+
+
+def battle_totals(battle_logs):
+    """
+    Totals of in-memory ``BattleLog`` instances, mirroring ``aggregate_battle_stats``.
+    """
+    wins = sum(1 for battle in battle_logs if battle.crowns > 0)
+    return {
+        "battle_count": len(battle_logs),
+        "wins": wins,
+        "losses": len(battle_logs) - wins,
+        "crowns": sum(battle.crowns for battle in battle_logs),
+        "trophy_delta": sum(battle.trophy_change for battle in battle_logs),
+    }
+
+
+def stored_battle_stats(player_tag):
+    """
+    Totals of a player's battles in ``BattleLog`` and in the battle archive.
+    """
+    totals = aggregate_battle_stats(BattleLog.objects.filter(player_tag=player_tag))
+    archived = archived_battle_stats(player_tag)
+    return {field: totals[field] + archived[field] for field in STAT_FIELDS}
+
+
+def rebuild_player_stats(player_tag):
+    """
+    Recompute a player's ``PlayerStats`` row from their stored battles.
+    """
+    totals = stored_battle_stats(player_tag)
+    stats, _ = PlayerStats.objects.update_or_create(player_tag=player_tag, defaults=totals)
+    return stats
+
+
+def add_battles_to_stats(player_tag, battle_logs):
+    """
+    Fold newly inserted battles into the player's ``PlayerStats`` with one UPDATE.
+
+    Must run in the transaction that inserted ``battle_logs``. A player without
+    a stats row yet gets one computed from all of their stored battles.
+    """
+    if not battle_logs:
+        return
+    totals = battle_totals(battle_logs)
+    updated = PlayerStats.objects.filter(player_tag=player_tag).update(
+        **{field: F(field) + totals[field] for field in STAT_FIELDS}
+    )
+    if not updated:
+        rebuild_player_stats(player_tag)
+
+
+def get_player_stats(player_tag):
+    """
+    Return the player's battle totals, from ``PlayerStats`` when available.
+    """
+    stats = PlayerStats.objects.filter(player_tag=player_tag).values(*STAT_FIELDS).first()
+    if stats is None:
+        # Battles stored before the stats table existed (or none at all)
+        stats = stored_battle_stats(player_tag)
+    return stats
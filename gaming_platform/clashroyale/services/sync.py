@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import urllib.parse
+from datetime import timedelta
+
+from django.db.models import F, Max
+from django.utils import timezone
+
+from clashroyale.models import Challenge, Clan, Player
+from .api_client import make_request
+from .async_api_client import async_make_request
+from .config import CHALLENGES_STALE_AFTER, PLAYER_STALE_AFTER
+from .ingest import ingest_new_battles, sync_challenges
+from .leaderboard import record_player
+from .metrics import timed
+from .trophy_history import record_trophy_sample
+
+logger = logging.getLogger(__name__)
+
+
+async def _afetch_player_and_clan(encoded_player_tag):
+    """
+    Fetches the player and, once the clan tag is known, the player's clan.
+    """
+    player_data = await async_make_request(f"/players/{encoded_player_tag}")
+    clan_data = None
+    if isinstance(player_data, dict) and isinstance(player_data.get("clan"), dict):
+        clan_tag = player_data["clan"].get("tag")
+        if clan_tag:
+            clan_data = await async_make_request(f"/clans/{urllib.parse.quote(clan_tag)}")
+    return player_data, clan_data
+
+
+async def _no_data():
+    return None
+
+
+async def afetch_player_bundle(player_tag, include_challenges=True):
+    """
+    Issues the independent upstream calls for a player concurrently.
+
+    The clan lookup depends on the player payload, so it is chained after the
+    player call while the battle log (and challenges) calls are still in flight.
+    Returns ``(player_data, clan_data, battle_log_data, challenges_data)``.
+    """
+    encoded_player_tag = urllib.parse.quote(player_tag)
+    (player_data, clan_data), battle_log_data, challenges_data = await asyncio.gather(
+        _afetch_player_and_clan(encoded_player_tag),
+        async_make_request(f"/players/{encoded_player_tag}/battlelog"),
+        async_make_request("/challenges") if include_challenges else _no_data(),
+    )
+    return player_data, clan_data, battle_log_data, challenges_data
+
+
+def fetch_player_bundle(player_tag):
+    """
+    Blocking counterpart of ``afetch_player_bundle`` for worker threads (no challenges).
+    """
+    encoded_player_tag = urllib.parse.quote(player_tag)
+    player_data = make_request(f"/players/{encoded_player_tag}")
+    clan_data = None
+    if isinstance(player_data, dict) and isinstance(player_data.get("clan"), dict):
+        clan_tag = player_data["clan"].get("tag")
+        if clan_tag:
+            clan_data = make_request(f"/clans/{urllib.parse.quote(clan_tag)}")
+    battle_log_data = make_request(f"/players/{encoded_player_tag}/battlelog")
+    return player_data, clan_data, battle_log_data, None
+
+
+@timed("store")
+def store_player_bundle(player_data, clan_data, battle_log_data, challenges_data=None):
+    """
+    Stores fetched player, clan, battle log and (optionally) challenge data.
+
+    :return: The stored ``Player``, or None if ``player_data`` is not a valid player.
+    """
+    if not isinstance(player_data, dict) or "tag" not in player_data:
+        return None
+
+    # 1. Store the player
+    clan_tag = player_data["clan"].get("tag", "") if isinstance(player_data.get("clan"), dict) else ""
+    values = {
+        "name": player_data["name"],
+        "level": player_data["expLevel"],
+        "trophies": player_data["trophies"],
+        "clan_tag": clan_tag,
+        "last_synced_at": timezone.now(),
+    }
+    player, created = Player.objects.get_or_create(tag=player_data["tag"], defaults=values)
+    trophies_changed = not created and player.trophies != values["trophies"]
+    # Trophies and battles are what proofs are computed from
+    proof_data_changed = trophies_changed
+
+    # 2. Store the clan if the player is part of one
+    if clan_tag:
+        if isinstance(clan_data, dict) and "tag" in clan_data:
+            Clan.objects.update_or_create(
+                tag=clan_data["tag"],
+                defaults={
+                    "name": clan_data["name"],
+                    "description": clan_data.get("description", ""),
+                    "badge_id": clan_data["badgeId"],
+                    "clan_score": clan_data["clanScore"],
+                    "members_count": clan_data["members"],
+                },
+            )
+            logger.info(f"Clan data stored successfully for clan tag: {clan_tag}")
+        else:
+            logger.warning(f"No valid clan data found for clan tag: {clan_tag}")
+
+    # 3. Store challenges (batched diff)
+    if challenges_data is not None:
+        _, counts = sync_challenges(challenges_data)
+        logger.info(f"Challenges synced: {counts}")
+
+    # 4. Store the battle log (only battles newer than the last sync)
+    if isinstance(battle_log_data, list) and battle_log_data:
+        new_battles = ingest_new_battles(player.tag, battle_log_data)
+        proof_data_changed = proof_data_changed or bool(new_battles)
+        logger.info(f"Battle logs processed successfully: {len(new_battles)} new battles.")
+
+    # 5. Refresh the player row, bumping the data version that keys cached proofs
+    if proof_data_changed:
+        values["data_version"] = F("data_version") + 1
+    if not created or proof_data_changed:
+        Player.objects.filter(pk=player.pk).update(**values)
+        for field, value in values.items():
+            setattr(player, field, value)
+        if proof_data_changed:
+            player.data_version = Player.objects.values_list("data_version", flat=True).get(pk=player.pk)
+    # 6. Extend the trophy history (unchanged counts add no sample)
+    if created or trophies_changed:
+        record_trophy_sample(player.tag, player.trophies, values["last_synced_at"])
+    record_player(player.tag, player.trophies, player.clan_tag)
+
+    return player
+
+
+def sync_player(player_tag):
+    """
+    Fetches and stores everything about one player. Used by the sync worker.
+
+    :raises ValueError: If upstream did not return valid player data.
+    """
+    player_data, clan_data, battle_log_data, _ = fetch_player_bundle(player_tag)
+    player = store_player_bundle(player_data, clan_data, battle_log_data)
+    if player is None:
+        raise ValueError(f"No valid player data for {player_tag}: {player_data}")
+    return player
+
+
+def sync_all_challenges():
+    """
+    Fetches and stores the ``/challenges`` list. Used by the sync worker.
+
+    :raises ValueError: If upstream did not return a challenge list.
+    """
+    challenges_data = make_request("/challenges")
+    if not isinstance(challenges_data, list):
+        raise ValueError(f"Challenges data is not in the expected format: {challenges_data}")
+    return sync_challenges(challenges_data)
+
+
+def is_player_stale(player):
+    return player.last_synced_at is None or (
+        timezone.now() - player.last_synced_at > timedelta(seconds=PLAYER_STALE_AFTER)
+    )
+
+
+def latest_challenge_sync():
+    return Challenge.objects.aggregate(latest=Max("synced_at"))["latest"]
+
+
+def are_challenges_stale(latest=None):
+    latest = latest_challenge_sync() if latest is None else latest
+    return latest is None or timezone.now() - latest > timedelta(seconds=CHALLENGES_STALE_AFTER)
+
+
+def current_challenges(latest=None):
+    """
+    Challenges returned by the most recent ``/challenges`` sync.
+    """
+    latest = latest_challenge_sync() if latest is None else latest
+    if latest is None:
+        return []
+    return list(Challenge.objects.filter(synced_at=latest))
@@ -0,0 +1,124 @@
+import logging
+import uuid
+from datetime import timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from clashroyale.models import SyncJob
+from .config import SYNC_LOCK_TIMEOUT, SYNC_MAX_ATTEMPTS, SYNC_RETRY_DELAY
+from .sync import sync_all_challenges, sync_player
+
+logger = logging.getLogger(__name__)
+
+def enqueue_sync(job_type, target_tag="", priority=0):
+    """
+    Queue a refresh unless one is already queued or running for the same target.
+
+    An already queued job is bumped to ``priority`` if that is higher, so a
+    user waiting on a page overtakes bulk refreshes.
+
+    :return: True if a new job was created.
+    """
+    bumped = SyncJob.objects.filter(
+        job_type=job_type, target_tag=target_tag, status=SyncJob.Status.PENDING
+    ).update(priority=Greatest(F("priority"), priority))
+    if bumped:
+        return False
+    try:
+        # The partial unique constraint rejects the insert if another process just queued it
+        with transaction.atomic():
+            SyncJob.objects.create(
+                job_type=job_type, target_tag=target_tag, priority=priority, next_run_at=timezone.now()
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def claim_jobs(limit):
+    """
+    Atomically claim up to ``limit`` due jobs for this worker.
+
+    Candidates are selected with ``SELECT ... FOR UPDATE SKIP LOCKED`` where
+    the database supports it; the claim itself is a conditional UPDATE
+    (``status = pending``) stamped with a unique token, so concurrent workers
+    never run the same job, on SQLite as well.
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    with transaction.atomic():
+        candidates = SyncJob.objects.filter(status=SyncJob.Status.PENDING, next_run_at__lte=now).order_by(
+            "-priority", "next_run_at"
+        )
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        ids = list(candidates.values_list("id", flat=True)[:limit])
+        if not ids:
+            return []
+        SyncJob.objects.filter(id__in=ids, status=SyncJob.Status.PENDING).update(
+            status=SyncJob.Status.RUNNING, locked_by=token, locked_at=now, attempts=F("attempts") + 1
+        )
+    return list(SyncJob.objects.filter(locked_by=token, status=SyncJob.Status.RUNNING).order_by("-priority"))
+
+
+def complete_job(job):
+    SyncJob.objects.filter(id=job.id, locked_by=job.locked_by).update(
+        status=SyncJob.Status.DONE, locked_by="", last_error=""
+    )
+
+
+def fail_job(job, error):
+    """
+    Schedule a retry with exponential backoff, or give up after ``SYNC_MAX_ATTEMPTS``.
+    """
+    if job.attempts >= SYNC_MAX_ATTEMPTS:
+        status, next_run_at = SyncJob.Status.FAILED, job.next_run_at
+    else:
+        status = SyncJob.Status.PENDING
+        next_run_at = timezone.now() + timedelta(seconds=SYNC_RETRY_DELAY * 2 ** (job.attempts - 1))
+    SyncJob.objects.filter(id=job.id, locked_by=job.locked_by).update(
+        status=status, next_run_at=next_run_at, locked_by="", last_error=str(error)[:2000]
+    )
+
+
+def requeue_stale_jobs(timeout=SYNC_LOCK_TIMEOUT):
+    """
+    Return jobs held by workers that died mid-job to the queue.
+    """
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    return SyncJob.objects.filter(status=SyncJob.Status.RUNNING, locked_at__lt=cutoff).update(
+        status=SyncJob.Status.PENDING, locked_by=""
+    )
+
+
+def purge_finished_jobs(age=86400):
+    """
+    Delete finished jobs older than ``age`` seconds; failed jobs are kept for inspection.
+    """
+    cutoff = timezone.now() - timedelta(seconds=age)
+    deleted, _ = SyncJob.objects.filter(status=SyncJob.Status.DONE, updated_at__lt=cutoff).delete()
+    return deleted
+
+
+def run_job(job):
+    """
+    Execute one claimed job and record the outcome.
+
+    :return: True on success.
+    """
+    try:
+        if job.job_type == SyncJob.JobType.PLAYER:
+            sync_player(job.target_tag)
+        elif job.job_type == SyncJob.JobType.CHALLENGES:
+            sync_all_challenges()
+        else:
+            raise ValueError(f"Unknown job type: {job.job_type}")
+    except Exception as e:
+        logger.warning(f"Sync job {job} failed (attempt {job.attempts}): {e}")
+        fail_job(job, e)
+        return False
+    complete_job(job)
+    return True
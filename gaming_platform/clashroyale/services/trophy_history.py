@@ -0,0 +1,226 @@
+import logging
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db.models import Max
+from django.utils import timezone
+
+from clashroyale.models import TrophyRollup, TrophySample
+from .config import TROPHY_DAILY_RETENTION, TROPHY_HOURLY_RETENTION, TROPHY_SAMPLE_RETENTION
+
+logger = logging.getLogger(__name__)
+
+RAW = "raw"
+HOUR = TrophyRollup.Resolution.HOUR
+DAY = TrophyRollup.Resolution.DAY
+RESOLUTIONS = (RAW, HOUR, DAY)
+
+# "auto" picks the finest resolution whose points over the requested span stay
+# in the hundreds: raw up to 2 days, hourly up to 14 days, daily beyond
+AUTO_RESOLUTIONS = ((timedelta(days=2), RAW), (timedelta(days=14), HOUR))
+
+# Samples committed shortly after a rollup read past them are still picked up by the next one
+ROLLUP_OVERLAP = timedelta(minutes=5)
+
+# Hourly buckets of the current day, and raw samples of the current hour, are
+# rebuilt from the tier below on every rollup, so neither may expire sooner
+MIN_RETENTION = timedelta(days=2)
+
+BATCH_SIZE = 1000
+ROLLUP_FIELDS = ["min_trophies", "max_trophies", "last_trophies", "sample_count"]
+
+
+def bucket_start(moment, resolution):
+    """
+    Start (UTC) of the ``resolution`` bucket holding ``moment``.
+    """
+    moment = moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if resolution == DAY else moment
+
+
+def record_trophy_sample(player_tag, trophies, recorded_at=None):
+    """
+    Append a sample to a player's history; called by syncs that found the trophy count changed.
+    """
+    return TrophySample.objects.create(
+        player_tag=player_tag, trophies=trophies, recorded_at=recorded_at or timezone.now()
+    )
+
+
+def downsample(points, resolution):
+    """
+    Merge time-ordered ``(player_tag, time, min, max, last, count)`` points
+    into ``resolution`` buckets.
+
+    :return: ``{(player_tag, bucket_start): [min, max, last, count]}``
+    """
+    buckets = {}
+    for player_tag, moment, low, high, last, count in points:
+        key = (player_tag, bucket_start(moment, resolution))
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [low, high, last, count]
+        else:
+            bucket[0] = min(bucket[0], low)
+            bucket[1] = max(bucket[1], high)
+            bucket[2] = last
+            bucket[3] += count
+    return buckets
+
+
+def save_rollups(buckets, resolution):
+    TrophyRollup.objects.bulk_create(
+        (
+            TrophyRollup(
+                player_tag=player_tag, resolution=resolution, bucket_start=start,
+                min_trophies=low, max_trophies=high, last_trophies=last, sample_count=count,
+            )
+            for (player_tag, start), (low, high, last, count) in buckets.items()
+        ),
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["player_tag", "resolution", "bucket_start"],
+        update_fields=ROLLUP_FIELDS,
+    )
+
+
+def rollup_watermark():
+    """
+    Start of the newest hourly bucket, or None before the first rollup.
+    """
+    return TrophyRollup.objects.filter(resolution=HOUR).aggregate(latest=Max("bucket_start"))["latest"]
+
+
+def rollup_trophy_history():
+    """
+    Roll the samples recorded since the last run into hourly buckets and the
+    hours touched into daily buckets.
+
+    Every touched bucket is recomputed whole from the tier below, so running
+    it again (or concurrently) writes the same rows.
+
+    :return: ``(hourly, daily)`` numbers of buckets written.
+    """
+    watermark = rollup_watermark()
+    samples = TrophySample.objects.order_by("recorded_at", "id")
+    if watermark is not None:
+        # Whole hours, so touched buckets see every sample they hold
+        samples = samples.filter(recorded_at__gte=bucket_start(watermark - ROLLUP_OVERLAP, HOUR))
+    hourly = downsample(
+        (
+            (player_tag, recorded_at, trophies, trophies, trophies, 1)
+            for player_tag, recorded_at, trophies in samples.values_list(
+                "player_tag", "recorded_at", "trophies"
+            ).iterator(chunk_size=BATCH_SIZE)
+        ),
+        HOUR,
+    )
+    if not hourly:
+        return 0, 0
+    save_rollups(hourly, HOUR)
+
+    first_day = bucket_start(min(start for _, start in hourly), DAY)
+    player_tags = sorted({player_tag for player_tag, _ in hourly})
+    daily = {}
+    for offset in range(0, len(player_tags), BATCH_SIZE):
+        hours = TrophyRollup.objects.filter(
+            player_tag__in=player_tags[offset:offset + BATCH_SIZE], resolution=HOUR, bucket_start__gte=first_day
+        ).order_by("bucket_start")
+        daily.update(downsample(hours.values_list("player_tag", "bucket_start", *ROLLUP_FIELDS), DAY))
+    save_rollups(daily, DAY)
+    logger.info(f"Trophy history rolled up: {len(hourly)} hourly and {len(daily)} daily buckets")
+    return len(hourly), len(daily)
+
+
+def retention_cutoff(days, now):
+    return now - max(timedelta(days=days), MIN_RETENTION)
+
+
+def apply_trophy_retention(now=None):
+    """
+    Delete samples and buckets older than their retention. Samples of the
+    day holding the rollup watermark are kept regardless: ``trophy_history``
+    computes the buckets the last rollup may not have completed from them.
+
+    :return: ``{"samples": n, "hour": n, "day": n}`` rows deleted.
+    """
+    now = now or timezone.now()
+    deleted = {"samples": 0, HOUR: 0, DAY: 0}
+    watermark = rollup_watermark()
+    if TROPHY_SAMPLE_RETENTION and watermark is not None:
+        cutoff = min(retention_cutoff(TROPHY_SAMPLE_RETENTION, now), bucket_start(watermark - ROLLUP_OVERLAP, DAY))
+        deleted["samples"], _ = TrophySample.objects.filter(recorded_at__lt=cutoff).delete()
+    for resolution, days in ((HOUR, TROPHY_HOURLY_RETENTION), (DAY, TROPHY_DAILY_RETENTION)):
+        if days:
+            deleted[resolution], _ = TrophyRollup.objects.filter(
+                resolution=resolution, bucket_start__lt=retention_cutoff(days, now)
+            ).delete()
+    if any(deleted.values()):
+        logger.info(f"Trophy history retention deleted {deleted}")
+    return deleted
+
+
+def maintain_trophy_history():
+    """
+    One rollup and retention pass, as run periodically by ``run_sync_worker``.
+    """
+    return rollup_trophy_history(), apply_trophy_retention()
+
+
+def auto_resolution(span):
+    for longest, resolution in AUTO_RESOLUTIONS:
+        if span <= longest:
+            return resolution
+    return DAY
+
+
+def trophy_history(player_tag, start=None, end=None, resolution="auto"):
+    """
+    A player's trophy series between ``start`` and ``end`` (default: the last 90 days).
+
+    Hourly and daily series are read from the rollups; buckets the last
+    rollup may not have completed are computed from raw samples (which are
+    kept until rolled up), so the series is current between rollup runs.
+
+    :param resolution: ``"raw"``, ``"hour"``, ``"day"`` or ``"auto"``.
+    :return: ``(resolution, points)``; points are dicts with time (bucket
+        start), min, max, last and samples, oldest first.
+    """
+    end = end or timezone.now()
+    start = start or end - timedelta(days=90)
+    if resolution == "auto":
+        resolution = auto_resolution(end - start)
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution {resolution!r}; expected one of {', '.join(RESOLUTIONS)} or auto.")
+
+    samples = TrophySample.objects.filter(player_tag=player_tag, recorded_at__lt=end).order_by("recorded_at", "id")
+    if resolution == RAW:
+        rows = samples.filter(recorded_at__gte=start).values_list("recorded_at", "trophies")
+        return RAW, [
+            {"time": recorded_at, "min": trophies, "max": trophies, "last": trophies, "samples": 1}
+            for recorded_at, trophies in rows
+        ]
+
+    first = bucket_start(start, resolution)
+    watermark = rollup_watermark()
+    tail_start = first if watermark is None else max(first, bucket_start(watermark - ROLLUP_OVERLAP, resolution))
+    rollups = list(
+        TrophyRollup.objects.filter(
+            player_tag=player_tag, resolution=resolution, bucket_start__gte=first, bucket_start__lt=tail_start
+        )
+        .order_by("bucket_start")
+        .values_list("bucket_start", *ROLLUP_FIELDS)
+    )
+    tail = downsample(
+        (
+            (player_tag, recorded_at, trophies, trophies, trophies, 1)
+            for recorded_at, trophies in samples.filter(recorded_at__gte=tail_start).values_list(
+                "recorded_at", "trophies"
+            )
+        ),
+        resolution,
+    )
+    rollups.extend((bucket_time, *bucket) for (_, bucket_time), bucket in tail.items())
+    return resolution, [
+        {"time": time, "min": low, "max": high, "last": last, "samples": count}
+        for time, low, high, last, count in rollups
+    ]
@@ -1,6 +1,20 @@
 import hashlib
 from clashroyale.models import Player, Challenge, BattleLog
 from django.core.exceptions import ObjectDoesNotExist
+from .archive import has_archived_battle
+from .metrics import timed
+from .stats import get_player_stats
+
+
+# Message prefixes of proofs generated for a player or challenge that is not stored
+NOT_FOUND_MESSAGES = ("Player not found", "Challenge or player data not found")
+
+
+def is_not_found(proof: dict) -> bool:
+    """
+    Whether ``proof`` only reports missing data (and may change once that data is synced).
+    """
+    return proof.get("commitment") is None and proof.get("message", "").startswith(NOT_FOUND_MESSAGES)
 
 
 class TrophyVerification:
@@ -12,6 +26,7 @@ class TrophyVerification:
         return hashlib.sha256(str(trophies).encode()).hexdigest()
 
     @staticmethod
+    @timed("proof.trophy")
     def generate_trophy_proof(player_tag: str, threshold: int) -> dict:
         """
         Generate a proof that the player's trophy count is above a threshold.
@@ -55,33 +70,61 @@ class ChallengeVerification:
         """
         Generate a proof that the player has completed a specific challenge.
         """
-        try:
-            challenge = Challenge.objects.get(id=challenge_id)
-            # Check if the player has completed the challenge by checking battle logs or a player-challenge relation
-            player = Player.objects.get(tag=player_tag)
+        return ChallengeVerification.generate_challenge_proofs(player_tag, [challenge_id])[challenge_id]
+
+    @staticmethod
+    @timed("proof.challenge")
+    def generate_challenge_proofs(player_tag: str, challenge_ids) -> dict:
+        """
+        Generate challenge completion proofs for many challenges at once.
+
+        The player, the challenges (``in_bulk``) and the battle log evidence are
+        each loaded once, so the query count does not grow with the number of
+        challenges.
 
-            # Here, assuming that the player's challenge completion is based on battle log data or other criteria
-            challenge_completed = BattleLog.objects.filter(player_tag=player_tag, trophy_change__gte=0).exists()
+        :return: Dict mapping each challenge id to its proof, in input order.
+        """
+        challenge_ids = list(challenge_ids)
+        if not challenge_ids:
+            return {}
+
+        def not_found(error):
+            return {
+                "proof": False,
+                "commitment": None,
+                "message": f"Challenge or player data not found: {str(error)}"
+            }
 
-            if challenge_completed:
+        # Check if the player has completed the challenge by checking battle logs or a player-challenge relation
+        if not Player.objects.filter(tag=player_tag).exists():
+            error = Player.DoesNotExist("Player matching query does not exist.")
+            return {challenge_id: not_found(error) for challenge_id in challenge_ids}
+        challenges = Challenge.objects.in_bulk([str(challenge_id) for challenge_id in challenge_ids])
+
+        # Here, assuming that the player's challenge completion is based on battle log data or other criteria
+        challenge_completed = BattleLog.objects.filter(
+            player_tag=player_tag, trophy_change__gte=0
+        ).exists() or has_archived_battle(player_tag, min_trophy_change=0)
+
+        proofs = {}
+        for challenge_id in challenge_ids:
+            challenge = challenges.get(str(challenge_id))
+            if challenge is None:
+                proofs[challenge_id] = not_found(Challenge.DoesNotExist("Challenge matching query does not exist."))
+            elif challenge_completed:
                 commitment = ChallengeVerification.commit_challenge_completion(challenge_id, player_tag)
-                return {
+                proofs[challenge_id] = {
                     "proof": True,
                     "commitment": commitment,
                     "message": f"Player {player_tag} has completed the challenge {challenge.name}."
                 }
             else:
-                return {
+                proofs[challenge_id] = {
                     "proof": False,
                     "commitment": None,
                     "message": f"Player {player_tag} has not completed the challenge {challenge.name}."
                 }
-        except (ObjectDoesNotExist, Challenge.DoesNotExist) as e:
-            return {
-                "proof": False,
-                "commitment": None,
-                "message": f"Challenge or player data not found: {str(e)}"
-            }
+        return proofs
 
     @staticmethod
     def verify_challenge_proof(commitment: str, challenge_id: str, player_tag: str) -> bool:
@@ -96,13 +139,12 @@ class WinLossVerification:
     @staticmethod
     def calculate_win_loss_ratio(player_tag: str) -> float:
         """
-        Calculate the win-loss ratio for a player based on their battle logs.
+        Calculate the win-loss ratio for a player from their battle totals.
         """
-        battles = BattleLog.objects.filter(player_tag=player_tag)
-        if not battles:
+        stats = get_player_stats(player_tag)
+        if not stats["battle_count"]:
             return 0.0
-        wins = sum(1 for battle in battles if battle.crowns > 0)  # Assuming crowns indicate a win
-        losses = len(battles) - wins
+        wins, losses = stats["wins"], stats["losses"]  # Assuming crowns indicate a win
         if losses == 0:
             return wins  # No losses, return win count as the ratio
         return (wins / losses) * 100  # Win-to-loss ratio
@@ -115,6 +157,7 @@ class WinLossVerification:
         return hashlib.sha256(f"{ratio:.2f}".encode()).hexdigest()
 
     @staticmethod
+    @timed("proof.win_loss")
     def generate_win_loss_proof(player_tag: str, threshold: float) -> dict:
         """
         Generate a proof that the player's win-loss ratio is above a threshold.
@@ -1,3 +1,1707 @@
-from django.test import TestCase
+import asyncio
+import bisect
+import csv
+import gzip
+import hashlib
+import importlib
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import urllib.parse
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import requests
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    BattleArchive, BattleCommitment, BattleLog, Challenge, Clan, GameMode, Player, PlayerSyncState, Prize, ProofRecord,
+    SyncJob, TrophyRollup, TrophySample,
+)
+from .services import (
+    analytics, api_client, archive, attestation, bulk_verify, leaderboard, merkle, proof_cache, ratelimit,
+    singleflight, sync_queue, trophy_history,
+)
+from .services.cache import ResponseCache
+from .services.config import METRICS_ENABLED
+from .services.ingest import ingest_new_battles, make_battle_id, parse_battle_time, sync_challenges
+from .services.merkle import battle_inclusion_proof, rebuild_battle_commitment, verify_inclusion
+from .services.metrics import endpoint_label
+from .services.proof_cache import get_proof_cache
+from .services.query_budget import QueryBudget
+from .services.stats import aggregate_battle_stats, battle_totals, get_player_stats, rebuild_player_stats
+from .services.sync import store_player_bundle
+from .services.verification import ChallengeVerification, TrophyVerification
+
+PLAYER_TAG = "#ABC12345"
+OTHER_TAG = "#XYZ98765"
+
+
+class QueryBudgetMixin:
+    """
+    ``assertQueryBudget`` fails a test whose block runs more queries than allowed.
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries):
+        with QueryBudget(capture=True) as budget:
+            yield budget
+        if budget.count > max_queries:
+            queries = "\n".join(f"{number}. {sql}" for number, sql in enumerate(budget.queries, start=1))
+            self.fail(f"{budget.count} queries run, budget is {max_queries}:\n{queries}")
+
+
+def create_battles(player_tag, count, start=None):
+    start = start or timezone.now() - timedelta(days=1)
+    BattleLog.objects.bulk_create(
+        BattleLog(
+            battle_id=f"{player_tag}|{i}|#OPP{i}",
+            type="PvP",
+            timestamp=start + timedelta(minutes=i),
+            player_tag=player_tag,
+            player_name="Tester",
+            opponent_tag=f"#OPP{i}",
+            starting_trophies=8000,
+            trophy_change=30 if i % 3 else -30,
+            crowns=i % 4,
+        )
+        for i in range(count)
+    )
+
+
+def challenges_payload(count):
+    return [
+        {
+            "type": "singleChallenge",
+            "challenges": [
+                {"id": 70000000 + i, "name": f"Challenge {i}", "description": "Win 12", "iconUrl": "icon.png"}
+                for i in range(count)
+            ],
+        }
+    ]
+
+
+def create_player_page_data():
+    """
+    A fresh player with a clan, battles, stats and current challenges, so the
+    player page is served without upstream calls or queued refreshes.
+    """
+    now = timezone.now()
+    Clan.objects.create(tag="#CLAN1", name="Clan", badge_id=1, clan_score=1000, members_count=10)
+    Player.objects.create(
+        tag=PLAYER_TAG, name="Tester", level=14, trophies=8100, clan_tag="#CLAN1", last_synced_at=now
+    )
+    Challenge.objects.bulk_create(
+        Challenge(id=str(70000000 + i), name=f"Challenge {i}", max_losses=3, max_wins=12, synced_at=now)
+        for i in range(5)
+    )
+    create_battles(PLAYER_TAG, 40)
+    create_battles(OTHER_TAG, 40)
+    rebuild_player_stats(PLAYER_TAG)
+    rebuild_battle_commitment(PLAYER_TAG)
+
+
+class PlayerStatsViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_player_page_data()
+
+    def setUp(self):
+        get_proof_cache().clear()
+        self.url = reverse("player_stats") + "?player_tag=%23ABC12345"
+
+    def test_fresh_player_page_within_budget(self):
+        # Player, challenge staleness, clan, proof inputs (player, stats,
+        # current challenges, catalogue version, challenge evidence) and the
+        # latest battles
+        with self.assertQueryBudget(12):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["battles"]), 10)
+
+    def test_cached_proofs_page_within_budget(self):
+        self.client.get(self.url)
+        # Proofs come from the proof cache: no stats or evidence queries
+        with self.assertQueryBudget(7):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(DEBUG=True)
+    def test_query_header_in_debug(self):
+        response = self.client.get(self.url)
+        self.assertRegex(response["X-DB-Queries"], r"^count=\d+; time=\d+\.\d{2}ms$")
+
+    def test_no_query_header_without_debug(self):
+        response = self.client.get(self.url)
+        self.assertNotIn("X-DB-Queries", response)
+
+    def test_wrapper_of_a_connection_opened_in_a_block_is_kept(self):
+        from .services.query_budget import record_query
+
+        def run():
+            try:
+                with connection.execute_wrapper(lambda execute, *args: execute(*args)):
+                    Player.objects.count()
+                wrappers.extend(connection.execute_wrappers)
+            finally:
+                connection.close()
+
+        # A new thread opens its own connection inside the block
+        wrappers = []
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        self.assertEqual(wrappers, [record_query])
+
+
+@skipUnless(METRICS_ENABLED, "Metrics are disabled")
+class ServerTimingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_player_page_data()
+
+    def setUp(self):
+        get_proof_cache().clear()
+
+    def test_player_page_stages(self):
+        response = self.client.get(reverse("player_stats") + "?player_tag=%23ABC12345")
+        stages = [entry.split(";")[0] for entry in response["Server-Timing"].split(", ")]
+        self.assertEqual(stages, ["proof.trophy", "proof.win_loss", "proof.challenge", "render", "db", "total"])
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse("player_stats") + "?player_tag=%23ABC12345")
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('clashroyale_request_duration_seconds_count{view="player_stats",status="200"}', body)
+        self.assertIn('clashroyale_span_duration_seconds_bucket{span="render",le="+Inf"}', body)
+        self.assertIn("# TYPE clashroyale_proof_cache_hit_ratio gauge", body)
+
+    def test_endpoint_label(self):
+        self.assertEqual(endpoint_label("/players/%23ABC12345/battlelog"), "/players/{tag}/battlelog")
+        self.assertEqual(endpoint_label("/locations/57000249/rankings/players"), "/locations/{id}/rankings/players")
+        self.assertEqual(endpoint_label("/challenges"), "/challenges")
+
+
+class ChallengeDetailViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @mock.patch("clashroyale.views.make_request", return_value=challenges_payload(20))
+    def test_challenge_list_within_budget(self, make_request):
+        # Rendered straight from the upstream response
+        with self.assertQueryBudget(0):
+            response = self.client.get(reverse("challenge_details"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["challenges"]), 20)
+        make_request.assert_called_once_with("/challenges")
+
+
+@skipUnless(connection.vendor == "sqlite", "Plans are checked against SQLite's EXPLAIN QUERY PLAN")
+class BattleLogIndexTests(TestCase):
+    """
+    The hot BattleLog queries are answered by an index range search, with no
+    table scan and no temporary B-tree for sorting.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        create_battles(PLAYER_TAG, 50)
+        create_battles(OTHER_TAG, 50)
+
+    def assertIndexSearch(self, queryset, index=None):
+        plan = queryset.explain()
+        self.assertIn("SEARCH clashroyale_battlelog USING", plan)
+        self.assertNotIn("SCAN clashroyale_battlelog", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+        if index:
+            self.assertIn(f"INDEX {index} ", plan)
+        return plan
+
+    def test_recent_battles(self):
+        self.assertIndexSearch(BattleLog.objects.filter(player_tag=PLAYER_TAG)[:10])
+
+    def test_battle_page_after_cursor(self):
+        cursor = timezone.now() - timedelta(hours=12)
+        self.assertIndexSearch(
+            BattleLog.objects.filter(player_tag=PLAYER_TAG, timestamp__lt=cursor).order_by("-timestamp")[:25]
+        )
+
+    def test_challenge_evidence(self):
+        # The unordered .exists() of generate_challenge_proofs
+        plan = self.assertIndexSearch(
+            BattleLog.objects.filter(player_tag=PLAYER_TAG, trophy_change__gte=0).order_by()[:1],
+            "battlelog_player_trophy_idx",
+        )
+        self.assertIn("player_tag=? AND trophy_change>?", plan)
+
+
+class LeaderboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        Player.objects.bulk_create(
+            Player(
+                tag=f"#P{i:03d}", name=f"Player {i}", level=14, trophies=5000 + (i * 37) % 400,
+                clan_tag=f"#CLAN{i % 3}" if i % 4 else "", last_synced_at=now,
+            )
+            for i in range(60)
+        )
+
+    def setUp(self):
+        patcher = mock.patch.object(leaderboard, "LEADERBOARD_SNAPSHOT", "")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        leaderboard._leaderboard = None
+        self.addCleanup(setattr, leaderboard, "_leaderboard", None)
+
+    def expected_order(self, **filters):
+        return list(Player.objects.filter(**filters).order_by("-trophies", "tag").values_list("tag", flat=True))
+
+    def test_rank_index_matches_sorted_list(self):
+        rng = random.Random(1)
+        index, expected = leaderboard.RankIndex(), []
+        for _ in range(2000):
+            key = rng.randrange(500)
+            if key in expected and rng.random() < 0.5:
+                index.remove(key)
+                expected.remove(key)
+            elif key not in expected:
+                index.insert(key)
+                bisect.insort(expected, key)
+        self.assertEqual(list(index), expected)
+        self.assertEqual(index.slice(10, 30), expected[10:30])
+        for position, key in enumerate(expected):
+            self.assertEqual(index.index(key), position)
+
+    def test_ranks_match_the_database(self):
+        board = leaderboard.get_leaderboard()
+        expected = self.expected_order()
+        self.assertEqual([row["tag"] for row in board.top(100)], expected)
+        self.assertEqual(board.rank(expected[17]), 18)
+        clan = self.expected_order(clan_tag="#CLAN1")
+        self.assertEqual([row["tag"] for row in board.top(100, clan_tag="#CLAN1")], clan)
+        self.assertEqual(board.rank(clan[4], in_clan=True), 5)
+
+    def test_saved_players_move(self):
+        board = leaderboard.get_leaderboard()
+        player = Player.objects.get(tag="#P005")
+        player.trophies, player.clan_tag = 9000, "#CLAN2"
+        player.save()
+        self.assertEqual(board.rank("#P005"), 1)
+        self.assertEqual(board.top(1, clan_tag="#CLAN2")[0]["tag"], "#P005")
+        player.delete()
+        self.assertNotIn("#P005", board)
+        self.assertEqual([row["tag"] for row in board.top(100)], self.expected_order())
+
+    def test_snapshot_round_trip_applies_later_changes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/leaderboard.json.gz"
+            built = leaderboard.build_leaderboard()
+            leaderboard.save_snapshot(built, path)
+            Player.objects.filter(tag="#P010").update(trophies=9500, last_synced_at=timezone.now())
+            with mock.patch.object(leaderboard, "LEADERBOARD_SNAPSHOT", path):
+                board = leaderboard.load_leaderboard()
+        self.assertEqual(board.reconciled_at, built.reconciled_at)
+        self.assertEqual(board.top(1)[0]["tag"], "#P010")
+        self.assertEqual([row["tag"] for row in board.top(100)], self.expected_order())
+
+    def test_load_rewrites_an_outdated_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/leaderboard.json.gz"
+            leaderboard.save_snapshot(leaderboard.build_leaderboard(), path)
+            written = leaderboard.load_snapshot(path).synced_until
+            Player.objects.filter(tag="#P010").update(trophies=9500, last_synced_at=timezone.now())
+            with mock.patch.object(leaderboard, "LEADERBOARD_SNAPSHOT", path):
+                leaderboard.load_leaderboard()
+            snapshot = leaderboard.load_snapshot(path)
+        self.assertGreater(snapshot.synced_until, written)
+        self.assertEqual(snapshot.top(1)[0], {"rank": 1, "tag": "#P010", "trophies": 9500, "clan_tag": "#CLAN1"})
+
+    def test_refresh_applies_deletions_by_other_processes(self):
+        board = leaderboard.get_leaderboard()
+        # A raw delete sends no signals, like a delete made by another process;
+        # the insert keeps the row count unchanged
+        Player.objects.filter(tag__in=["#P003", "#P004"])._raw_delete(using="default")
+        Player.objects.create(tag="#P900", name="New", level=1, trophies=100)
+        Player.objects.filter(tag="#P005").update(trophies=9000, last_synced_at=timezone.now())
+        with self.assertNumQueries(1):
+            leaderboard.refresh_leaderboard(board)
+        self.assertEqual(board.rank("#P005"), 1)
+        self.assertIn("#P003", board)
+        # The next reconcile is due
+        board.reconciled_at -= timedelta(seconds=leaderboard.LEADERBOARD_RECONCILE_INTERVAL)
+        self.assertGreater(leaderboard.refresh_leaderboard(board), 0)
+        self.assertNotIn("#P003", board)
+        self.assertEqual(board.reconciled_at, board.synced_until)
+        self.assertEqual(len(board), 59)
+        self.assertEqual([row["tag"] for row in board.top(100)], self.expected_order())
+        self.assertEqual(
+            [row["tag"] for row in board.top(100, clan_tag="#CLAN1")], self.expected_order(clan_tag="#CLAN1")
+        )
+
+    def test_warm_and_maintain(self):
+        with mock.patch.object(leaderboard, "load_leaderboard", side_effect=DatabaseError("no such table")):
+            leaderboard.warm_leaderboard()
+        self.assertIsNone(leaderboard._leaderboard)
+        leaderboard.warm_leaderboard()
+        self.assertEqual(len(leaderboard._leaderboard), 60)
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/leaderboard.json.gz"
+            with mock.patch.multiple(leaderboard, LEADERBOARD_SNAPSHOT=path, LEADERBOARD_RECONCILE_INTERVAL=0):
+                Player.objects.filter(tag="#P001")._raw_delete(using="default")
+                leaderboard.maintain_leaderboard()
+            self.assertEqual(leaderboard.load_snapshot(path).rows(), leaderboard._leaderboard.rows())
+        self.assertEqual(len(leaderboard._leaderboard), 59)
+
+    def test_loaded_on_first_use_not_at_server_import(self):
+        for module in ("gaming_platform.wsgi", "gaming_platform.asgi"):
+            with self.subTest(module), self.assertNumQueries(0):
+                importlib.reload(importlib.import_module(module))
+        self.assertIsNone(leaderboard._leaderboard)
+        self.client.get(reverse("api_leaderboard"))
+        self.assertEqual(len(leaderboard._leaderboard), 60)
+
+    def test_player_rank_api(self):
+        expected = self.expected_order()
+        response = self.client.get(reverse("api_player_rank", args=[expected[20].lstrip("#")]) + "?radius=2")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["rank"], 21)
+        self.assertEqual([row["tag"] for row in response.json()["around"]], expected[18:23])
+        self.assertEqual(self.client.get(reverse("api_player_rank", args=["NOPE"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("api_leaderboard") + "?limit=0").status_code, 400)
+
+
+class TrophyHistoryTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        rng = random.Random(2)
+        moment, trophies = self.now - timedelta(days=20), 6000
+        samples = []
+        while moment < self.now:
+            trophies = max(0, trophies + rng.randint(-60, 60))
+            samples.append(TrophySample(player_tag=PLAYER_TAG, trophies=trophies, recorded_at=moment))
+            moment += timedelta(minutes=rng.randint(5, 600))
+        TrophySample.objects.bulk_create(samples)
+
+    def expected_series(self, resolution, start):
+        buckets = {}
+        for sample in TrophySample.objects.filter(player_tag=PLAYER_TAG).order_by("recorded_at"):
+            if sample.recorded_at < start:
+                continue
+            bucket = buckets.setdefault(trophy_history.bucket_start(sample.recorded_at, resolution), [])
+            bucket.append(sample.trophies)
+        return [
+            {"time": time, "min": min(values), "max": max(values), "last": values[-1], "samples": len(values)}
+            for time, values in buckets.items()
+        ]
+
+    def series(self, resolution, days):
+        return trophy_history.trophy_history(PLAYER_TAG, self.now - timedelta(days=days), self.now, resolution)
+
+    def test_rollups_match_raw_samples(self):
+        _, daily = trophy_history.rollup_trophy_history()
+        self.assertGreater(daily, 19)
+        rollups = list(TrophyRollup.objects.order_by("id").values())
+        trophy_history.rollup_trophy_history()
+        self.assertEqual(list(TrophyRollup.objects.order_by("id").values()), rollups)
+        start = trophy_history.bucket_start(self.now - timedelta(days=30), "day")
+        self.assertEqual(self.series("day", 30), ("day", self.expected_series("day", start)))
+        start = trophy_history.bucket_start(self.now - timedelta(days=7), "hour")
+        self.assertEqual(self.series("hour", 7), ("hour", self.expected_series("hour", start)))
+        self.assertEqual(self.series("auto", 90)[0], "day")
+        self.assertEqual(self.series("auto", 1)[0], "raw")
+
+    def test_series_is_current_between_rollups(self):
+        trophy_history.rollup_trophy_history()
+        TrophySample.objects.create(player_tag=PLAYER_TAG, trophies=9999, recorded_at=self.now)
+        self.now += timedelta(seconds=1)
+        _, points = self.series("day", 30)
+        self.assertEqual((points[-1]["max"], points[-1]["last"]), (9999, 9999))
+
+    def test_retention_keeps_rolled_up_history(self):
+        trophy_history.rollup_trophy_history()
+        before = self.series("day", 30)
+        with mock.patch.object(trophy_history, "TROPHY_SAMPLE_RETENTION", 3):
+            deleted = trophy_history.apply_trophy_retention()
+        self.assertGreater(deleted["samples"], 0)
+        self.assertFalse(TrophySample.objects.filter(recorded_at__lt=self.now - timedelta(days=3)).exists())
+        self.assertEqual(self.series("day", 30), before)
+
+    def test_sync_records_only_changed_trophies(self):
+        TrophySample.objects.all().delete()
+        payload = {"tag": OTHER_TAG, "name": "Other", "expLevel": 13, "trophies": 7000}
+        store_player_bundle(payload, None, None)
+        store_player_bundle(payload, None, None)
+        store_player_bundle({**payload, "trophies": 7030}, None, None)
+        self.assertEqual(
+            list(TrophySample.objects.order_by("recorded_at").values_list("trophies", flat=True)), [7000, 7030]
+        )
+
+    def test_api(self):
+        Player.objects.create(tag=PLAYER_TAG, name="Tester", level=14, trophies=6000)
+        url = reverse("api_player_trophies", args=[PLAYER_TAG.lstrip("#")])
+        response = self.client.get(url + "?days=30")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["resolution"], "day")
+        self.assertEqual(len(response.json()["points"]), len(self.series("day", 30)[1]))
+        self.assertEqual(self.client.get(url + "?resolution=minute").status_code, 400)
+
+
+class BattleAnalyticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now() - timedelta(days=1)
+        # Oldest first: W W L L L W (crowns 1, 3, 0, 0, 0, 2)
+        BattleLog.objects.bulk_create(
+            BattleLog(
+                battle_id=f"{PLAYER_TAG}|{i}", type="PvP", timestamp=start + timedelta(minutes=i),
+                player_tag=PLAYER_TAG, player_name="Tester", opponent_tag=f"#OPP{i}",
+                arena="Arena A" if i < 4 else "Arena B", game_mode="Ladder",
+                crowns=crowns, trophy_change=30 if crowns else -30,
+            )
+            for i, crowns in enumerate([1, 3, 0, 0, 0, 2])
+        )
+        rng = random.Random(3)
+        BattleLog.objects.bulk_create(
+            BattleLog(
+                battle_id=f"#R{i % 7}|{i}", type="PvP", timestamp=start + timedelta(seconds=rng.randrange(80000)),
+                player_tag=f"#R{i % 7}", player_name="Random", opponent_tag=f"#OPP{i}",
+                arena=f"Arena {rng.choice('ABC')}", game_mode=rng.choice(["Ladder", "Challenge"]),
+                crowns=rng.randint(0, 3), trophy_change=rng.randint(-40, 40),
+            )
+            for i in range(300)
+        )
+
+    def test_player_summary(self):
+        report = analytics.player_reports(analytics.load_battles([PLAYER_TAG]), window=3)
+        self.assertEqual(
+            report,
+            [
+                {
+                    "player_tag": PLAYER_TAG, "battles": 6, "wins": 3, "losses": 3, "win_rate": 0.5,
+                    "crowns": {0: 3, 1: 1, 2: 1, 3: 1}, "trophy_delta": 0, "trophy_trend": -10.0,
+                    "longest_win_streak": 2, "longest_loss_streak": 3, "current_streak": 1,
+                }
+            ],
+        )
+
+    def test_breakdowns(self):
+        frame = analytics.load_battles([PLAYER_TAG])
+        self.assertEqual(
+            [(row["arena"], row["battles"], row["wins"]) for row in analytics.breakdown(frame, "arena")],
+            [("Arena A", 4, 2), ("Arena B", 2, 1)],
+        )
+        rows = analytics.breakdown(analytics.load_battles(), "game_mode", per_player=True)
+        self.assertEqual(sum(row["battles"] for row in rows), BattleLog.objects.count())
+        self.assertEqual(rows[0]["player_tag"], PLAYER_TAG)
+
+    def test_matches_per_object_computation(self):
+        from .management.commands.battle_analytics import per_object_reports
+
+        for window in (1, 4, 50):
+            self.assertEqual(
+                analytics.player_reports(analytics.load_battles(), window), per_object_reports(None, window)
+            )
+
+
+class BattleExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_battles(PLAYER_TAG, 30)
+        # Same timestamps as PLAYER_TAG's battles, so the cursor must break ties
+        create_battles(OTHER_TAG, 20)
+        BattleLog.objects.filter(player_tag=OTHER_TAG, crowns=0).update(game_mode="Challenge")
+
+    def export(self, **params):
+        response = self.client.get(reverse("battle_export"), params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
+
+    def ndjson(self, **params):
+        return [json.loads(line) for line in self.export(**params).splitlines()]
+
+    def test_ndjson_in_keyset_order(self):
+        rows = self.ndjson()
+        self.assertEqual(len(rows), 50)
+        keys = [(row["timestamp"], int(row["cursor"].split("-")[1])) for row in rows]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(rows[0]["princess_tower_hp"], None)
+
+    def test_filters(self):
+        self.assertEqual({row["player_tag"] for row in self.ndjson(player=OTHER_TAG)}, {OTHER_TAG})
+        self.assertEqual(
+            len(self.ndjson(game_mode="Challenge")),
+            BattleLog.objects.filter(game_mode="Challenge").count(),
+        )
+        middle = BattleLog.objects.filter(player_tag=PLAYER_TAG).order_by("timestamp")[10].timestamp
+        self.assertEqual(len(self.ndjson(player=PLAYER_TAG, since=middle.isoformat())), 20)
+        self.assertEqual(len(self.ndjson(player=PLAYER_TAG, until=middle.isoformat())), 10)
+
+    def test_resume_after_cursor(self):
+        rows = self.ndjson()
+        for position in (0, 24, 25, 48):
+            self.assertEqual(self.ndjson(after=rows[position]["cursor"]), rows[position + 1:])
+
+    def test_gzipped_csv(self):
+        response = self.client.get(reverse("battle_export"), {"format": "csv", "gzip": "1"})
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        content = gzip.decompress(b"".join(response.streaming_content)).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 50)
+        self.assertEqual([row["cursor"] for row in rows], [row["cursor"] for row in self.ndjson()])
+
+    def test_invalid_parameters(self):
+        for params in ({"format": "xml"}, {"after": "nope"}, {"since": "yesterday"}):
+            self.assertEqual(self.client.get(reverse("battle_export"), params).status_code, 400)
+
+    def test_command_resumes_interrupted_file(self):
+        expected = self.export(format="csv")
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/battles.csv"
+            for cut in (len(expected) // 3, 10):
+                with open(path, "wb") as f:
+                    f.write(expected[:cut])
+                call_command("export_battles", output=path, resume=True, format="csv", stderr=io.StringIO())
+                with open(path, "rb") as f:
+                    self.assertEqual(f.read(), expected)
+
+
+class BattleArchiveTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(archive, "ARCHIVE_DIR", directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.directory = directory.name
+
+        self.now = timezone.now()
+        old = self.now - timedelta(days=400)
+        rng = random.Random(5)
+        # A battle every ~2 days for a year, then the last 30 days; OTHER_TAG only long ago
+        BattleLog.objects.bulk_create(
+            BattleLog(
+                battle_id=f"{player_tag}|{i}|#OPP{i}", type="PvP", player_tag=player_tag, player_name="Tester",
+                timestamp=start + timedelta(days=i * step, minutes=rng.randrange(600)),
+                opponent_tag=f"#OPP{i}", arena=f"Arena {rng.choice('ABC')}",
+                game_mode=rng.choice(["Ladder", "Challenge"]),
+                crowns=rng.randint(0, 3), trophy_change=rng.randint(-40, 40), king_tower_hp=rng.randrange(5000),
+                princess_tower_hp=rng.choice([None, [1200, 0], [2100]]),
+            )
+            for player_tag, start, step, count in (
+                (PLAYER_TAG, old, 2, 180),
+                (PLAYER_TAG, self.now - timedelta(days=30), 0.1, 100),
+                (OTHER_TAG, old, 1, 60),
+            )
+            for i in range(1000 * (start != old), 1000 * (start != old) + count)
+        )
+        for player_tag in (PLAYER_TAG, OTHER_TAG):
+            rebuild_player_stats(player_tag)
+            rebuild_battle_commitment(player_tag)
+
+    def test_moves_whole_old_months(self):
+        cutoff = archive.archive_cutoff(180, self.now)
+        expected = BattleLog.objects.filter(timestamp__lt=cutoff).count()
+        moved = archive.archive_battles(180, self.now)
+        self.assertEqual(sum(moved.values()), expected)
+        self.assertFalse(BattleLog.objects.filter(timestamp__lt=cutoff).exists())
+        self.assertEqual(sum(BattleArchive.objects.values_list("battle_count", flat=True)), expected)
+        self.assertEqual(archive.archive_battles(180, self.now), {})
+
+    def test_reader_matches_orm_aggregates(self):
+        since, until = self.now - timedelta(days=350), self.now - timedelta(days=250)
+        BattleLog.objects.filter(timestamp__gte=self.now - timedelta(days=60)).delete()
+        expected = {
+            "player": aggregate_battle_stats(BattleLog.objects.filter(player_tag=PLAYER_TAG)),
+            "period": aggregate_battle_stats(
+                BattleLog.objects.filter(player_tag=PLAYER_TAG, timestamp__gte=since, timestamp__lt=until)
+            ),
+            "everyone": aggregate_battle_stats(BattleLog.objects.filter(timestamp__gte=since, timestamp__lt=until)),
+        }
+        archive.archive_battles(1, self.now)
+        self.assertFalse(BattleLog.objects.exists())
+        actual = {
+            "player": archive.archived_battle_stats(PLAYER_TAG),
+            "period": archive.archived_battle_stats(PLAYER_TAG, since, until),
+            "everyone": archive.archived_battle_stats(since=since, until=until),
+        }
+        for key, totals in actual.items():
+            self.assertEqual(totals.pop("win_rate"), round(totals["wins"] / totals["battle_count"], 4))
+            self.assertEqual(totals, expected[key], key)
+
+    def test_stats_and_commitments_survive_archiving(self):
+        stats = get_player_stats(PLAYER_TAG)
+        root = BattleCommitment.objects.get(player_tag=PLAYER_TAG).root
+        archived_id = BattleLog.objects.filter(player_tag=PLAYER_TAG).order_by("timestamp")[5].battle_id
+        archive.archive_battles(180, self.now)
+
+        self.assertFalse(BattleLog.objects.filter(battle_id=archived_id).exists())
+        rebuild_player_stats(PLAYER_TAG)
+        self.assertEqual(get_player_stats(PLAYER_TAG), stats)
+        self.assertEqual(rebuild_battle_commitment(PLAYER_TAG).root, root)
+        proof = battle_inclusion_proof(PLAYER_TAG, archived_id)
+        self.assertEqual(proof["root"], root)
+        self.assertTrue(verify_inclusion(root, proof["leaf"], proof["proof"]))
+
+    def test_rerun_merges_late_battles(self):
+        archive.archive_battles(180, self.now)
+        month = BattleArchive.objects.first()
+        first = archive.archived_months()[0].battles(slice(0, 1))[0]
+        late = {**first, "battle_id": "#LATE|1|#OPP", "player_tag": "#LATE"}
+        BattleLog.objects.create(**late)
+
+        archive.archive_battles(180, self.now)
+        merged = BattleArchive.objects.get(month=month.month)
+        self.assertEqual(merged.battle_count, month.battle_count + 1)
+        self.assertNotEqual(merged.directory, month.directory)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, month.directory)))
+        self.assertEqual(list(archive.archived_battles("#LATE")), [late])
+
+    def test_archiving_invalidates_battle_pages(self):
+        Player.objects.create(tag=PLAYER_TAG, name="Tester", level=14, trophies=6000)
+        PlayerSyncState.objects.create(
+            player_tag=PLAYER_TAG, last_battle_time=self.now - timedelta(days=1), battle_log_hash="x"
+        )
+        url = reverse("api_player_battles", args=[PLAYER_TAG.lstrip("#")])
+        response = self.client.get(url, {"limit": 100})
+        self.assertNotIn("X-Archived-Until", response)
+        etag, modified = response["ETag"], response["Last-Modified"]
+        self.assertEqual(self.client.get(url, {"limit": 100}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        archive.archive_battles(180, self.now)
+        self.assertGreater(Player.objects.get(tag=PLAYER_TAG).data_version, 0)
+        for headers in ({"HTTP_IF_NONE_MATCH": etag}, {"HTTP_IF_MODIFIED_SINCE": modified}):
+            response = self.client.get(url, {"limit": 100}, **headers)
+            self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response["X-Archived-Until"], archive.archived_until().isoformat())
+
+    def test_analytics_include_archived_battles(self):
+        expected = analytics.battle_report(analytics.load_battles(), window=5)
+        expected_player = analytics.player_reports(analytics.load_battles([OTHER_TAG]))
+        archive.archive_battles(180, self.now)
+        self.assertEqual(analytics.battle_report(analytics.load_battles(), window=5), expected)
+        self.assertEqual(analytics.player_reports(analytics.load_battles([OTHER_TAG])), expected_player)
+        self.assertLess(len(analytics.load_battles(archived=False)), expected["battles"])
+
+    def test_export_reports_archived_range(self):
+        archive.archive_battles(180, self.now)
+        until = archive.archived_until()
+        response = self.client.get(reverse("battle_export"))
+        self.assertEqual(response["X-Archived-Until"], until.isoformat())
+        response = self.client.get(reverse("battle_export"), {"since": until.isoformat()})
+        self.assertNotIn("X-Archived-Until", response)
+        err = io.StringIO()
+        call_command("export_battles", stdout=io.StringIO(), stderr=err)
+        self.assertIn(f"Battles before {until.isoformat()} may be archived", err.getvalue())
+
+    def test_command_dry_run(self):
+        out = io.StringIO()
+        call_command("archive_battles", older_than_days=180, dry_run=True, stdout=out)
+        self.assertIn("would be archived", out.getvalue())
+        self.assertFalse(BattleArchive.objects.exists())
+
+
+class TokenBucketLimiterTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f"{directory.name}/ratelimit.sqlite3"
+
+    def limiter(self, tokens=("a", "b"), rate=1.0, burst=2):
+        return ratelimit.TokenBucketLimiter(self.path, tokens, rate, burst)
+
+    def test_rotates_tokens_and_reports_wait(self):
+        limiter = self.limiter()
+        self.assertEqual(sorted(limiter.acquire() for _ in range(4)), ["a", "a", "b", "b"])
+        token, wait = limiter.try_acquire()
+        self.assertIsNone(token)
+        self.assertGreater(wait, 0)
+        with self.assertRaises(ratelimit.RateLimitExceeded) as raised:
+            limiter.acquire(block=False)
+        self.assertGreater(raised.exception.retry_after, 0)
+
+    def test_buckets_are_shared_through_the_file(self):
+        self.limiter(tokens=("a",)).acquire()
+        self.limiter(tokens=("a",)).acquire()
+        self.assertIsNone(self.limiter(tokens=("a",)).try_acquire()[0])
+
+    def test_penalized_token_is_skipped(self):
+        limiter = self.limiter()
+        limiter.penalize("a", 60)
+        self.assertEqual([limiter.acquire(), limiter.acquire()], ["b", "b"])
+        self.assertIsNone(limiter.try_acquire()[0])
+
+    def test_async_path_runs_off_the_event_loop(self):
+        limiter = self.limiter()
+        threads = []
+        try_acquire, penalize = limiter.try_acquire, limiter.penalize
+
+        def record(method):
+            def wrapper(*args):
+                threads.append(threading.get_ident())
+                return method(*args)
+
+            return wrapper
+
+        async def run():
+            threads.append(threading.get_ident())
+            token = await limiter.aacquire()
+            await limiter.apenalize(token, 60)
+            return token
+
+        with mock.patch.object(limiter, "try_acquire", record(try_acquire)), \
+                mock.patch.object(limiter, "penalize", record(penalize)):
+            token = asyncio.run(run())
+        loop_thread, *worker_threads = threads
+        self.assertEqual(len(worker_threads), 2)
+        self.assertNotIn(loop_thread, worker_threads)
+        self.assertEqual(limiter.acquire(), "b" if token == "a" else "a")
+
+
+def stub_player_bundle(player_tag):
+    """
+    ``fetch_player_bundle`` answered from the recorded benchmark payloads.
+    """
+    from benchmarks.stub import StubAPI
+
+    stub = StubAPI()
+    encoded_tag = urllib.parse.quote(player_tag)
+    player_data = json.loads(stub.payload(f"/players/{encoded_tag}"))
+    battle_log_data = json.loads(stub.payload(f"/players/{encoded_tag}/battlelog"))
+    return player_data, None, battle_log_data, None
+
+
+class FetchCommandTests(TransactionTestCase):
+    def setUp(self):
+        Player.objects.bulk_create(
+            Player(tag=f"#P{i:07d}", name="Tester", level=14, trophies=5000) for i in range(25)
+        )
+        for target, replacement in (
+            ("fetch_player_bundle", stub_player_bundle),
+            ("sync_all_challenges", mock.Mock(side_effect=ValueError("offline"))),
+        ):
+            patcher = mock.patch(f"clashroyale.management.commands.fetch_clashroyale_data.{target}", replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_from_db_with_several_workers(self):
+        from .management.commands.fetch_clashroyale_data import Command
+
+        out = io.StringIO()
+        # Several batches, each read while earlier players are being written
+        with tempfile.TemporaryDirectory() as directory, mock.patch.object(Command, "DB_BATCH_SIZE", 7):
+            checkpoint = f"{directory}/checkpoint"
+            call_command("fetch_clashroyale_data", from_db=True, workers=4, checkpoint=checkpoint, stdout=out)
+            with open(checkpoint) as f:
+                done = sorted(f.read().split())
+        self.assertIn("Processed 25 players (0 failed, 0 skipped)", out.getvalue())
+        self.assertEqual(done, list(Player.objects.order_by("tag").values_list("tag", flat=True)))
+        self.assertEqual(set(BattleLog.objects.values_list("player_tag", flat=True).distinct()), set(done))
+
+    def test_checkpoint_skips_processed_tags(self):
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = f"{directory}/checkpoint"
+            with open(checkpoint, "w") as f:
+                f.write("#P0000001\n#P0000002\n")
+            out = io.StringIO()
+            call_command("fetch_clashroyale_data", from_db=True, workers=2, checkpoint=checkpoint, stdout=out)
+        self.assertIn("Processed 23 players (0 failed, 2 skipped)", out.getvalue())
+
+
+    def test_positional_tag_is_normalized_like_file_tags(self):
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = f"{directory}/checkpoint"
+            call_command("fetch_clashroyale_data", " #p0000003", checkpoint=checkpoint, stdout=io.StringIO())
+            with open(checkpoint) as f:
+                self.assertEqual(f.read(), "#P0000003\n")
+            out = io.StringIO()
+            call_command("fetch_clashroyale_data", "#p0000003", checkpoint=checkpoint, stdout=out)
+        self.assertIn("Processed 0 players (0 failed, 1 skipped)", out.getvalue())
+
+class ProofCacheTests(TestCase):
+    def setUp(self):
+        self.player = Player.objects.create(tag=PLAYER_TAG, name="Tester", level=14, trophies=6000)
+        create_battles(PLAYER_TAG, 3)
+        self.use_cache(proof_cache.ProofCache())
+
+    def use_cache(self, cache):
+        patcher = mock.patch.object(proof_cache, "_proof_cache", cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = cache
+
+    def test_memoised_per_data_version(self):
+        first = proof_cache.trophy_proof(self.player, 5000)
+        with mock.patch.object(TrophyVerification, "generate_trophy_proof") as generate:
+            self.assertEqual(proof_cache.trophy_proof(self.player, 5000), first)
+            generate.assert_not_called()
+        Player.objects.filter(pk=self.player.pk).update(trophies=4000, data_version=1)
+        self.player.refresh_from_db()
+        self.assertFalse(proof_cache.trophy_proof(self.player, 5000)["proof"])
+        self.assertEqual(self.cache.snapshot()["misses"], 2)
+
+    def test_challenge_synced_after_first_view(self):
+        sync_challenges(challenges_payload(1))
+        proofs = proof_cache.challenge_proofs(self.player, ["70000000", "70000001"])
+        self.assertTrue(proofs["70000000"]["proof"])
+        self.assertIn("not found", proofs["70000001"]["message"])
+
+        sync_challenges(challenges_payload(2))
+        proofs = proof_cache.challenge_proofs(self.player, ["70000000", "70000001"])
+        self.assertEqual(proofs["70000001"]["message"], f"Player {PLAYER_TAG} has completed the challenge Challenge 1.")
+
+    def test_renamed_challenge(self):
+        sync_challenges(challenges_payload(1))
+        self.assertIn("Challenge 0", proof_cache.challenge_proofs(self.player, ["70000000"])["70000000"]["message"])
+        payload = challenges_payload(1)
+        payload[0]["challenges"][0]["name"] = "Renamed"
+        sync_challenges(payload)
+        self.assertIn("Renamed", proof_cache.challenge_proofs(self.player, ["70000000"])["70000000"]["message"])
+
+    def test_persisted_proofs_follow_the_catalogue(self):
+        self.use_cache(proof_cache.ProofCache(persist=True))
+        sync_challenges(challenges_payload(1))
+        proof_cache.challenge_proofs(self.player, ["70000000", "70000001"])
+        self.assertEqual(list(ProofRecord.objects.values_list("param", flat=True)), ["70000000"])
+
+        # Another process finds the stored proof
+        self.use_cache(proof_cache.ProofCache(persist=True))
+        proof_cache.challenge_proofs(self.player, ["70000000"])
+        self.assertEqual(self.cache.snapshot()["persisted_hits"], 1)
+
+        payload = challenges_payload(2)
+        payload[0]["challenges"][0]["name"] = "Renamed"
+        sync_challenges(payload)
+        self.use_cache(proof_cache.ProofCache(persist=True))
+        proofs = proof_cache.challenge_proofs(self.player, ["70000000", "70000001"])
+        self.assertIn("Renamed", proofs["70000000"]["message"])
+        self.assertTrue(proofs["70000001"]["proof"])
+        self.assertEqual(self.cache.snapshot()["persisted_hits"], 0)
+
+
+class MerkleTests(TestCase):
+    def test_frontier_and_peaks_match_the_tree(self):
+        tree, frontier = merkle.MerkleTree(), merkle.MerkleFrontier()
+        self.assertEqual(tree.root, frontier.root)
+        for i in range(40):
+            tree.append(f"leaf {i}")
+            frontier.append(f"leaf {i}")
+            self.assertEqual(frontier.root, tree.root)
+            self.assertEqual(merkle.MerkleTree([f"leaf {j}" for j in range(i + 1)]).root, tree.root)
+            resumed = merkle.MerkleFrontier(len(tree), [peak.hex() for peak in tree.peaks()])
+            resumed.append("next")
+            self.assertEqual(resumed.root, merkle.MerkleTree([*(f"leaf {j}" for j in range(i + 1)), "next"]).root)
+
+    def test_proofs(self):
+        for size in (1, 2, 7, 16, 33):
+            leaves = [f"leaf {i}" for i in range(size)]
+            tree = merkle.MerkleTree(leaves)
+            for index, leaf in enumerate(leaves):
+                proof = tree.proof(index)
+                self.assertTrue(verify_inclusion(tree.root, leaf, proof))
+                self.assertFalse(verify_inclusion(tree.root, leaf + "!", proof))
+                if proof:
+                    self.assertFalse(verify_inclusion(tree.root, leaf, proof[:-1]))
+                    flipped = [["R" if side == "L" else "L", sibling] for side, sibling in proof]
+                    self.assertFalse(verify_inclusion(tree.root, leaf, flipped))
+            self.assertFalse(verify_inclusion(tree.root, leaves[0], [["L", "zz"]]))
+            with self.assertRaises(IndexError):
+                tree.proof(size)
+
+    def test_many_agrees_with_single_verification(self):
+        rng = random.Random(4)
+        leaves = [f"leaf {i}" for i in range(37)]
+        tree = merkle.MerkleTree(leaves)
+        proofs = [tree.proof(index) for index in range(len(leaves))]
+        junk = ["R", hashlib.sha256(b"junk").hexdigest()]
+        items = []
+        for _ in range(400):
+            index = rng.randrange(len(leaves))
+            leaf, proof = leaves[index], proofs[index]
+            items.append(
+                rng.choice(
+                    [
+                        (leaf, proof),
+                        (leaf, []),
+                        (leaf, proof + [junk]),
+                        (leaf, proof[:-1]),
+                        (leaf, proofs[(index + 1) % len(leaves)]),
+                        (leaf, [[side.lower(), sibling] for side, sibling in proof]),
+                        (leaf, [[side, sibling.upper()] for side, sibling in proof]),
+                        ("other", proof),
+                        (leaf, [["L"]]),
+                    ]
+                )
+            )
+        self.assertEqual(
+            merkle.verify_inclusion_many(tree.root, items),
+            [verify_inclusion(tree.root, leaf, proof) for leaf, proof in items],
+        )
+        self.assertEqual(merkle.verify_inclusion_many(tree.root, [("leaf 0", proofs[0]), ("leaf 0", [])]), [True, False])
+        self.assertEqual(merkle.verify_inclusion_many(tree.root.upper(), [("leaf 0", proofs[0])]), [False])
+
+    def test_battle_commitment_advances_with_ingestion(self):
+        create_battles(PLAYER_TAG, 13)
+        new_battles = list(BattleLog.objects.filter(player_tag=PLAYER_TAG).order_by("timestamp")[9:])
+        BattleLog.objects.filter(pk__in=[battle.pk for battle in new_battles]).delete()
+        commitment = rebuild_battle_commitment(PLAYER_TAG)
+        BattleLog.objects.bulk_create(new_battles)
+        advanced = merkle.append_battles_to_commitment(PLAYER_TAG, new_battles)
+        self.assertEqual(advanced.leaf_count, 13)
+        self.assertEqual(advanced.root, rebuild_battle_commitment(PLAYER_TAG).root)
+        self.assertNotEqual(advanced.root, commitment.root)
+        proof = battle_inclusion_proof(PLAYER_TAG, new_battles[2].battle_id)
+        self.assertTrue(verify_inclusion(advanced.root, proof["leaf"], proof["proof"]))
+        self.assertIsNone(battle_inclusion_proof(PLAYER_TAG, "#NOPE"))
+
+    def test_bulk_lines_batch_merkle_items(self):
+        tree = merkle.MerkleTree(["a", "b", "c"])
+        lines = [
+            json.dumps({"id": 1, "type": "merkle", "root": tree.root, "leaf": "a", "proof": tree.proof(0)}),
+            json.dumps({"id": 2, "type": "merkle", "root": tree.root, "leaf": "a", "proof": []}),
+            json.dumps({"type": "merkle", "root": tree.root, "leaf": "c", "proof": tree.proof(2)}),
+            json.dumps({"type": "merkle", "root": tree.root, "leaf": "c"}),
+            json.dumps({"type": "trophy", "commitment": TrophyVerification.commit_trophy_count(10), "trophies": 10}),
+        ]
+        self.assertEqual(
+            bulk_verify.verify_lines(lines),
+            [
+                {"id": 1, "type": "merkle", "valid": True},
+                {"id": 2, "type": "merkle", "valid": False},
+                {"type": "merkle", "valid": True},
+                {"type": "merkle", "valid": False, "error": "Missing field: 'proof'"},
+                {"type": "trophy", "valid": True},
+            ],
+        )
+        self.assertEqual(bulk_verify.verify_lines(lines), [bulk_verify.verify_line(line) for line in lines])
+
+
+class BulkVerifyTests(TestCase):
+    def setUp(self):
+        trophy = {"type": "trophy", "commitment": TrophyVerification.commit_trophy_count(8000), "trophies": 8000}
+        self.lines = [
+            json.dumps({"id": 1, **trophy}).encode(),
+            b"",
+            json.dumps({"id": 2, **trophy, "trophies": 7999}).encode(),
+            b"\xff\xfe",
+            b"{not json",
+            json.dumps({"id": 3, "type": "trophy"}).encode(),
+            json.dumps({"id": 4, "type": "unknown"}).encode(),
+        ]
+        self.expected = [
+            {"id": 1, "type": "trophy", "valid": True},
+            {"id": 2, "type": "trophy", "valid": False},
+            {"valid": False, "error": "Invalid UTF-8"},
+            {"valid": False, "error": "Invalid JSON"},
+            {"id": 3, "type": "trophy", "valid": False, "error": "Missing field: 'commitment'"},
+            {"id": 4, "type": "unknown", "valid": False, "error": "Unknown proof type: unknown"},
+        ]
+
+    def test_stream_in_input_order_with_cache(self):
+        verifier = bulk_verify.BulkVerifier(workers=1, chunk_size=2)
+        stats = {}
+        self.assertEqual(list(verifier.verify_stream(self.lines, stats)), self.expected)
+        self.assertEqual((stats["count"], stats["valid"], stats["invalid"], stats["cached"]), (6, 1, 5, 0))
+        self.assertEqual(list(verifier.verify_stream(self.lines * 2, stats)), self.expected * 2)
+        # Only well-formed items are remembered
+        self.assertEqual(stats["cached"], 4)
+
+    def test_cache_ignores_id_and_echoes_the_current_one(self):
+        verifier = bulk_verify.BulkVerifier(workers=1)
+        item = {"type": "trophy", "commitment": TrophyVerification.commit_trophy_count(8000), "trophies": 8000}
+        list(verifier.verify_stream([json.dumps({"id": "a", **item})]))
+        stats = {}
+        # Same item under another id, with its keys in another order
+        line = json.dumps({**dict(reversed(item.items())), "id": "b"}, indent=1).replace("\n", "")
+        self.assertEqual(list(verifier.verify_stream([line], stats)), [{"id": "b", "type": "trophy", "valid": True}])
+        self.assertEqual(stats["cached"], 1)
+
+    def test_undecodable_line_does_not_end_the_stream(self):
+        verifier = bulk_verify.BulkVerifier(workers=1)
+        results = list(verifier.verify_stream([b'{"type":"trophy"}', b"\xff\xfe", b"{}"]))
+        self.assertEqual(results[1], {"valid": False, "error": "Invalid UTF-8"})
+        self.assertEqual(len(results), 3)
+
+    def test_endpoint_streams_results_and_summary(self):
+        with mock.patch("clashroyale.views.get_bulk_verifier", return_value=bulk_verify.BulkVerifier(workers=1)):
+            response = self.client.post(
+                reverse("bulk_verify"), b"\n".join(self.lines), content_type="application/x-ndjson"
+            )
+        lines = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(lines[:-1], self.expected)
+        self.assertEqual(lines[-1]["summary"]["count"], 6)
+        self.assertEqual(lines[-1]["summary"]["valid"], 1)
+
+    def test_command_with_worker_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/proofs.jsonl"
+            with open(path, "wb") as f:
+                f.write(b"\n".join(self.lines * 3))
+            out, err = io.StringIO(), io.StringIO()
+            call_command("verify_proofs", path, workers=2, chunk_size=4, stdout=out, stderr=err)
+        self.assertEqual([json.loads(line) for line in out.getvalue().splitlines()], self.expected * 3)
+        self.assertIn("Verified 18 proofs (3 valid, 15 invalid", err.getvalue())
+
+
+class ClashRoyaleClientTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(api_client, "get_rate_limiter", return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sleeps = []
+        patcher = mock.patch.object(api_client.time, "sleep", self.sleeps.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def client_with(self, *responses, max_retries=3):
+        client = api_client.ClashRoyaleClient(base_url="https://api.test", headers={}, max_retries=max_retries)
+        client._session = mock.Mock()
+        client._session.get.side_effect = responses
+        return client
+
+    def test_retries_honour_retry_after(self):
+        client = self.client_with(
+            mock.Mock(status_code=429, headers={"Retry-After": "4"}),
+            mock.Mock(status_code=503, headers={}),
+            mock.Mock(status_code=200, headers={}),
+        )
+        self.assertEqual(client.get("/cards").status_code, 200)
+        self.assertEqual(client.requests_sent, 3)
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertGreaterEqual(self.sleeps[0], 4)
+
+    def test_gives_up_after_max_retries(self):
+        client = self.client_with(*[mock.Mock(status_code=500, headers={})] * 3, max_retries=2)
+        self.assertEqual(client.get("/cards").status_code, 500)
+        client = self.client_with(*[requests.exceptions.ConnectionError("down")] * 3, max_retries=2)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            client.get("/cards")
+        self.assertEqual(client.requests_sent, 3)
+
+    def test_rate_limited_token_is_penalized(self):
+        with tempfile.TemporaryDirectory() as directory:
+            limiter = ratelimit.TokenBucketLimiter(f"{directory}/ratelimit.sqlite3", ("a", "b"), 10.0, 10)
+            client = self.client_with(
+                mock.Mock(status_code=429, headers={"Retry-After": "60"}), mock.Mock(status_code=200, headers={})
+            )
+            with mock.patch.object(api_client, "get_rate_limiter", return_value=limiter):
+                client.get("/cards")
+                tokens = [call.kwargs["headers"]["Authorization"] for call in client._session.get.call_args_list]
+                self.assertNotEqual(tokens[0], tokens[1])
+                self.assertEqual({limiter.acquire() for _ in range(3)}, {tokens[1].removeprefix("Bearer ")})
+
+    def test_parse_retry_after(self):
+        self.assertEqual(api_client.parse_retry_after("2.5"), 2.5)
+        self.assertIsNone(api_client.parse_retry_after("soon"))
+        self.assertIsNone(api_client.parse_retry_after(None))
+        later = timezone.now() + timedelta(seconds=120)
+        self.assertAlmostEqual(
+            api_client.parse_retry_after(later.strftime("%a, %d %b %Y %H:%M:%S GMT")), 120, delta=2
+        )
+
+    def test_connections_are_kept_alive(self):
+        from benchmarks.stub import StubAPI
+
+        with StubAPI() as stub:
+            client = api_client.ClashRoyaleClient(base_url=stub.url, headers={})
+            responses = [client.get("/challenges") for _ in range(3)]
+            revalidated = client.get("/challenges", headers={"If-None-Match": responses[0].headers["ETag"]})
+            pools = client.session.get_adapter(stub.url).poolmanager.pools
+            pools = [pools[key] for key in pools.keys()]
+            client.close()
+        self.assertEqual([response.status_code for response in responses], [200] * 3)
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual([pool.num_connections for pool in pools], [1])
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, data=None, etag=None):
+        self.status_code = status_code
+        self.data = data
+        self.headers = {"ETag": etag} if etag else {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} error")
+
+    def json(self):
+        return self.data
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.cache = ResponseCache(alias="default", ttls=[(r"^/challenges", 60)], stale_ttl=30, retention=600)
+        self.responses = []
+        self.sent = []
+
+    def send(self, headers):
+        self.sent.append(headers)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def asend(self, headers):
+        return self.send(headers)
+
+    def age(self, seconds):
+        key = self.cache.key("/challenges")
+        entry = caches["default"].get(key)
+        entry["fresh_until"] -= seconds
+        caches["default"].set(key, entry)
+
+    def test_fresh_entry_is_served_from_cache(self):
+        self.responses = [FakeResponse(data=[1], etag='"v1"')]
+        self.assertEqual(self.cache.fetch("/challenges", None, self.send), [1])
+        self.assertEqual(self.cache.fetch("/challenges", None, self.send), [1])
+        self.assertEqual(self.sent, [None])
+        stats = self.cache.stats.snapshot()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_expired_entry_is_revalidated_with_etag(self):
+        self.responses = [FakeResponse(data=[1], etag='"v1"'), FakeResponse(304)]
+        self.cache.fetch("/challenges", None, self.send)
+        self.age(100)
+        self.assertEqual(self.cache.fetch("/challenges", None, self.send), [1])
+        self.assertEqual(self.sent[1], {"If-None-Match": '"v1"'})
+        self.assertEqual(self.cache.stats.snapshot()["revalidated"], 1)
+        # The 304 made the entry fresh again
+        self.assertEqual(self.cache.fetch("/challenges", None, self.send), [1])
+        self.assertEqual(len(self.sent), 2)
+
+    def test_upstream_error_serves_cached_entry(self):
+        self.responses = [FakeResponse(data=[1]), requests.exceptions.ConnectionError("down"), FakeResponse(500)]
+        self.cache.fetch("/challenges", None, self.send)
+        self.age(100)
+        self.assertEqual(self.cache.fetch("/challenges", None, self.send), [1])
+        self.assertEqual(self.cache.fetch("/challenges", None, self.send), [1])
+        self.assertEqual(self.cache.stats.snapshot()["stale_errors"], 2)
+
+    def test_stale_entry_is_served_while_revalidating(self):
+        self.responses = [FakeResponse(data=[1], etag='"v1"'), FakeResponse(data=[2], etag='"v2"')]
+
+        async def run():
+            await self.cache.afetch("/challenges", None, self.asend)
+            self.age(70)
+            stale = await self.cache.afetch("/challenges", None, self.asend)
+            await asyncio.gather(*self.cache._tasks)
+            return stale, await self.cache.afetch("/challenges", None, self.asend)
+
+        self.assertEqual(asyncio.run(run()), ([1], [2]))
+        self.assertEqual(self.sent, [None, {"If-None-Match": '"v1"'}])
+        stats = self.cache.stats.snapshot()
+        self.assertEqual((stats["stale_hits"], stats["refreshed"], stats["hits"]), (1, 1, 1))
+
+    def test_uncached_endpoints_bypass(self):
+        self.responses = [FakeResponse(data={"tag": PLAYER_TAG})] * 2
+        for _ in range(2):
+            self.cache.fetch("/players/%23ABC12345", None, self.send)
+        self.assertEqual(len(self.sent), 2)
+        self.assertEqual(self.cache.stats.snapshot()["bypassed"], 2)
+
+
+class SingleFlightTests(TestCase):
+    def wait_for(self, condition):
+        deadline = timezone.now() + timedelta(seconds=5)
+        while not condition():
+            self.assertLess(timezone.now(), deadline, "timed out")
+            threading.Event().wait(0.005)
+
+    def test_concurrent_calls_share_one_execution(self):
+        flight = singleflight.SingleFlight(lock_dir=None)
+        release, calls, results = threading.Event(), [], []
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return {"tag": PLAYER_TAG}
+
+        threads = [threading.Thread(target=lambda: results.append(flight.do("k", fetch))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        self.wait_for(lambda: flight.coalesced == 4)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result is results[0] for result in results))
+        # Finished keys run again
+        flight.do("k", fetch)
+        self.assertEqual(len(calls), 2)
+
+    def test_errors_reach_every_caller(self):
+        flight = singleflight.SingleFlight(lock_dir=None)
+        release, errors = threading.Event(), []
+
+        def fail():
+            release.wait(5)
+            raise ValueError("upstream down")
+
+        def call():
+            try:
+                flight.do("k", fail)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        self.wait_for(lambda: flight.coalesced == 2)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 3)
+
+    def test_async_tasks_share_one_execution(self):
+        flight = singleflight.SingleFlight(lock_dir=None)
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 42
+
+        async def run():
+            return await asyncio.gather(*(flight.ado("k", fetch) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(run()), [42] * 5)
+        self.assertEqual((len(calls), flight.executed, flight.coalesced), (1, 1, 4))
+
+    @skipUnless(singleflight.fcntl, "flock is not available")
+    def test_file_lock_is_exclusive(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/singleflight.lock"
+            first, second = singleflight.FileLock(path), singleflight.FileLock(path)
+            self.assertTrue(first.try_acquire())
+            self.assertFalse(second.acquire(0.05))
+            first.release()
+            self.assertTrue(second.try_acquire())
+            second.release()
+
+    @skipUnless(singleflight.fcntl, "flock is not available")
+    def test_keys_lock_independently(self):
+        with tempfile.TemporaryDirectory() as directory:
+            open(f"{directory}/singleflight-007.lock", "w").close()
+            flight = singleflight.SingleFlight(lock_dir=directory)
+            self.assertEqual(os.listdir(directory), [])
+            first, other, again = flight._file_lock("a"), flight._file_lock("b"), flight._file_lock("a")
+            self.assertTrue(first.try_acquire())
+            self.assertTrue(other.try_acquire())
+            self.assertFalse(again.try_acquire())
+            first.release()
+            self.assertEqual(os.listdir(directory), [os.path.basename(other.path)])
+            self.assertTrue(again.try_acquire())
+            again.release()
+            other.release()
+            self.assertEqual(os.listdir(directory), [])
+
+
+class SyncQueueTests(TestCase):
+    def test_enqueue_dedupes_and_raises_priority(self):
+        self.assertTrue(sync_queue.enqueue_sync(SyncJob.JobType.PLAYER, PLAYER_TAG))
+        self.assertFalse(sync_queue.enqueue_sync(SyncJob.JobType.PLAYER, PLAYER_TAG, priority=5))
+        self.assertFalse(sync_queue.enqueue_sync(SyncJob.JobType.PLAYER, PLAYER_TAG, priority=1))
+        job = SyncJob.objects.get()
+        self.assertEqual((job.status, job.priority), (SyncJob.Status.PENDING, 5))
+
+    def test_claims_by_priority_once(self):
+        sync_queue.enqueue_sync(SyncJob.JobType.PLAYER, PLAYER_TAG)
+        sync_queue.enqueue_sync(SyncJob.JobType.PLAYER, OTHER_TAG, priority=9)
+        sync_queue.enqueue_sync(SyncJob.JobType.CHALLENGES, priority=1)
+        first = sync_queue.claim_jobs(2)
+        self.assertEqual([job.target_tag for job in first], [OTHER_TAG, ""])
+        self.assertTrue(all(job.status == SyncJob.Status.RUNNING and job.attempts == 1 for job in first))
+        self.assertEqual([job.target_tag for job in sync_queue.claim_jobs(5)], [PLAYER_TAG])
+        self.assertEqual(sync_queue.claim_jobs(5), [])
+
+    def test_failures_back_off_then_give_up(self):
+        sync_queue.enqueue_sync(SyncJob.JobType.PLAYER, PLAYER_TAG)
+        with mock.patch.object(sync_queue, "SYNC_MAX_ATTEMPTS", 2), \
+                mock.patch.object(sync_queue, "sync_player", side_effect=ValueError("offline")), \
+                self.assertLogs(sync_queue.logger, "WARNING"):
+            self.assertFalse(sync_queue.run_job(sync_queue.claim_jobs(1)[0]))
+            job = SyncJob.objects.get()
+            self.assertEqual((job.status, job.last_error), (SyncJob.Status.PENDING, "offline"))
+            self.assertGreater(job.next_run_at, timezone.now())
+            self.assertEqual(sync_queue.claim_jobs(1), [])
+
+            SyncJob.objects.update(next_run_at=timezone.now())
+            self.assertFalse(sync_queue.run_job(sync_queue.claim_jobs(1)[0]))
+        self.assertEqual(SyncJob.objects.get().status, SyncJob.Status.FAILED)
+
+    def test_success_and_stale_locks(self):
+        sync_queue.enqueue_sync(SyncJob.JobType.PLAYER, PLAYER_TAG)
+        sync_queue.claim_jobs(1)
+        SyncJob.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(sync_queue.requeue_stale_jobs(timeout=60), 1)
+        with mock.patch.object(sync_queue, "sync_player") as sync_player:
+            self.assertTrue(sync_queue.run_job(sync_queue.claim_jobs(1)[0]))
+        sync_player.assert_called_once_with(PLAYER_TAG)
+        job = SyncJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (SyncJob.Status.DONE, 2))
+        # A finished job does not block the next refresh
+        self.assertTrue(sync_queue.enqueue_sync(SyncJob.JobType.PLAYER, PLAYER_TAG))
+
+
+def battle_log_payload(player_tag, minutes):
+    """
+    A ``/players/{tag}/battlelog`` response with a battle at each of ``minutes``
+    past a fixed time, newest first like the API.
+    """
+    start = datetime(2025, 1, 21, 20, 0, tzinfo=dt_timezone.utc)
+    return [
+        {
+            "type": "PvP",
+            "battleTime": (start + timedelta(minutes=minute)).strftime("%Y%m%dT%H%M%S.000Z"),
+            "arena": {"name": "Arena A"},
+            "gameMode": {"name": "Ladder"},
+            "team": [
+                {"tag": player_tag, "name": "Tester", "startingTrophies": 6000,
+                 "trophyChange": 30 if minute % 2 else -30, "crowns": minute % 4}
+            ],
+            "opponent": [{"tag": f"#OPP{minute}"}],
+        }
+        for minute in sorted(minutes, reverse=True)
+    ]
+
+
+class IncrementalIngestTests(TestCase):
+    def test_only_battles_past_the_high_water_mark(self):
+        self.assertEqual(len(ingest_new_battles(PLAYER_TAG, battle_log_payload(PLAYER_TAG, range(10)))), 10)
+        # An unchanged log is recognised by its hash and writes nothing
+        with self.assertNumQueries(1):
+            self.assertEqual(ingest_new_battles(PLAYER_TAG, battle_log_payload(PLAYER_TAG, range(10))), [])
+
+        # -5 was never stored but is older than the high-water mark
+        inserted = ingest_new_battles(PLAYER_TAG, battle_log_payload(PLAYER_TAG, [-5, *range(5, 15)]))
+        self.assertEqual(sorted(battle.opponent_tag for battle in inserted), [f"#OPP{i}" for i in range(10, 15)])
+        self.assertEqual(BattleLog.objects.filter(player_tag=PLAYER_TAG).count(), 15)
+        newest = BattleLog.objects.filter(player_tag=PLAYER_TAG).latest("timestamp").timestamp
+        self.assertEqual(PlayerSyncState.objects.get(player_tag=PLAYER_TAG).last_battle_time, newest)
+
+    def test_stats_and_commitment_advance_with_new_battles(self):
+        ingest_new_battles(PLAYER_TAG, battle_log_payload(PLAYER_TAG, range(6)))
+        ingest_new_battles(PLAYER_TAG, battle_log_payload(PLAYER_TAG, range(3, 11)))
+        stats = get_player_stats(PLAYER_TAG)
+        root = BattleCommitment.objects.get(player_tag=PLAYER_TAG).root
+        rebuild_player_stats(PLAYER_TAG)
+        self.assertEqual(get_player_stats(PLAYER_TAG), stats)
+        self.assertEqual(rebuild_battle_commitment(PLAYER_TAG).root, root)
+        self.assertEqual(stats["battle_count"], 11)
+
+
+ATTESTATION_KEY = "0x" + "4c" * 32
+
+
+class AttestationTests(TestCase):
+    def setUp(self):
+        self.attestor = attestation.Attestor(ATTESTATION_KEY)
+
+    def test_batch_verifies_with_one_signature_recovery(self):
+        attestations = self.attestor.attest_batch([{"type": "trophy", "param": str(i)} for i in range(4)])
+        self.assertEqual(len({item["signature"] for item in attestations}), 1)
+        cache = attestation.SignerCache()
+        recover = attestation.Account.recover_message
+        with mock.patch.object(attestation.Account, "recover_message", side_effect=recover) as recovered:
+            for item in attestations:
+                self.assertTrue(attestation.verify_attestation(item, self.attestor.address, cache))
+        self.assertEqual(recovered.call_count, 1)
+        self.assertEqual(self.attestor.attest_batch([]), [])
+
+    def test_tampered_or_foreign_attestations_fail(self):
+        item = self.attestor.attest({"type": "trophy", "param": "8000"})
+        tampered = {**item, "statement": {"type": "trophy", "param": "9000"}}
+        other = attestation.Attestor("0x" + "7d" * 32)
+        self.assertIsNone(attestation.recover_attestation_signer(tampered))
+        self.assertFalse(attestation.verify_attestation(item, other.address))
+        self.assertIsNone(attestation.recover_attestation_signer({"statement": {}}))
+        self.assertIsNone(attestation.recover_attestation_signer({**item, "signature": "0x00"}))
+
+    def test_proofs_api_attests_every_proof(self):
+        Player.objects.create(tag=PLAYER_TAG, name="Tester", level=14, trophies=9000)
+        create_battles(PLAYER_TAG, 5)
+        sync_challenges(challenges_payload(2))
+        url = reverse("api_player_proofs", args=[PLAYER_TAG.lstrip("#")])
+        with mock.patch.object(attestation, "_attestor", self.attestor):
+            data = self.client.get(url, {"attest": "1"}).json()
+        self.assertEqual(len(data["attestations"]), 4)
+        for item in data["attestations"]:
+            self.assertTrue(attestation.verify_attestation(item, self.attestor.address))
+        self.assertEqual(data["attestations"][0]["statement"]["proof"], data["trophy_proof"]["proof"])
+        with mock.patch.object(attestation, "_attestor", None), mock.patch.object(attestation, "Attestor") as attestor:
+            attestor.side_effect = attestation.ImproperlyConfigured("no key")
+            self.assertEqual(self.client.get(url, {"attest": "1"}).status_code, 400)
+
+
+class ReadAPITests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Player.objects.bulk_create(
+            Player(tag=f"#P{i:03d}", name="Tester", level=14, trophies=5000 + i) for i in range(7)
+        )
+        Player.objects.create(tag=PLAYER_TAG, name="Tester", level=14, trophies=6000)
+        create_battles(PLAYER_TAG, 30)
+        create_battles(OTHER_TAG, 5)
+
+    def pages(self, url, **params):
+        pages = [self.client.get(url, params).json()]
+        while pages[-1]["next"]:
+            pages.append(self.client.get(pages[-1]["next"]).json())
+        return pages
+
+    def test_player_list_cursor_pages(self):
+        pages = self.pages(reverse("api_players"), limit=3)
+        self.assertEqual(len(pages), 3)
+        tags = [player["tag"] for page in pages for player in page["results"]]
+        self.assertEqual(tags, sorted(Player.objects.values_list("tag", flat=True)))
+
+    def test_battle_cursor_pages_newest_first(self):
+        url = reverse("api_player_battles", args=[PLAYER_TAG.lstrip("#")])
+        pages = self.pages(url, limit=8)
+        battles = [battle for page in pages for battle in page["results"]]
+        expected = BattleLog.objects.filter(player_tag=PLAYER_TAG).order_by("-timestamp")
+        self.assertEqual(len(pages), 4)
+        self.assertEqual([battle["battle_id"] for battle in battles], list(expected.values_list("battle_id", flat=True)))
+
+    def test_conditional_requests(self):
+        url = reverse("api_player", args=[PLAYER_TAG.lstrip("#")])
+        response = self.client.get(url, {"fields": "tag,trophies"})
+        self.assertEqual(response.json(), {"tag": PLAYER_TAG, "trophies": 6000})
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(url, {"fields": "tag,trophies"}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Another field selection is another representation
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        Player.objects.filter(tag=PLAYER_TAG).update(trophies=6100, data_version=1)
+        self.assertEqual(self.client.get(url, {"fields": "tag,trophies"}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_unknown_resources(self):
+        self.assertEqual(self.client.get(reverse("api_player", args=["NOPE"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("api_clan", args=["NOPE"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("api_challenges")).json(), [])
+
+    def test_challenges_of_the_latest_sync(self):
+        sync_challenges(challenges_payload(3))
+        Challenge.objects.filter(id="70000002").update(synced_at=timezone.now() - timedelta(days=1))
+        current = [row["id"] for row in self.client.get(reverse("api_challenges")).json()]
+        every = [row["id"] for row in self.client.get(reverse("api_challenges"), {"all": "1"}).json()]
+        self.assertEqual(current, ["70000000", "70000001"])
+        self.assertEqual(every, ["70000000", "70000001", "70000002"])
+
+
+class BattleKeyTests(TransactionTestCase):
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.migrate([target])
+        return executor.loader.project_state([target]).apps
+
+    def test_legacy_battles_are_not_ingested_again(self):
+        payload = battle_log_payload(PLAYER_TAG, range(3))
+        latest = MigrationExecutor(connection).loader.graph.leaf_nodes("clashroyale")[0]
+        apps = self.migrate(("clashroyale", "0001_initial"))
+        self.addCleanup(self.migrate, latest)
+        # Rows stored before 0002: keyed by the bare battle time, no opponent
+        apps.get_model("clashroyale", "BattleLog").objects.bulk_create(
+            apps.get_model("clashroyale", "BattleLog")(
+                battle_id=battle["battleTime"], type=battle["type"], timestamp=parse_battle_time(battle["battleTime"]),
+                arena="Arena A", game_mode="Ladder", player_tag=PLAYER_TAG, player_name="Tester",
+                starting_trophies=6000, trophy_change=battle["team"][0]["trophyChange"],
+                crowns=battle["team"][0]["crowns"], king_tower_hp=0, princess_tower_hp=[0, 0],
+            )
+            for battle in payload
+        )
+        self.migrate(latest)
+        stats = get_player_stats(PLAYER_TAG)
+        self.assertEqual(stats["battle_count"], 3)
+
+        self.assertEqual(ingest_new_battles(PLAYER_TAG, payload), [])
+        self.assertEqual(BattleLog.objects.filter(player_tag=PLAYER_TAG).count(), 3)
+        self.assertEqual(get_player_stats(PLAYER_TAG), stats)
+        self.assertEqual(len(ingest_new_battles(PLAYER_TAG, battle_log_payload(PLAYER_TAG, range(4)))), 1)
+        self.assertEqual(get_player_stats(PLAYER_TAG)["battle_count"], 4)
+
+    def test_composite_keys_keep_simultaneous_battles_apart(self):
+        payload = battle_log_payload(PLAYER_TAG, [0, 1])
+        # The same battle twice in one payload is written once
+        inserted = ingest_new_battles(PLAYER_TAG, payload + payload[:1])
+        self.assertEqual(len(inserted), 2)
+        # Another player's battle at the same second gets its own row
+        ingest_new_battles(OTHER_TAG, battle_log_payload(OTHER_TAG, [0]))
+        self.assertEqual(
+            sorted(BattleLog.objects.values_list("battle_id", flat=True)),
+            sorted(
+                make_battle_id(battle["team"][0]["tag"], battle["battleTime"], battle["opponent"][0]["tag"])
+                for battle in payload + battle_log_payload(OTHER_TAG, [0])
+            ),
+        )
+
+
+class AsyncFanOutTests(TestCase):
+    def setUp(self):
+        from benchmarks.stub import StubAPI
+
+        self.stub = StubAPI()
+        self.calls = []
+        patcher = mock.patch("clashroyale.services.sync.async_make_request", self.fake_request)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def fake_request(self, endpoint, params=None):
+        loop = asyncio.get_running_loop()
+        call = {"endpoint": endpoint, "start": loop.time()}
+        self.calls.append(call)
+        await asyncio.sleep(0.05)
+        call["end"] = loop.time()
+        return json.loads(self.stub.payload(endpoint))
+
+    def test_independent_calls_run_concurrently(self):
+        from .services.sync import afetch_player_bundle
+
+        player_data, clan_data, battle_log_data, challenges_data = asyncio.run(afetch_player_bundle(PLAYER_TAG))
+        self.assertEqual(player_data["tag"], PLAYER_TAG)
+        self.assertTrue(clan_data and battle_log_data and challenges_data)
+        calls = {call["endpoint"]: call for call in self.calls}
+        player_path = f"/players/{urllib.parse.quote(PLAYER_TAG)}"
+        player, battle_log, challenges = calls[player_path], calls[f"{player_path}/battlelog"], calls["/challenges"]
+        clan = next(call for endpoint, call in calls.items() if endpoint.startswith("/clans/"))
+        # Player, battle log and challenges are in flight together; the clan waits for the player
+        self.assertLess(max(player["start"], battle_log["start"], challenges["start"]), player["end"])
+        self.assertGreaterEqual(clan["start"], player["end"])
+        self.assertLess(clan["start"], battle_log["end"])
+
+    def test_first_visit_fetches_then_serves_from_the_database(self):
+        url = reverse("player_stats")
+        response = self.client.get(url, {"player_tag": PLAYER_TAG.lower()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["player"].tag, PLAYER_TAG)
+        self.assertEqual(len(response.context["battles"]), 10)
+        self.assertEqual(len(self.calls), 4)
+
+        response = self.client.get(url, {"player_tag": PLAYER_TAG})
+        self.assertEqual(response.context["player"].tag, PLAYER_TAG)
+        self.assertEqual(len(self.calls), 4)
+
+
+def challenge_catalogue(count, prizes=None):
+    """
+    A ``/challenges`` response with game modes and prizes.
+    """
+    return [
+        {
+            "type": "singleChallenge",
+            "challenges": [
+                {
+                    "id": 70000000 + i, "name": f"Challenge {i}", "maxWins": 12, "maxLosses": 3,
+                    "gameMode": {"id": 72000000 + i % 3, "name": f"Mode {i % 3}"},
+                    "prizes": (prizes or {}).get(i, [
+                        {"type": "consumable", "amount": 1000 * (i + 1), "consumableName": "Gold"},
+                        {"type": "chest", "amount": 1, "consumableName": None},
+                    ]),
+                }
+                for i in range(count)
+            ],
+        }
+    ]
+
+
+class ChallengeSyncTests(TestCase):
+    def queries(self, payload):
+        with CaptureQueriesContext(connection) as queries:
+            sync_challenges(payload)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_the_catalogue(self):
+        created, changed = [], []
+        for count in (3, 30):
+            GameMode.objects.all().delete()
+            Challenge.objects.all().delete()
+            created.append(self.queries(challenge_catalogue(count)))
+            Challenge.objects.update(name="Old")
+            GameMode.objects.update(name="Old")
+            Prize.objects.update(amount=0)
+            changed.append(self.queries(challenge_catalogue(count)))
+        self.assertEqual(created[0], created[1])
+        self.assertEqual(changed[0], changed[1])
+
+    def test_unchanged_catalogue_writes_nothing(self):
+        sync_challenges(challenge_catalogue(5))
+        prize_ids = sorted(Prize.objects.values_list("id", flat=True))
+        _, counts = sync_challenges(challenge_catalogue(5))
+        self.assertEqual(counts, {"created": 0, "updated": 0, "unchanged": 5, "prizes_replaced": 0})
+        self.assertEqual(sorted(Prize.objects.values_list("id", flat=True)), prize_ids)
+
+    def test_only_changed_rows_and_prize_sets_are_written(self):
+        sync_challenges(challenge_catalogue(5))
+        payload = challenge_catalogue(5, prizes={
+            # Same prizes in another order, and a changed amount
+            1: challenge_catalogue(5)[0]["challenges"][1]["prizes"][::-1],
+            2: [{"type": "consumable", "amount": 1, "consumableName": "Gold"}],
+        })
+        payload[0]["challenges"][3]["name"] = "Renamed"
+        payload[0]["challenges"][4]["gameMode"]["name"] = "Renamed mode"
+        _, counts = sync_challenges(payload)
+        self.assertEqual(counts, {"created": 0, "updated": 1, "unchanged": 4, "prizes_replaced": 1})
+        self.assertEqual(Challenge.objects.get(id="70000003").name, "Renamed")
+        self.assertEqual(GameMode.objects.get(id="72000001").name, "Renamed mode")
+        self.assertEqual(list(Prize.objects.filter(challenge_id="70000002").values_list("amount", flat=True)), [1])
+        self.assertEqual(Prize.objects.count(), 9)
+
+
+class BattleTotalsTests(TestCase):
+    def test_in_memory_totals_match_the_aggregate(self):
+        create_battles(PLAYER_TAG, 25)
+        create_battles("#OTHER", 4)
+        for label, battles in (
+            ("player", BattleLog.objects.filter(player_tag=PLAYER_TAG)),
+            ("losses", BattleLog.objects.filter(player_tag=PLAYER_TAG, crowns=0)),
+            ("trophy losses", BattleLog.objects.filter(player_tag=PLAYER_TAG, trophy_change__lt=0)),
+            ("everyone", BattleLog.objects.all()),
+            ("empty", BattleLog.objects.none()),
+        ):
+            with self.subTest(label):
+                self.assertEqual(battle_totals(list(battles)), aggregate_battle_stats(battles))
+
+
+class ChallengeProofBatchTests(TestCase):
+    def setUp(self):
+        Player.objects.create(tag=PLAYER_TAG, name="Tester", level=14, trophies=8100)
+        sync_challenges(challenges_payload(10))
+
+    def assert_constant_queries(self, expected):
+        many = [str(70000000 + i) for i in range(10)] + ["missing"]
+        with self.assertNumQueries(expected):
+            single = ChallengeVerification.generate_challenge_proofs(PLAYER_TAG, ["70000000"])
+        with self.assertNumQueries(expected):
+            proofs = ChallengeVerification.generate_challenge_proofs(PLAYER_TAG, many)
+        self.assertEqual(list(proofs), many)
+        self.assertEqual(proofs["70000000"], single["70000000"])
+        self.assertFalse(proofs["missing"]["proof"])
+        return proofs
+
+    def test_completed(self):
+        create_battles(PLAYER_TAG, 3)
+        # Player, challenges, battle evidence
+        proofs = self.assert_constant_queries(3)
+        self.assertTrue(all(proofs[str(70000000 + i)]["proof"] for i in range(10)))
+
+    def test_not_completed(self):
+        create_battles(PLAYER_TAG, 1)
+        # Player, challenges, battle evidence, archived evidence
+        proofs = self.assert_constant_queries(4)
+        self.assertFalse(any(proof["proof"] for proof in proofs.values()))
+
+    def test_unknown_player(self):
+        Player.objects.all().delete()
+        proofs = self.assert_constant_queries(1)
+        self.assertFalse(any(proof["proof"] for proof in proofs.values()))
@@ -1,8 +1,25 @@
 from django.urls import path
-from . import views
+from . import api_views, views
 
 urlpatterns = [
     path('', views.player_search_view, name='player_search'),
     path('player-stats/', views.player_stats_view, name='player_stats'),
     path('challenge-details',views.challenge_detail_view, name='challenge_details'),
+    path('cache-stats/', views.cache_stats_view, name='cache_stats'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('verify/bulk/', views.bulk_verify_view, name='bulk_verify'),
+
+    # Read-only JSON API over stored data (tags may omit the leading '#')
+    path('api/leaderboard/', api_views.LeaderboardAPIView.as_view(), name='api_leaderboard'),
+    path('api/players/', api_views.PlayerListAPIView.as_view(), name='api_players'),
+    path('api/players/<str:tag>/', api_views.PlayerDetailAPIView.as_view(), name='api_player'),
+    path('api/players/<str:tag>/battles/', api_views.PlayerBattleListAPIView.as_view(), name='api_player_battles'),
+    path('api/players/<str:tag>/rank/', api_views.PlayerRankAPIView.as_view(), name='api_player_rank'),
+    path('api/players/<str:tag>/trophies/', api_views.PlayerTrophyHistoryAPIView.as_view(), name='api_player_trophies'),
+    path('api/players/<str:tag>/proofs/', api_views.PlayerProofsAPIView.as_view(), name='api_player_proofs'),
+    path('api/clans/<str:tag>/leaderboard/', api_views.ClanLeaderboardAPIView.as_view(), name='api_clan_leaderboard'),
+    path('api/clans/<str:tag>/', api_views.ClanDetailAPIView.as_view(), name='api_clan'),
+    path('api/battles/export/', views.battle_export_view, name='battle_export'),
+    path('api/challenges/', api_views.ChallengeListAPIView.as_view(), name='api_challenges'),
+    path('api/challenges/<str:challenge_id>/', api_views.ChallengeDetailAPIView.as_view(), name='api_challenge'),
 ]
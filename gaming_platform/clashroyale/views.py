@@ -1,14 +1,41 @@
-from django.shortcuts import render
-from django.http import HttpResponse
-import urllib.parse
+from django.shortcuts import render as django_render
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from django.utils.dateparse import parse_datetime
+from asgiref.sync import sync_to_async
+import json
+from datetime import timezone as dt_timezone
 from .services.api_client import make_request
-from .services.verification import TrophyVerification, WinLossVerification, ChallengeVerification
-from clashroyale.models import Player, Clan, Challenge, BattleLog, GameMode
+from .services.bulk_verify import get_bulk_verifier, summarize
+from .services.cache import get_response_cache
+from .services.config import METRICS_ENABLED
+from .services.export import CONTENT_TYPES, FORMATS, archived_before, export_battles, export_queryset
+from .services.metrics import render_metrics, timed
+from .services.sync import (
+    afetch_player_bundle,
+    are_challenges_stale,
+    current_challenges,
+    is_player_stale,
+    store_player_bundle,
+)
+from .services.sync_queue import enqueue_sync
+from .services.proof_cache import challenge_proofs, get_proof_cache, trophy_proof, win_loss_proof
+from clashroyale.models import Player, Clan, BattleLog, SyncJob
 import logging
 
 # Set up logger for debugging and information purposes
 logger = logging.getLogger(__name__)
 
+
+@timed("render")
+def render(request, template_name, context=None):
+    """
+    ``django.shortcuts.render``, timed as the "render" stage of the request.
+    """
+    return django_render(request, template_name, context)
+
+
 def player_search_view(request):
     """
     Renders the player search form where the user can enter a player tag.
@@ -29,13 +56,59 @@ def validate_player_tag(player_tag):
     return True, None
 
 
-def player_stats_view(request):
+def build_player_stats_context(player):
+    """
+    Builds the player stats page from stored data and generates Zero-Knowledge Proofs.
+    """
+    clan = Clan.objects.filter(tag=player.clan_tag).first() if player.clan_tag else None
+
+    # Generate Zero-Knowledge Proofs for the player
+    proofs = {
+        "trophy_proof": trophy_proof(player, threshold=8000),
+        "win_loss_proof": win_loss_proof(player, threshold=60.0),
+    }
+    logger.info(f"Generated proofs: {proofs}")
+
+    # Generate ZKP for the current challenges
+    challenge_ids = [challenge.id for challenge in current_challenges()]
+    challenge_proof_list = [
+        {"challenge_id": challenge_id, "proof": challenge_proof}
+        for challenge_id, challenge_proof in challenge_proofs(player, challenge_ids).items()
+    ]
+    logger.info(f"Generated {len(challenge_proof_list)} challenge proofs for {player.tag}")
+
+    return {
+        "player": player,
+        "clan": clan,
+        "proofs": proofs,
+        "challenges": challenge_proof_list,
+        "battles": list(BattleLog.objects.filter(player_tag=player.tag)[:10]),  # Display only top 10 battles
+    }
+
+
+def refresh_if_stale(player):
     """
-    Fetches and displays player stats, challenges, battle logs, 
-    and generates Zero-Knowledge Proofs based on the player's tag.
+    Enqueues background refreshes for a stale player and a stale challenge list.
+    """
+    if is_player_stale(player):
+        # User-facing refreshes overtake bulk ones queued by fetch_clashroyale_data
+        enqueue_sync(SyncJob.JobType.PLAYER, player.tag, priority=10)
+    if are_challenges_stale():
+        enqueue_sync(SyncJob.JobType.CHALLENGES, priority=10)
+
+
+async def player_stats_view(request):
+    """
+    Displays player stats, challenges, battle logs and Zero-Knowledge Proofs
+    for the player's tag.
+
+    Known players are served straight from the database and a background
+    refresh (see ``run_sync_worker``) is queued when their data is stale. Only
+    a player seen for the first time is fetched inline, with the upstream calls
+    issued concurrently.
     """
     # Get the player tag from the request
-    player_tag = request.GET.get("player_tag", "").strip()  # Ensure player_tag is stripped of whitespace
+    player_tag = request.GET.get("player_tag", "").strip().upper()  # Tags are upper-case upstream
     if not player_tag:
         return render(request, "player_search.html", {"error": "Player tag is required!"})
 
@@ -44,138 +117,29 @@ def player_stats_view(request):
     if not is_valid:
         return render(request, "player_search.html", {"error": error_message})
 
-    # URL-encode the player tag to ensure compatibility with API requirements
-    encoded_player_tag = urllib.parse.quote(player_tag)
-
     try:
-        # 1. Fetch and store player data
-        player_data = make_request(f"/players/{encoded_player_tag}")
-        logger.info(f"Fetched player data: {player_data}")  # Log the player data to verify the response
-
-        if not isinstance(player_data, dict) or not player_data:
-            logger.warning(f"Player data not found or invalid for tag: {player_tag}")
-            return render(request, "player_search.html", {"error": "Player not found! Please check the tag."})
-
-        # Log specific attributes to confirm they're available
-        logger.info(f"Player Tag: {player_data.get('tag')}")
-        logger.info(f"Player Name: {player_data.get('name')}")
-        logger.info(f"Player Trophies: {player_data.get('trophies')}")
-        logger.info(f"Player Experience Level: {player_data.get('expLevel')}")
-
-        # Store player data in the database
-        player, created = Player.objects.update_or_create(
-            tag=player_data["tag"],
-            defaults={
-                "name": player_data["name"],
-                "level": player_data["expLevel"],
-                "trophies": player_data["trophies"],
-            },
-        )
+        player = await Player.objects.filter(tag=player_tag).afirst()
+        if player is None:
+            # 1. First visit: fetch player, clan, battle log (and challenges if stale) concurrently
+            include_challenges = await sync_to_async(are_challenges_stale)()
+            player_data, clan_data, battle_log_data, challenges_data = await afetch_player_bundle(
+                player_tag, include_challenges=include_challenges
+            )
+            logger.info(f"Fetched player data: {player_data}")  # Log the player data to verify the response
 
-        # Generate Zero-Knowledge Proofs for the player
-        proofs = {
-            "trophy_proof": TrophyVerification.generate_trophy_proof(player_tag, threshold=8000),
-            "win_loss_proof": WinLossVerification.generate_win_loss_proof(player_tag, threshold=60.0),
-        }
-        logger.info(f"Generated proofs: {proofs}")
-
-        # 2. Fetch and store clan data if the player is part of a clan
-        clan_data = None
-        if isinstance(player_data.get("clan"), dict):
-            clan_tag = player_data["clan"].get("tag")
-            if clan_tag:
-                encoded_clan_tag = urllib.parse.quote(clan_tag)
-                clan_data = make_request(f"/clans/{encoded_clan_tag}")
-                if isinstance(clan_data, dict) and clan_data:
-                    # If data is found, store or update the clan data
-                    Clan.objects.update_or_create(
-                        tag=clan_data["tag"],
-                        defaults={
-                            "name": clan_data["name"],
-                            "description": clan_data.get("description", ""),
-                            "badge_id": clan_data["badgeId"],
-                            "clan_score": clan_data["clanScore"],
-                            "members_count": clan_data["members"],
-                        },
-                    )
-                    logger.info(f"Clan data stored successfully for clan tag: {clan_tag}")
-                else:
-                    logger.warning(f"No valid clan data found for clan tag: {clan_tag}")
-
-        # 3. Fetch and process challenges
-        challenges_data = make_request("/challenges")
-        challenge_proofs = []
-        if isinstance(challenges_data, list) and challenges_data:
-            for challenge_set in challenges_data:
-                challenges = challenge_set.get("challenges", [])
-                for challenge in challenges:
-                    # Process and store challenge data
-                    game_mode_data = challenge.get("gameMode", {})
-                    game_mode, _ = GameMode.objects.get_or_create(
-                        id=game_mode_data.get("id"),
-                        defaults={"name": game_mode_data.get("name", "Unknown")},
-                    )
-
-                    challenge_obj, created = Challenge.objects.update_or_create(
-                        id=challenge["id"],
-                        defaults={
-                            "name": challenge["name"],
-                            "description": challenge.get("description", ""),
-                            "win_mode": challenge.get("winMode", ""),
-                            "casual": challenge.get("casual", False),
-                            "max_losses": challenge.get("maxLosses", 0),
-                            "max_wins": challenge.get("maxWins", 0),
-                            "icon_url": challenge.get("iconUrl", ""),
-                            "game_mode": game_mode,
-                        },
-                    )
-                    # Generate ZKP for challenges
-                    challenge_proof = ChallengeVerification.generate_challenge_proof(player_tag, challenge["id"])
-                    challenge_proofs.append({
-                        "challenge_id": challenge["id"],
-                        "proof": challenge_proof,
-                    })
-                    logger.info(f"Challenge proof for {player_tag}: {challenge_proof}")
-
-        # 4. Fetch and store battle log data
-        battle_log_data = make_request(f"/players/{encoded_player_tag}/battlelog")
-        if isinstance(battle_log_data, list) and battle_log_data:
-            for battle in battle_log_data[:50]:  # Limit to top 50 battles
-                battle_type = battle.get("type", "Unknown")
-                battle_time = battle.get("battleTime", "")
-                arena_name = battle.get("arena", {}).get("name", "Unknown Arena")
-                game_mode_name = battle.get("gameMode", {}).get("name", "Unknown Mode")
-                team = battle.get("team", [])
-
-                if team:
-                    player_data = team[0]  # First team member (current player)
-                    BattleLog.objects.update_or_create(
-                        battle_id=battle_time,
-                        defaults={
-                            "type": battle_type,
-                            "timestamp": battle_time,
-                            "arena": arena_name,
-                            "game_mode": game_mode_name,
-                            "player_tag": player_data.get("tag", ""),
-                            "player_name": player_data.get("name", "Unknown"),
-                            "starting_trophies": player_data.get("startingTrophies", 0),
-                            "trophy_change": player_data.get("trophyChange", 0),
-                            "crowns": player_data.get("crowns", 0),
-                            "king_tower_hp": player_data.get("kingTowerHitPoints", 0),
-                            "princess_tower_hp": player_data.get("princessTowersHitPoints", [0, 0]),
-                        },
-                    )
-            logger.info("Battle logs processed successfully.")
-
-        # Render the player stats template with fetched data and proofs
-        return render(request, "player_stats.html", {
-            "player": player_data,
-            "clan": clan_data,  # Add clan data to context
-            "proofs": proofs,
-            "challenges": challenge_proofs,
-            "battles": battle_log_data[:10],
-            'exp_level_key': 'expLevel',# Display only top 10 battles
-        })
+            # 2. Store everything off the event loop
+            player = await sync_to_async(store_player_bundle)(
+                player_data, clan_data, battle_log_data, challenges_data
+            )
+            if player is None:
+                logger.warning(f"Player data not found or invalid for tag: {player_tag}")
+                return render(request, "player_search.html", {"error": "Player not found! Please check the tag."})
+        else:
+            await sync_to_async(refresh_if_stale)(player)
+
+        # Render the player stats template from stored data with proofs
+        context = await sync_to_async(build_player_stats_context)(player)
+        return render(request, "player_stats.html", context)
 
     except Exception as e:
         # Handle any errors during the process
@@ -220,3 +184,89 @@ def challenge_detail_view(request):
     except Exception as e:
         logger.error(f"Error occurred while fetching challenges data: {str(e)}")
         return render(request, "error.html", {"error": "An error occurred while fetching challenges."})
+
+
+def cache_stats_view(request):
+    """
+    Exposes this process's upstream response cache and proof cache counters for sizing them.
+    """
+    stats = get_response_cache().stats.snapshot()
+    stats["proof_cache"] = get_proof_cache().snapshot()
+    return JsonResponse(stats)
+
+
+def metrics_view(request):
+    """
+    This process's timing histograms and cache counters in the Prometheus text format.
+    """
+    if not METRICS_ENABLED:
+        raise Http404("Metrics are disabled.")
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@csrf_exempt
+@require_POST
+def bulk_verify_view(request):
+    """
+    Verifies a JSON-lines batch of proofs of mixed types and streams back one
+    JSON result per line, followed by a summary line with verifications/second.
+    """
+    verifier = get_bulk_verifier()
+
+    def stream():
+        stats = {}
+        for result in verifier.verify_stream(request, stats):
+            yield json.dumps(result) + "\n"
+        summary = summarize(stats)
+        logger.info(f"Bulk verification: {summary}")
+        yield json.dumps({"summary": summary}) + "\n"
+
+    return StreamingHttpResponse(stream(), content_type="application/x-ndjson")
+
+
+def parse_export_time(request, name):
+    value = request.GET.get(name)
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(f"{name} must be an ISO 8601 date and time.")
+    return moment if moment.tzinfo else moment.replace(tzinfo=dt_timezone.utc)
+
+
+@require_GET
+def battle_export_view(request):
+    """
+    Streams stored battles, oldest first, as NDJSON (``?format=ndjson``, the
+    default) or CSV, optionally gzipped (``?gzip=1``). Filters: ``player``,
+    ``since``/``until`` (ISO 8601) and ``game_mode``. Every row carries a
+    ``cursor``; pass the last one received as ``?after=`` to resume.
+    Archived battles are not exported: ``X-Archived-Until`` marks the time
+    before which battles in the requested range may be missing.
+    """
+    fmt = request.GET.get("format", "ndjson")
+    try:
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be {' or '.join(FORMATS)}.")
+        since = parse_export_time(request, "since")
+        rows = export_queryset(
+            player_tag=request.GET.get("player"),
+            since=since,
+            until=parse_export_time(request, "until"),
+            game_mode=request.GET.get("game_mode"),
+            after=request.GET.get("after"),
+        )
+    except ValueError as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+
+    compress = request.GET.get("gzip") in ("1", "true")
+    filename = f"battles.{fmt}" + (".gz" if compress else "")
+    response = StreamingHttpResponse(
+        export_battles(rows, fmt, compress),
+        content_type="application/gzip" if compress else CONTENT_TYPES[fmt],
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    until = archived_before(since)
+    if until:
+        response["X-Archived-Until"] = until.isoformat()
+    return response
@@ -42,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "clashroyale.middleware.QueryBudgetMiddleware",
+    "clashroyale.middleware.ServerTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -80,6 +82,13 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # run_sync_worker writes from several threads: take the write lock when a
+        # transaction starts and wait for it instead of failing with
+        # "database is locked"
+        "OPTIONS": {"timeout": 20, "transaction_mode": "IMMEDIATE"},
+        # Tests use a file too: an in-memory database shares one cache with
+        # table locks that fail multi-threaded writes instead of waiting
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
     }
 }
 
@@ -125,9 +134,133 @@ STATIC_URL = "static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
-from decouple import config
+from decouple import config, Csv
 
 CLASH_ROYALE_API_TOKEN = config("CLASH_ROYALE_API_TOKEN")
 
-
-
+# Base URL of the Clash Royale API (point it at a local stub to run offline,
+# e.g. for the benchmarks/ suite).
+CLASH_ROYALE_API_BASE_URL = config("CLASH_ROYALE_API_BASE_URL", default="https://api.clashroyale.com/v1")
+
+# Upstream HTTP client: connection pool size per host, connect/read timeouts
+# (seconds) and retry policy for idempotent requests.
+CLASH_ROYALE_POOL_SIZE = config("CLASH_ROYALE_POOL_SIZE", default=10, cast=int)
+CLASH_ROYALE_CONNECT_TIMEOUT = config("CLASH_ROYALE_CONNECT_TIMEOUT", default=3.05, cast=float)
+CLASH_ROYALE_READ_TIMEOUT = config("CLASH_ROYALE_READ_TIMEOUT", default=10.0, cast=float)
+CLASH_ROYALE_MAX_RETRIES = config("CLASH_ROYALE_MAX_RETRIES", default=3, cast=int)
+CLASH_ROYALE_BACKOFF_FACTOR = config("CLASH_ROYALE_BACKOFF_FACTOR", default=0.5, cast=float)
+CLASH_ROYALE_BACKOFF_MAX = config("CLASH_ROYALE_BACKOFF_MAX", default=30.0, cast=float)
+
+# Upstream response cache. Any Django cache backend works (locmem, file or
+# database); locmem evicts least-recently-used entries once MAX_ENTRIES is hit.
+CLASH_ROYALE_CACHE_ALIAS = "clashroyale"
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    CLASH_ROYALE_CACHE_ALIAS: {
+        "BACKEND": config(
+            "CLASH_ROYALE_CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": config("CLASH_ROYALE_CACHE_LOCATION", default="clashroyale-upstream"),
+        "TIMEOUT": None,
+        "OPTIONS": {
+            "MAX_ENTRIES": config("CLASH_ROYALE_CACHE_MAX_ENTRIES", default=5000, cast=int),
+        },
+    },
+}
+# Seconds a cached response may be served stale while it is refreshed in the
+# background, and how long entries are retained for ETag revalidation.
+CLASH_ROYALE_CACHE_STALE_TTL = config("CLASH_ROYALE_CACHE_STALE_TTL", default=300, cast=int)
+CLASH_ROYALE_CACHE_RETENTION = config("CLASH_ROYALE_CACHE_RETENTION", default=86400, cast=int)
+
+# Cross-process single-flight: when set, identical upstream requests from
+# different worker processes on this host are serialised through lock files in
+# this directory so only one of them reaches the API (pair it with a shared
+# file or database cache backend). Leave empty to coalesce in-process only.
+CLASH_ROYALE_SINGLEFLIGHT_LOCK_DIR = config("CLASH_ROYALE_SINGLEFLIGHT_LOCK_DIR", default="")
+CLASH_ROYALE_SINGLEFLIGHT_LOCK_TIMEOUT = config("CLASH_ROYALE_SINGLEFLIGHT_LOCK_TIMEOUT", default=15.0, cast=float)
+
+# Token-bucket rate limiting of upstream calls, shared by every process on the
+# host through a small SQLite file. Each API token gets its own bucket of
+# CLASH_ROYALE_RATE_LIMIT requests/second with bursts up to
+# CLASH_ROYALE_RATE_LIMIT_BURST; set the rate to 0 to disable limiting.
+# CLASH_ROYALE_API_TOKENS optionally lists several comma-separated tokens to
+# rotate between (defaults to CLASH_ROYALE_API_TOKEN alone).
+CLASH_ROYALE_API_TOKENS = config("CLASH_ROYALE_API_TOKENS", default="", cast=Csv()) or [CLASH_ROYALE_API_TOKEN]
+CLASH_ROYALE_RATE_LIMIT = config("CLASH_ROYALE_RATE_LIMIT", default=10.0, cast=float)
+CLASH_ROYALE_RATE_LIMIT_BURST = config("CLASH_ROYALE_RATE_LIMIT_BURST", default=20, cast=int)
+CLASH_ROYALE_RATE_LIMIT_DB = config("CLASH_ROYALE_RATE_LIMIT_DB", default=str(BASE_DIR / "ratelimit.sqlite3"))
+# Longest a blocking caller waits for a token before failing with a retry hint
+CLASH_ROYALE_RATE_LIMIT_MAX_WAIT = config("CLASH_ROYALE_RATE_LIMIT_MAX_WAIT", default=10.0, cast=float)
+
+# Background sync queue: pages are served from the database and a refresh is
+# enqueued once a player's (or the challenge list's) data is older than these
+# many seconds. Failed jobs are retried with exponential backoff.
+CLASH_ROYALE_PLAYER_STALE_AFTER = config("CLASH_ROYALE_PLAYER_STALE_AFTER", default=300, cast=int)
+CLASH_ROYALE_CHALLENGES_STALE_AFTER = config("CLASH_ROYALE_CHALLENGES_STALE_AFTER", default=3600, cast=int)
+CLASH_ROYALE_SYNC_MAX_ATTEMPTS = config("CLASH_ROYALE_SYNC_MAX_ATTEMPTS", default=5, cast=int)
+CLASH_ROYALE_SYNC_RETRY_DELAY = config("CLASH_ROYALE_SYNC_RETRY_DELAY", default=30, cast=int)
+# Running jobs whose worker has not finished them within this many seconds are re-queued
+CLASH_ROYALE_SYNC_LOCK_TIMEOUT = config("CLASH_ROYALE_SYNC_LOCK_TIMEOUT", default=600, cast=int)
+
+# Memoised proofs, keyed by the player's data version (bumped by ingestion)
+# and, for challenge proofs, the challenge catalogue version.
+# The in-process LRU holds up to CLASH_ROYALE_PROOF_CACHE_SIZE proofs; with
+# CLASH_ROYALE_PROOF_CACHE_PERSIST the latest proofs are also stored in the
+# ProofRecord table and shared between processes.
+CLASH_ROYALE_PROOF_CACHE_SIZE = config("CLASH_ROYALE_PROOF_CACHE_SIZE", default=10000, cast=int)
+CLASH_ROYALE_PROOF_CACHE_PERSIST = config("CLASH_ROYALE_PROOF_CACHE_PERSIST", default=False, cast=bool)
+
+# Bulk proof verification (/verify/bulk/ and the verify_proofs command):
+# processes in the hashing pool (1 verifies inline), JSON lines per chunk and
+# how many already-verified items are remembered.
+CLASH_ROYALE_VERIFY_WORKERS = config("CLASH_ROYALE_VERIFY_WORKERS", default=2, cast=int)
+CLASH_ROYALE_VERIFY_CHUNK_SIZE = config("CLASH_ROYALE_VERIFY_CHUNK_SIZE", default=2000, cast=int)
+CLASH_ROYALE_VERIFY_CACHE_SIZE = config("CLASH_ROYALE_VERIFY_CACHE_SIZE", default=100000, cast=int)
+
+# Signed proof attestations: hex private key of the server signer (signing is
+# unavailable while empty) and how many recovered batch signatures are cached.
+CLASH_ROYALE_ATTESTATION_KEY = config("CLASH_ROYALE_ATTESTATION_KEY", default="")
+CLASH_ROYALE_ATTESTATION_CACHE_SIZE = config("CLASH_ROYALE_ATTESTATION_CACHE_SIZE", default=10000, cast=int)
+
+# Per-request query accounting (clashroyale.middleware.QueryBudgetMiddleware):
+# requests running more than this many queries are logged as warnings (0
+# disables the warning). The X-DB-Queries response header is sent with DEBUG.
+CLASH_ROYALE_QUERY_WARN_THRESHOLD = config("CLASH_ROYALE_QUERY_WARN_THRESHOLD", default=25, cast=int)
+
+# Stage timing: spans around upstream calls, ingestion, proof generation and
+# rendering, reported per request in a Server-Timing header and aggregated into
+# histograms served (per process) at /metrics in the Prometheus text format.
+CLASH_ROYALE_METRICS_ENABLED = config("CLASH_ROYALE_METRICS_ENABLED", default=True, cast=bool)
+
+# In-process trophy leaderboard: snapshot file that spares a full Player scan
+# when a process starts (empty disables it), how often (seconds) a process
+# picks up players synced by other processes, how often it re-reads the whole
+# Player table to drop players deleted elsewhere, and how often the sync worker
+# rewrites the snapshot (0 = only when a process starts).
+CLASH_ROYALE_LEADERBOARD_SNAPSHOT = config(
+    "CLASH_ROYALE_LEADERBOARD_SNAPSHOT", default=str(BASE_DIR / "leaderboard.snapshot.json.gz")
+)
+CLASH_ROYALE_LEADERBOARD_REFRESH_INTERVAL = config("CLASH_ROYALE_LEADERBOARD_REFRESH_INTERVAL", default=30, cast=int)
+CLASH_ROYALE_LEADERBOARD_RECONCILE_INTERVAL = config(
+    "CLASH_ROYALE_LEADERBOARD_RECONCILE_INTERVAL", default=3600, cast=int
+)
+CLASH_ROYALE_LEADERBOARD_SNAPSHOT_INTERVAL = config(
+    "CLASH_ROYALE_LEADERBOARD_SNAPSHOT_INTERVAL", default=900, cast=int
+)
+
+# Trophy history: raw samples are rolled up into hourly and daily min/max/last
+# buckets every CLASH_ROYALE_TROPHY_ROLLUP_INTERVAL seconds by the sync worker.
+# Retentions are in days (0 keeps forever); raw samples must outlive a day so
+# the current day's bucket can always be recomputed from them.
+CLASH_ROYALE_TROPHY_ROLLUP_INTERVAL = config("CLASH_ROYALE_TROPHY_ROLLUP_INTERVAL", default=300, cast=int)
+CLASH_ROYALE_TROPHY_SAMPLE_RETENTION = config("CLASH_ROYALE_TROPHY_SAMPLE_RETENTION", default=14, cast=int)
+CLASH_ROYALE_TROPHY_HOURLY_RETENTION = config("CLASH_ROYALE_TROPHY_HOURLY_RETENTION", default=30, cast=int)
+CLASH_ROYALE_TROPHY_DAILY_RETENTION = config("CLASH_ROYALE_TROPHY_DAILY_RETENTION", default=0, cast=int)
+
+# Cold battle archive: the archive_battles command moves battles of whole
+# months older than CLASH_ROYALE_ARCHIVE_AFTER_DAYS out of BattleLog into
+# per-month NumPy column files under CLASH_ROYALE_ARCHIVE_DIR (0 disables it).
+CLASH_ROYALE_ARCHIVE_DIR = config("CLASH_ROYALE_ARCHIVE_DIR", default=str(BASE_DIR / "battle_archive"))
+CLASH_ROYALE_ARCHIVE_AFTER_DAYS = config("CLASH_ROYALE_ARCHIVE_AFTER_DAYS", default=180, cast=int)